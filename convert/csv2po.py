@@ -178,7 +178,7 @@ def convertcsv(inputfile, outputfile, templatefile, charset=None, columnorder=No
     outputstore = convertor.convertstore(inputstore)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
@@ -55,7 +55,7 @@ def convertcsv(inputfile, outputfile, templatefile, charset=None, columnorder=No
     outputstore = convertor.convertfile(inputstore)
     if len(outputstore.units) == 0:
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main():
@@ -298,7 +298,7 @@ def convertdtd(inputfile, outputfile, templatefile, pot=False, duplicatestyle="m
         outputstore = convertor.mergestore(templatestore, inputstore)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
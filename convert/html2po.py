@@ -50,7 +50,7 @@ def converthtml(inputfile, outputfile, templates, includeuntagged=False, pot=Fal
     outputfilepos = outputfile.tell()
     includeheader = outputfilepos == 0
     outputstore = convertor.convertfile(inputfile, getattr(inputfile, "name", "unknown"), includeheader, includeuntagged, duplicatestyle=duplicatestyle, keepcomments=keepcomments)
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
@@ -128,7 +128,7 @@ def convertoo(inputfile, outputfile, templates, pot=False, sourcelanguage=None,
     outputstore = convertor.convertstore(inputstore, duplicatestyle)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
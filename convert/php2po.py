@@ -91,7 +91,7 @@ def convertphp(inputfile, outputfile, templatefile, pot=False, duplicatestyle="m
         outputstore = convertor.mergestore(templatestore, inputstore, blankmsgstr=pot, duplicatestyle=duplicatestyle)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
@@ -158,7 +158,7 @@ def convertdtd(inputfile, outputfile, templatefile, includefuzzy=False):
         templatestore = dtd.dtdfile(templatefile)
         convertor = redtd(templatestore)
     outputstore = convertor.convertstore(inputstore, includefuzzy)
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
@@ -61,7 +61,7 @@ def convertpo(inputfile, outputfile, template=None):
         return False
     convertor = po2tiki()
     outputstore = convertor.convertstore(inputstore)
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return True
 
 def main(argv=None):
@@ -95,7 +95,7 @@ class TmxOptionParser(convert.ArchiveConvertOptionParser):
         super(TmxOptionParser, self).recursiveprocess(options)
         self.output = open(options.output, 'w')
         options.outputarchive.tmxfile.setsourcelanguage(options.sourcelanguage)
-        self.output.write(str(options.outputarchive.tmxfile))
+        options.outputarchive.tmxfile.serialize(self.output)
 
 def main(argv=None):
     formats = {"po": ("tmx", convertpo), ("po", "tmx"): ("tmx", convertpo)}
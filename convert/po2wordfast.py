@@ -82,7 +82,7 @@ class WfOptionParser(convert.ArchiveConvertOptionParser):
         super(WfOptionParser, self).recursiveprocess(options)
         self.output = open(options.output, 'w')
         #options.outputarchive.wffile.setsourcelanguage(options.sourcelanguage)
-        self.output.write(str(options.outputarchive.wffile))
+        options.outputarchive.wffile.serialize(self.output)
 
 def main(argv=None):
     formats = {"po": ("txt", convertpo), ("po", "txt"): ("txt", convertpo)}
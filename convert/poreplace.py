@@ -45,7 +45,7 @@ class poreplace:
         outputstore = self.convertfile(inputstore)
         if outputstore.isempty():
             return 0
-        outputfile.write(str(outputstore))
+        outputstore.serialize(outputfile)
         return 1
 
 def main(converterclass, argv=None):
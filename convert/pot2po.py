@@ -32,18 +32,18 @@ from translate.tools import pretranslate
 from translate.storage import poheader
 
 
-def convertpot(input_file, output_file, template_file, tm=None, min_similarity=75, fuzzymatching=True, classes=factory.classes, **kwargs):
+def convertpot(input_file, output_file, template_file, tm=None, min_similarity=75, fuzzymatching=True, classes=factory.classes, jobs=1, tmsnapshot=None, **kwargs):
     """Main conversion function"""
 
     input_store = factory.getobject(input_file, classes=classes)
     template_store = None
     if template_file is not None:
         template_store = factory.getobject(template_file, classes=classes)
-    output_store = convert_stores(input_store, template_store, tm, min_similarity, fuzzymatching, **kwargs)
-    output_file.write(str(output_store))
+    output_store = convert_stores(input_store, template_store, tm, min_similarity, fuzzymatching, jobs=jobs, tmsnapshot=tmsnapshot, **kwargs)
+    output_store.serialize(output_file)
     return 1
 
-def convert_stores(input_store, template_store, tm=None, min_similarity=75, fuzzymatching=True, **kwargs):
+def convert_stores(input_store, template_store, tm=None, min_similarity=75, fuzzymatching=True, jobs=1, tmsnapshot=None, useindex=False, **kwargs):
     """Actual conversion function, works on stores not files, returns
     a properly initialized pretranslated output store, with structure
     based on input_store, metadata based on template_store, migrates
@@ -56,23 +56,27 @@ def convert_stores(input_store, template_store, tm=None, min_similarity=75, fuzz
     _prepare_merge(input_store, output_store, template_store)
     if fuzzymatching:
         if template_store:
-            matcher = match.matcher(template_store, max_candidates=1, min_similarity=min_similarity, max_length=3000, usefuzzy=True)
+            matcher = match.matcher(template_store, max_candidates=1, min_similarity=min_similarity, max_length=3000, usefuzzy=True, useindex=useindex)
             matcher.addpercentage = False
             matchers.append(matcher)
         if tm:
-            matcher = pretranslate.memory(tm, max_candidates=1, min_similarity=min_similarity, max_length=1000)
+            matcher = pretranslate.memory(tm, max_candidates=1, min_similarity=min_similarity, max_length=1000, tmsnapshot=tmsnapshot, useindex=useindex)
             matcher.addpercentage = False
             matchers.append(matcher)
 
     #initialize store
     _store_pre_merge(input_store, output_store, template_store)
 
+    fuzzymatches = None
+    if matchers and jobs > 1:
+        fuzzymatches = pretranslate.match_fuzzy_batch(input_store.units, template_store, matchers, jobs)
+
     # Do matching
     for input_unit in input_store.units:
         if input_unit.isheader():
             continue
         if input_unit.istranslatable():
-            input_unit = pretranslate.pretranslate_unit(input_unit, template_store, matchers, mark_reused=True)
+            input_unit = pretranslate.pretranslate_unit(input_unit, template_store, matchers, mark_reused=True, fuzzymatches=fuzzymatches)
             _unit_post_merge(input_unit, input_store, output_store, template_store)
         output_store.addunit(input_unit)
 
@@ -247,6 +251,11 @@ def main(argv=None):
     parser.add_option("", "--tm", dest="tm", default=None,
         help="The file to use as translation memory when fuzzy matching")
     parser.passthrough.append("tm")
+    parser.add_option("", "--tmsnapshot", dest="tmsnapshot", default=None,
+        help="A file for keeping a snapshot of the translation memory, so that it loads faster next time")
+    parser.passthrough.append("tmsnapshot")
+    parser.add_option("", "--storecache", action="callback", callback=pretranslate.usecache_option,
+        help="Keep the parsed translation memory files in memory for reuse while they don't change")
     defaultsimilarity = 75
     parser.add_option("-s", "--similarity", dest="min_similarity", default=defaultsimilarity,
         type="float", help="The minimum similarity for inclusion (default: %d%%)" % defaultsimilarity)
@@ -254,6 +263,12 @@ def main(argv=None):
     parser.add_option("--nofuzzymatching", dest="fuzzymatching", action="store_false", 
         default=True, help="Disable fuzzy matching")
     parser.passthrough.append("fuzzymatching")
+    parser.add_option("", "--qgramindex", dest="useindex", action="store_true",
+        default=False, help="Use an index to skip candidates that can't match when fuzzy matching (faster for big translation memories)")
+    parser.passthrough.append("useindex")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1,
+        type="int", help="The number of processes to use for fuzzy matching (default: 1)")
+    parser.passthrough.append("jobs")
     parser.run(argv)
 
 
@@ -185,7 +185,7 @@ def convertprop(inputfile, outputfile, templatefile, personality="java",
                                            duplicatestyle=duplicatestyle)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 formats = {
@@ -87,7 +87,7 @@ def convertrc(input_file, output_file, template_file, pot=False, duplicatestyle=
         output_store = convertor.merge_store(template_store, input_store, blankmsgstr=pot, duplicatestyle=duplicatestyle)
     if output_store.isempty():
         return 0
-    output_file.write(str(output_store))
+    output_store.serialize(output_file)
     return 1
 
 def main(argv=None):
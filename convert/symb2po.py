@@ -94,7 +94,7 @@ def convert_symbian(input_file, output_file, template_file, pot=False, duplicate
     if output_store.isempty():
         return 0
     else:
-        output_file.write(str(output_store))
+        output_store.serialize(output_file)
         return 1
 
 def main(argv=None):
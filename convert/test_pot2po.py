@@ -603,7 +603,11 @@ class TestPOT2POCommand(test_convert.TestConvertCommand, TestPOT2PO):
         options = test_convert.TestConvertCommand.test_help(self)
         options = self.help_check(options, "-t TEMPLATE, --template=TEMPLATE")
         options = self.help_check(options, "-P, --pot")
+        options = self.help_check(options, "--tmsnapshot=TMSNAPSHOT")
         options = self.help_check(options, "--tm")
+        options = self.help_check(options, "--storecache")
         options = self.help_check(options, "-s MIN_SIMILARITY, --similarity=MIN_SIMILARITY")
-        options = self.help_check(options, "--nofuzzymatching", last=True)
+        options = self.help_check(options, "--nofuzzymatching")
+        options = self.help_check(options, "--qgramindex")
+        options = self.help_check(options, "-j JOBS, --jobs=JOBS", last=True)
 
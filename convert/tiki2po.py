@@ -68,7 +68,7 @@ def converttiki(inputfile, outputfile, template=None, includeunused=False):
     outputstore = convertor.convertstore(inputstore)
     if outputstore.isempty():
         return False
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return True
 
 def main(argv=None):
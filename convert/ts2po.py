@@ -75,7 +75,7 @@ def convertts(inputfile, outputfile, templates, duplicatestyle="msgctxt"):
     outputstore = convertor.convertfile(inputfile)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
@@ -52,7 +52,7 @@ def converttxt(inputfile, outputfile, templates, duplicatestyle="msgctxt", encod
     outputstore = convertor.convertstore(inputstore)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
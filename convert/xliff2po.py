@@ -92,7 +92,7 @@ def convertxliff(inputfile, outputfile, templates):
     outputstore = convertor.convertstore(inputfile)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main(argv=None):
@@ -36,6 +36,7 @@ from translate.filters import prefilters
 from translate.filters import spelling
 from translate.lang import factory
 from translate.lang import data
+from translate.misc.lru import LRUCache
 # The import of xliff could fail if the user doesn't have lxml installed. For
 # now we try to continue gracefully to help users who aren't interested in
 # support for XLIFF or other XML formats.
@@ -69,6 +70,10 @@ tag_re = re.compile("<[^>]+>")
 
 gconf_attribute_re = re.compile('"[a-z_]+?"')
 
+# the number of source strings for which a checker remembers the results of
+# its helpers
+SOURCE_CACHE_SIZE = 10000
+
 
 def tagname(string):
     """Returns the name of the XML/HTML tag in string"""
@@ -231,17 +236,56 @@ class CheckerConfig(object):
         self.lang = factory.getlanguage(langcode)
 
 
-def cache_results(f):
+class StringScan(object):
+    """What the whitespace, punctuation, bracket and tag tests compare about a
+    string, found in one pass over it (see L{UnitChecker.scanstring})."""
+    __slots__ = ["startspace", "endspace", "doublespaces", "tags", "hasspace", "last", "tokens"]
+
+    def __init__(self, str1, scanpattern):
+        self.startspace = str1[:len(str1) - len(str1.lstrip())]
+        self.endspace = str1[len(str1.rstrip()):]
+        self.doublespaces = str1.count(u"  ")
+        self.tags = tag_re.findall(str1)
+        # punctuation is compared with non-breaking spaces as spaces
+        str1 = str1.replace(u"\u00a0", u" ")
+        self.hasspace = u" " in str1
+        self.last = str1[-1:]
+        # every punctuation character and bracket, followed by a space if
+        # there is one, sorted so that strings with the same punctuation have
+        # equal lists
+        self.tokens = scanpattern.findall(str1)
+        self.tokens.sort()
+
+
+brackets = (u"[", u"]", u"{", u"}", u"(", u")")
+
+def cache_results(f, perlanguage=False):
+    """Caches the results of a helper for the current unit. The results for
+    the source string, and for the strings that helpers derived from it, are
+    kept with the source string in the source cache of the checker (see
+    L{TranslationChecker.run_filters}), since the same source strings are
+    checked again for every language. Results that depend on the target
+    language are only reused for the same language."""
 
     def cached_f(self, param1):
-        key = (f.__name__, param1)
+        if perlanguage:
+            key = (f.__name__, self.config.lang.code, param1)
+        else:
+            key = (f.__name__, param1)
+        sourceresults = self.sourceresults
+        if key in sourceresults:
+            return sourceresults[key]
         res_cache = self.results_cache
         if key in res_cache:
             return res_cache[key]
+        value = f(self, param1)
+        if param1 in self.sourcestrings:
+            sourceresults[key] = value
+            if isinstance(value, unicode):
+                self.sourcestrings.add(value)
         else:
-            value = f(self, param1)
             res_cache[key] = value
-            return value
+        return value
     return cached_f
 
 
@@ -265,6 +309,8 @@ class UnitChecker(object):
                 self.helperfunctions[functionname] = function
         self.defaultfilters = self.getfilters(excludefilters, limitfilters)
         self.results_cache = {}
+        self._plan = None
+        self._plankey = None
 
     def getfilters(self, excludefilters=None, limitfilters=None):
         """returns dictionary of available filters, including/excluding those in
@@ -291,12 +337,18 @@ class UnitChecker(object):
     def setconfig(self, config):
         """sets the accelerator list"""
         self.config = config
+        # the results of helpers for the source strings that were checked,
+        # which depend on the configuration, see cache_results()
+        self.source_cache = LRUCache(SOURCE_CACHE_SIZE)
+        self.sourceresults = {}
+        self.sourcestrings = set()
         self.accfilters = [prefilters.filteraccelerators(accelmarker) for accelmarker in self.config.accelmarkers]
         self.varfilters = [prefilters.filtervariables(startmatch, endmatch, prefilters.varname)
                 for startmatch, endmatch in self.config.varmatches]
         self.removevarfilter = [prefilters.filtervariables(startmatch, endmatch,
                                                            prefilters.varnone)
                 for startmatch, endmatch in self.config.varmatches]
+        self.scanpattern = None
 
     def setsuggestionstore(self, store):
         """Sets the filename that a checker should use for evaluating
@@ -335,21 +387,90 @@ class UnitChecker(object):
         return tag_re.sub("", str1)
     filterxml = cache_results(filterxml)
 
+    def punctranslate(self, str1):
+        """changes the punctuation in str1 to that of the target language"""
+        return self.config.lang.punctranslate(str1)
+    punctranslate = cache_results(punctranslate, perlanguage=True)
+
+    def getprintfvariables(self, str1):
+        """returns the matches of printf variables in str1"""
+        return list(printf_pat.finditer(str1))
+    getprintfvariables = cache_results(getprintfvariables)
+
+    def getvariables(self, str1):
+        """returns the variables in str1 for each of the configured variable
+        markers"""
+        return [decoration.getvariables(startmarker, endmarker)(str1)
+                for startmarker, endmarker in self.config.varmatches]
+    getvariables = cache_results(getvariables)
+
+    def countsourceaccelerators(self, str1):
+        """returns the number of valid and invalid accelerators in the source
+        string str1 for each of the configured accelerator markers"""
+        return [decoration.countaccelerators(accelmarker, self.config.sourcelang.validaccel)(str1)
+                for accelmarker in self.config.accelmarkers]
+    countsourceaccelerators = cache_results(countsourceaccelerators)
+
+    def countsourcesentences(self, str1):
+        """returns the number of sentences in the source string str1"""
+        return len(self.config.sourcelang.sentences(str1))
+    countsourcesentences = cache_results(countsourcesentences)
+
+    def scanstring(self, str1):
+        """returns the L{StringScan} of str1, which the whitespace,
+        punctuation, bracket and tag tests share"""
+        if self.scanpattern is None or self.scanpunctuation != self.config.punctuation:
+            # the punctuation can be changed after the configuration is set
+            self.scanpunctuation = self.config.punctuation
+            scanchars = set(self.scanpunctuation).union(brackets)
+            self.scanpattern = re.compile(u"[%s] ?" % u"".join([re.escape(char) for char in scanchars]))
+        return StringScan(str1, self.scanpattern)
+    scanstring = cache_results(scanstring)
+
+    def getnumbers(self, str1):
+        """returns the numbers in str1"""
+        return decoration.getnumbers(str1)
+    getnumbers = cache_results(getnumbers)
+
+    def getfunctions(self, str1):
+        """returns the functions in str1"""
+        return decoration.getfunctions(str1, self.config.punctuation)
+    getfunctions = cache_results(getfunctions)
+
+    def getemails(self, str1):
+        """returns the email addresses in str1"""
+        return decoration.getemails(str1)
+    getemails = cache_results(getemails)
+
+    def geturls(self, str1):
+        """returns the URLs in str1"""
+        return decoration.geturls(str1)
+    geturls = cache_results(geturls)
+
+    def cachestats(self):
+        """Returns the statistics of the source cache (the number of source
+        strings that were checked before), see L{LRUCache.stats}."""
+        return self.source_cache.stats()
+
     def run_test(self, test, unit):
         """Runs the given test on the given unit.
 
         Note that this can raise a FilterFailure as part of normal operation"""
         return test(unit)
 
-    def run_filters(self, unit):
-        """run all the tests in this suite, return failures as testname,
-        message_or_exception"""
-        self.results_cache = {}
-        failures = {}
-        ignores = self.config.lang.ignoretests[:]
+    def compileplan(self):
+        """Returns the tests to run, in the order to run them, as
+        (functionname, filterfunction, message, isfilter, dependents) tuples.
+
+        The preconditions come first, and dependents lists the tests to skip
+        when a precondition fails. Tests that the target language ignores
+        are left out, and isfilter is False for preconditions that aren't
+        filters themselves (their failures aren't reported)."""
+        ignores = self.config.lang.ignoretests
         functionnames = self.defaultfilters.keys()
         priorityfunctionnames = self.preconditions.keys()
-        otherfunctionnames = filter(lambda functionname: functionname not in self.preconditions, functionnames)
+        otherfunctionnames = [functionname for functionname in functionnames if functionname not in self.preconditions]
+        plan = []
         for functionname in priorityfunctionnames + otherfunctionnames:
             if functionname in ignores:
                 continue
@@ -358,9 +479,38 @@ class UnitChecker(object):
             # using TeeChecker
             if filterfunction is None:
                 continue
-            filtermessage = filterfunction.__doc__
+            plan.append((functionname, filterfunction, filterfunction.__doc__,
+                         functionname in self.defaultfilters,
+                         tuple(self.preconditions.get(functionname, ()))))
+        return plan
+
+    def getplan(self):
+        """Returns the plan of L{compileplan} for the current filters and
+        target language, which is only compiled again when they change."""
+        lang = self.config.lang
+        key = (lang, tuple(lang.ignoretests), id(self.defaultfilters), id(self.preconditions))
+        if key != self._plankey:
+            self._plan = self.compileplan()
+            self._plankey = key
+        return self._plan
+
+    def prepare(self, units):
+        """Called with the units that are about to be checked, so that tests
+        can do some of their work for all of them at once."""
+        pass
+
+    def run_filters(self, unit):
+        """run all the tests in this suite, return failures as testname,
+        message_or_exception"""
+        self.results_cache = {}
+        failures = {}
+        skipped = set()
+        run_test = self.run_test
+        for functionname, filterfunction, filtermessage, isfilter, dependents in self.getplan():
+            if functionname in skipped:
+                continue
             try:
-                filterresult = self.run_test(filterfunction, unit)
+                filterresult = run_test(filterfunction, unit)
             except FilterFailure, e:
                 filterresult = False
                 filtermessage = e.args[0]
@@ -374,11 +524,9 @@ class UnitChecker(object):
             if not filterresult:
                 # we test some preconditions that aren't actually a cause for
                 # failure
-                if functionname in self.defaultfilters:
+                if isfilter:
                     failures[functionname] = filtermessage
-                if functionname in self.preconditions:
-                    for ignoredfunctionname in self.preconditions[functionname]:
-                        ignores.append(ignoredfunctionname)
+                skipped.update(dependents)
         self.results_cache = {}
         return failures
 
@@ -418,8 +566,13 @@ class TranslationChecker(UnitChecker):
     def run_filters(self, unit):
         """Do some optimisation by caching some data of the unit for the benefit
         of run_test()."""
-        self.str1 = data.normalized_unicode(unit.source) or u""
-        self.str2 = data.normalized_unicode(unit.target) or u""
+        # plain unicode strings, since multistrings are slow dictionary keys
+        self.str1 = unicode(data.normalized_unicode(unit.source) or u"")
+        self.str2 = unicode(data.normalized_unicode(unit.target) or u"")
+        cached = self.source_cache.get(self.str1)
+        if cached is None:
+            cached = self.source_cache[self.str1] = ({}, set([self.str1]))
+        self.sourceresults, self.sourcestrings = cached
         self.hasplural = unit.hasplural()
         self.locations = unit.getlocations()
         return super(TranslationChecker, self).run_filters(unit)
@@ -464,6 +617,11 @@ class TeeChecker:
                     print >> sys.stderr, "warning: could not find filter %s" % filtername
         return self.combinedfilters
 
+    def prepare(self, units):
+        """Lets all the checkers prepare for checking the units."""
+        for checker in self.checkers:
+            checker.prepare(units)
+
     def run_filters(self, unit):
         """run all the tests in the checker's suites"""
         failures = {}
@@ -481,6 +639,30 @@ class TeeChecker:
 class StandardChecker(TranslationChecker):
     """The basic test suite for source -> target translations."""
 
+    def prepare(self, units):
+        """Spell checks all the words of the units at once, so that
+        spellcheck() finds every distinct word already looked up."""
+        if not self.config.targetlanguage or not spelling.available:
+            return
+        if "spellcheck" not in [entry[0] for entry in self.getplan()]:
+            return
+        # filtered like in spellcheck(), but without touching the caches of
+        # the current unit
+        sources = []
+        targets = []
+        for unit in units:
+            sources.append(data.normalized_unicode(unit.source) or u"")
+            if unit.hasplural():
+                targets.extend([unicode(target) for target in unit.target.strings])
+            else:
+                targets.append(data.normalized_unicode(unit.target) or u"")
+        sources = [helpers.multifilter(helpers.multifilter(source, self.varfilters), self.accfilters,
+                                       self.config.sourcelang.validaccel) for source in sources]
+        targets = [helpers.multifilter(helpers.multifilter(target, self.varfilters), self.accfilters,
+                                       self.config.lang.validaccel) for target in targets]
+        spelling.checkmany(sources, "en")
+        spelling.checkmany(targets, self.config.targetlanguage)
+
     def untranslated(self, str1, str2):
         """checks whether a string has been translated at all"""
         str2 = prefilters.removekdecomments(str2)
@@ -557,7 +739,7 @@ class StandardChecker(TranslationChecker):
     def singlequoting(self, str1, str2):
         """checks whether singlequoting is consistent between the two strings"""
         str1 = self.filterwordswithpunctuation(self.filteraccelerators(self.filtervariables(str1)))
-        str1 = self.config.lang.punctranslate(str1)
+        str1 = self.punctranslate(str1)
         str2 = self.filterwordswithpunctuation(self.filteraccelerators(self.filtervariables(str2)))
         return helpers.countsmatch(str1, str2, (u"'", u"''", u"\\'"))
 
@@ -565,7 +747,7 @@ class StandardChecker(TranslationChecker):
         """checks whether doublequoting is consistent between the two strings"""
         str1 = self.filteraccelerators(self.filtervariables(str1))
         str1 = self.filterxml(str1)
-        str1 = self.config.lang.punctranslate(str1)
+        str1 = self.punctranslate(str1)
         str2 = self.filteraccelerators(self.filtervariables(str2))
         str2 = self.filterxml(str2)
         return helpers.countsmatch(str1, str2, (u'"', u'""', u'\\"', u"«",
@@ -575,29 +757,31 @@ class StandardChecker(TranslationChecker):
         """checks for bad double-spaces by comparing to original"""
         str1 = self.filteraccelerators(str1)
         str2 = self.filteraccelerators(str2)
-        return helpers.countmatch(str1, str2, u"  ")
+        return self.scanstring(str1).doublespaces == self.scanstring(str2).doublespaces
 
     def puncspacing(self, str1, str2):
         """checks for bad spacing after punctuation"""
         # Convert all nbsp to space, and just check spaces. Useful intermediate
         # step to stricter nbsp checking?
         str1 = self.filteraccelerators(self.filtervariables(str1))
-        str1 = self.config.lang.punctranslate(str1)
-        str1 = str1.replace(u"\u00a0", u" ")
-        if str1.find(u" ") == -1:
+        scan1 = self.scanstring(self.punctranslate(str1))
+        if not scan1.hasspace:
             return True
-        str2 = self.filteraccelerators(self.filtervariables(str2))
-        str2 = str2.replace(u"\u00a0", u" ")
-        for puncchar in self.config.punctuation:
-            plaincount1 = str1.count(puncchar)
-            plaincount2 = str2.count(puncchar)
-            if not plaincount1 or plaincount1 != plaincount2:
+        scan2 = self.scanstring(self.filteraccelerators(self.filtervariables(str2)))
+        tokens1, tokens2 = scan1.tokens, scan2.tokens
+        if tokens1 == tokens2:
+            return True
+        punctuation = self.config.punctuation
+        for puncchar in set([token[0] for token in tokens1]):
+            if puncchar not in punctuation:
+                continue
+            spacecount1 = tokens1.count(puncchar + u" ")
+            spacecount2 = tokens2.count(puncchar + u" ")
+            if tokens1.count(puncchar) + spacecount1 != tokens2.count(puncchar) + spacecount2:
                 continue
-            spacecount1 = str1.count(puncchar + u" ")
-            spacecount2 = str2.count(puncchar + u" ")
             if spacecount1 != spacecount2:
                 # handle extra spaces that are because of transposed punctuation
-                if str1.endswith(puncchar) != str2.endswith(puncchar) and abs(spacecount1 - spacecount2) == 1:
+                if (scan1.last == puncchar) != (scan2.last == puncchar) and abs(spacecount1 - spacecount2) == 1:
                     continue
                 return False
         return True
@@ -612,14 +796,14 @@ class StandardChecker(TranslationChecker):
             count2 = var_num2 + 1
             str2key = match2.group('key')
             if match2.group('ord'):
-                for var_num1, match1 in enumerate(printf_pat.finditer(str1)):
+                for var_num1, match1 in enumerate(self.getprintfvariables(str1)):
                     count1 = var_num1 + 1
                     if int(match2.group('ord')) == var_num1 + 1:
                         if match2.group('fullvar') != match1.group('fullvar'):
                             return 0
             elif str2key:
                 str1key = None
-                for var_num1, match1 in enumerate(printf_pat.finditer(str1)):
+                for var_num1, match1 in enumerate(self.getprintfvariables(str1)):
                     count1 = var_num1 + 1
                     if match1.group('key') and str2key == match1.group('key'):
                         str1key = match1.group('key')
@@ -631,7 +815,7 @@ class StandardChecker(TranslationChecker):
                 if str1key == None:
                     return 0
             else:
-                for var_num1, match1 in enumerate(printf_pat.finditer(str1)):
+                for var_num1, match1 in enumerate(self.getprintfvariables(str1)):
                     count1 = var_num1 + 1
                     # '%.0s' "placeholder" in plural will match anything
                     if plural and match2.group('fullvar') == '.0s':
@@ -640,7 +824,7 @@ class StandardChecker(TranslationChecker):
                         return 0
 
         if count2 is None:
-            if list(printf_pat.finditer(str1)):
+            if self.getprintfvariables(str1):
                 return 0
 
         if (count1 or count2) and (count1 != count2):
@@ -652,10 +836,9 @@ class StandardChecker(TranslationChecker):
         str1 = self.filtervariables(str1)
         str2 = self.filtervariables(str2)
         messages = []
-        for accelmarker in self.config.accelmarkers:
-            counter1 = decoration.countaccelerators(accelmarker, self.config.sourcelang.validaccel)
+        sourcecounts = self.countsourceaccelerators(str1)
+        for accelmarker, (count1, countbad1) in zip(self.config.accelmarkers, sourcecounts):
             counter2 = decoration.countaccelerators(accelmarker, self.config.lang.validaccel)
-            count1, countbad1 = counter1(str1)
             count2, countbad2 = counter2(str2)
             getaccel = decoration.getaccelerators(accelmarker, self.config.lang.validaccel)
             accel2, bad2 = getaccel(str2)
@@ -699,8 +882,9 @@ class StandardChecker(TranslationChecker):
         messages = []
         mismatch1, mismatch2 = [], []
         varnames1, varnames2 = [], []
-        for startmarker, endmarker in self.config.varmatches:
-            varchecker = decoration.getvariables(startmarker, endmarker)
+        allvars1 = self.getvariables(str1)
+        allvars2 = self.getvariables(str2)
+        for (startmarker, endmarker), vars1, vars2 in zip(self.config.varmatches, allvars1, allvars2):
             if startmarker and endmarker:
                 if isinstance(endmarker, int):
                     redecorate = lambda var: startmarker + var
@@ -710,8 +894,6 @@ class StandardChecker(TranslationChecker):
                 redecorate = lambda var: startmarker + var
             else:
                 redecorate = lambda var: var
-            vars1 = varchecker(str1)
-            vars2 = varchecker(str2)
             if vars1 != vars2:
                 # we use counts to compare so we can handle multiple variables
                 vars1, vars2 = [var for var in vars1 if vars1.count(var) > vars2.count(var)], [var for var in vars2 if vars1.count(var) < vars2.count(var)]
@@ -736,41 +918,41 @@ class StandardChecker(TranslationChecker):
 
     def functions(self, str1, str2):
         """checks that function names are not translated"""
-        return helpers.funcmatch(str1, str2, decoration.getfunctions, self.config.punctuation)
+        return self.getfunctions(str1) == self.getfunctions(str2)
 
     def emails(self, str1, str2):
         """checks that emails are not translated"""
-        return helpers.funcmatch(str1, str2, decoration.getemails)
+        return self.getemails(str1) == self.getemails(str2)
 
     def urls(self, str1, str2):
         """checks that URLs are not translated"""
-        return helpers.funcmatch(str1, str2, decoration.geturls)
+        return self.geturls(str1) == self.geturls(str2)
 
     def numbers(self, str1, str2):
         """checks whether numbers of various forms are consistent between the
         two strings"""
-        return helpers.countsmatch(str1, str2, decoration.getnumbers(str1))
+        return helpers.countsmatch(str1, str2, self.getnumbers(str1))
 
     def startwhitespace(self, str1, str2):
         """checks whether whitespace at the beginning of the strings matches"""
-        return helpers.funcmatch(str1, str2, decoration.spacestart)
+        return self.scanstring(str1).startspace == self.scanstring(str2).startspace
 
     def endwhitespace(self, str1, str2):
         """checks whether whitespace at the end of the strings matches"""
-        str1 = self.config.lang.punctranslate(str1)
-        return helpers.funcmatch(str1, str2, decoration.spaceend)
+        str1 = self.punctranslate(str1)
+        return self.scanstring(str1).endspace == self.scanstring(str2).endspace
 
     def startpunc(self, str1, str2):
         """checks whether punctuation at the beginning of the strings match"""
         str1 = self.filterxml(self.filteraccelerators(self.filtervariables(self.filterwordswithpunctuation(str1))))
-        str1 = self.config.lang.punctranslate(str1)
+        str1 = self.punctranslate(str1)
         str2 = self.filterxml(self.filteraccelerators(self.filtervariables(self.filterwordswithpunctuation(str2))))
         return helpers.funcmatch(str1, str2, decoration.puncstart, self.config.punctuation)
 
     def endpunc(self, str1, str2):
         """checks whether punctuation at the end of the strings match"""
         str1 = self.filtervariables(str1)
-        str1 = self.config.lang.punctranslate(str1)
+        str1 = self.punctranslate(str1)
         str2 = self.filtervariables(str2)
         str1 = str1.rstrip()
         str2 = str2.rstrip()
@@ -786,14 +968,16 @@ class StandardChecker(TranslationChecker):
 
     def brackets(self, str1, str2):
         """checks that the number of brackets in both strings match"""
-        str1 = self.filtervariables(str1)
-        str2 = self.filtervariables(str2)
+        tokens1 = self.scanstring(self.filtervariables(str1)).tokens
+        tokens2 = self.scanstring(self.filtervariables(str2)).tokens
+        if tokens1 == tokens2:
+            return True
         messages = []
         missing = []
         extra = []
-        for bracket in (u"[", u"]", u"{", u"}", u"(", u")"):
-            count1 = str1.count(bracket)
-            count2 = str2.count(bracket)
+        for bracket in brackets:
+            count1 = tokens1.count(bracket) + tokens1.count(bracket + u" ")
+            count2 = tokens2.count(bracket) + tokens2.count(bracket + u" ")
             if count2 < count1:
                 missing.append(u"'%s'" % bracket)
             elif count2 > count1:
@@ -810,7 +994,7 @@ class StandardChecker(TranslationChecker):
         """checks that the number of sentences in both strings match"""
         str1 = self.filteraccelerators(str1)
         str2 = self.filteraccelerators(str2)
-        sentences1 = len(self.config.sourcelang.sentences(str1))
+        sentences1 = self.countsourcesentences(str1)
         sentences2 = len(self.config.lang.sentences(str2))
         if not sentences1 == sentences2:
             raise FilterFailure(u"The number of sentences differ: %d versus %d" % (sentences1, sentences2))
@@ -871,8 +1055,8 @@ class StandardChecker(TranslationChecker):
         """checks that acronyms that appear are unchanged"""
         acronyms = []
         allowed = []
-        for startmatch, endmatch in self.config.varmatches:
-            allowed += decoration.getvariables(startmatch, endmatch)(str1)
+        for variables in self.getvariables(str1):
+            allowed += variables
         allowed += self.config.musttranslatewords.keys()
         str1 = self.filteraccelerators(self.filtervariables(str1))
         iter = self.config.lang.word_iter(str1)
@@ -960,11 +1144,11 @@ class StandardChecker(TranslationChecker):
 
     def xmltags(self, str1, str2):
         """checks that XML/HTML tags have not been translated"""
-        tags1 = tag_re.findall(str1)
+        tags1 = self.scanstring(str1).tags
         if len(tags1) > 0:
             if (len(tags1[0]) == len(str1)) and not u"=" in tags1[0]:
                 return True
-            tags2 = tag_re.findall(str2)
+            tags2 = self.scanstring(str2).tags
             properties1 = tagproperties(tags1, self.config.ignoretags)
             properties2 = tagproperties(tags2, self.config.ignoretags)
             filtered1 = []
@@ -981,7 +1165,7 @@ class StandardChecker(TranslationChecker):
         else:
             # No tags in str1, let's just check that none were added in str2.
             # This might be useful for fuzzy strings wrongly unfuzzied.
-            tags2 = tag_re.findall(str2)
+            tags2 = self.scanstring(str2).tags
             if len(tags2) > 0:
                 return False
         return True
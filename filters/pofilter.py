@@ -32,9 +32,17 @@ from translate.storage import factory
 from translate.storage.poheader import poheader
 from translate.filters import checks
 from translate.filters import autocorrect
+from translate.filters import spelling
 from translate.misc import optrecurse
 
 import os
+import sys
+import itertools
+import optparse
+
+# the options that the check filters of worker processes use
+WORKER_OPTIONS = ["includefuzzy", "includereview", "autocorrect", "addnotes",
+                  "excludefilters", "limitfilters", "errorlevel", "checkcache"]
 
 def build_checkerconfig(options):
     """Prepare the checker config from the given options.  This is mainly
@@ -75,6 +83,8 @@ class pocheckfilter:
                 languagecode=checkerconfig.targetlanguage
         )
         self.options = options
+        # the number of units that failed each filter
+        self.failurecounts = {}
 
     def getfilterdocs(self):
         """lists the docs for filters available on checker..."""
@@ -83,15 +93,23 @@ class pocheckfilter:
         filterdocs.sort()
         return "\n".join(filterdocs)
 
-    def filterunit(self, unit):
-        """runs filters on an element"""
+    def shouldcheck(self, unit):
+        """returns whether the unit should be checked at all"""
         if unit.isheader():
-            return []
+            return False
         if not self.options.includefuzzy and unit.isfuzzy():
-            return []
+            return False
         if not self.options.includereview and unit.isreview():
-            return []
-        failures = self.checker.run_filters(unit)
+            return False
+        return True
+
+    def filterunit(self, unit, failures=None):
+        """runs filters on an element, unless the failures of the checker are
+        given"""
+        if failures is None:
+            if not self.shouldcheck(unit):
+                return []
+            failures = self.checker.run_filters(unit)
         if failures and self.options.autocorrect:
             # we can't get away with bad unquoting / requoting if we're going to change the result...
             correction = autocorrect.correct(unit.source, unit.target)
@@ -112,11 +130,16 @@ class pocheckfilter:
         newtransfile = type(transfile)()
         newtransfile.setsourcelanguage(transfile.sourcelanguage)
         newtransfile.settargetlanguage(transfile.targetlanguage)
-        for unit in transfile.units:
-            filterresult = self.filterunit(unit)
+        if getattr(self.options, "checkcache", False):
+            filterresults = self.cachedfilterunits(transfile.units)
+        else:
+            self.checker.prepare([unit for unit in transfile.units if self.shouldcheck(unit)])
+            filterresults = itertools.imap(self.filterunit, transfile.units)
+        for unit, filterresult in itertools.izip(transfile.units, filterresults):
             if filterresult:
                 if filterresult != autocorrect:
                     for filtername, filtermessage in filterresult.iteritems():
+                        self.failurecounts[filtername] = self.failurecounts.get(filtername, 0) + 1
                         if self.options.addnotes:
                             unit.adderror(filtername, filtermessage)
                         if isinstance(filtermessage, checks.SeriousFilterFailure):
@@ -126,6 +149,22 @@ class pocheckfilter:
             newtransfile.updateheader(add=True, **transfile.parseheader())
         return newtransfile
 
+    def cachedfilterunits(self, units):
+        """Returns the results of filterunit() for each of the units, with
+        the failures of units that were checked with the same checker before
+        taken from the check results in the statistics cache."""
+        from translate.storage import statsdb
+        checkunits = [unit for unit in units if self.shouldcheck(unit)]
+        failures = dict(zip([id(unit) for unit in checkunits],
+                            statsdb.StatsCache().runchecks(self.checker, checkunits)))
+        filterresults = []
+        for unit in units:
+            if id(unit) in failures:
+                filterresults.append(self.filterunit(unit, failures[id(unit)]))
+            else:
+                filterresults.append([])
+        return filterresults
+
 class FilterOptionParser(optrecurse.RecursiveOptionParser):
     """a specialized Option Parser for filter tools..."""
     def __init__(self, formats):
@@ -157,16 +196,88 @@ class FilterOptionParser(optrecurse.RecursiveOptionParser):
         self.usepsyco(options)
         if options.listfilters:
             print options.checkfilter.getfilterdocs()
+        elif options.jobs > 1 and options.input and options.output:
+            self.parallelprocess(options, checkerclasses, checkerconfig)
         else:
             self.recursiveprocess(options)
 
+    def parallelprocess(self, options, checkerclasses, checkerconfig):
+        """Filters the files in options.jobs worker processes, which each
+        build their check filter once. The files are written and reported
+        in the same order as recursiveprocess() would, and the failures of
+        all the files are summarised at the end."""
+        files = list(self.recursefiles(options))
+        filteroptions = dict([(name, getattr(options, name)) for name in WORKER_OPTIONS])
+        import multiprocessing
+        pool = multiprocessing.Pool(options.jobs, _initworker, (filteroptions, checkerclasses, checkerconfig))
+        failurecounts = {}
+        try:
+            tasks = [(fileprocessor, fullinputpath, fulloutputpath, fulltemplatepath)
+                     for inputpath, fileprocessor, fullinputpath, fulloutputpath, fulltemplatepath in files]
+            # imap() rather than imap_unordered() keeps the reports in order
+            for (inputpath, fileprocessor, fullinputpath, fulloutputpath, fulltemplatepath), (success, counts, errorinfo) in \
+                    itertools.izip(files, pool.imap(_filterfile, tasks)):
+                if errorinfo is not None:
+                    msg = "Error processing: input %s, output %s, template %s" % (fullinputpath, fulloutputpath, fulltemplatepath)
+                    if errorinfo:
+                        msg += ": " + errorinfo
+                    self.warning(msg)
+                for filtername, count in counts.iteritems():
+                    failurecounts[filtername] = failurecounts.get(filtername, 0) + count
+                self.reportprogress(inputpath, success)
+        finally:
+            pool.close()
+            pool.join()
+        del self.progressbar
+        print >> sys.stderr, summarizefailures(failurecounts, len(files))
+
+def summarizefailures(failurecounts, filecount):
+    """Returns a summary of the number of units that failed each filter,
+    most frequent failures first."""
+    failures = [(-count, filtername) for filtername, count in failurecounts.iteritems()]
+    failures.sort()
+    lines = ["%d failures in %d files" % (sum(failurecounts.values()), filecount)]
+    lines.extend(["%8d  %s" % (-count, filtername) for count, filtername in failures])
+    return "\n".join(lines)
+
+# the parser and options of a worker process of FilterOptionParser.parallelprocess()
+_workerparser = None
+_workeroptions = None
+
+def _initworker(filteroptions, checkerclasses, checkerconfig):
+    """Builds the check filter of a worker process for
+    FilterOptionParser.parallelprocess()"""
+    global _workerparser, _workeroptions
+    _workerparser = cmdlineparser()
+    _workeroptions = optparse.Values(filteroptions)
+    _workeroptions.checkfilter = pocheckfilter(_workeroptions, checkerclasses, checkerconfig)
+    # workers don't run atexit functions, but they do run these when the
+    # pool is closed
+    import multiprocessing.util
+    multiprocessing.util.Finalize(None, spelling.savecaches, exitpriority=10)
+
+def _filterfile(task):
+    """Worker process function for FilterOptionParser.parallelprocess().
+    Returns whether the output file was written, the failure counts of the
+    file and the error info if filtering failed, or None."""
+    fileprocessor, fullinputpath, fulloutputpath, fulltemplatepath = task
+    checkfilter = _workeroptions.checkfilter
+    checkfilter.failurecounts = {}
+    try:
+        success = _workerparser.processfile(fileprocessor, _workeroptions, fullinputpath, fulloutputpath, fulltemplatepath)
+        errorinfo = None
+    except Exception:
+        success = False
+        errorinfo = _workerparser.formaterror(_workeroptions, sys.exc_info())
+    return success, checkfilter.failurecounts, errorinfo
+
 def runfilter(inputfile, outputfile, templatefile, checkfilter=None):
     """reads in inputfile, filters using checkfilter, writes to outputfile"""
     fromfile = factory.getobject(inputfile)
     tofile = checkfilter.filterfile(fromfile)
     if tofile.isempty():
         return 0
-    outputfile.write(str(tofile))
+    tofile.serialize(outputfile)
     return 1
 
 def cmdlineparser():
@@ -229,6 +340,11 @@ def cmdlineparser():
     parser.add_option("", "--validcharsfile", dest="validcharsfile",
         default=None, type="string", metavar="FILE",
         help="read list of all valid characters from FILE (must be in UTF-8)")
+    parser.add_option("", "--checkcache", dest="checkcache",
+        action="store_true", default=False,
+        help="reuse the results of units that were checked with the same options before (kept with the statistics of pocount)")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1,
+        type="int", help="the number of processes to filter files in (default: 1)")
     parser.passthrough.append('checkfilter')
     parser.description = __doc__
     return parser
@@ -19,36 +19,316 @@
 # along with translate; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-"""An API to provide spell checking for use in checks or elsewhere."""
+"""An API to provide spell checking for use in checks or elsewhere.
 
+Words are looked up in an enchant dictionary for the language, or in a
+L{WordListDictionary} given with L{setdictionary}. There is one shared
+L{SpellChecker} for each language, which remembers the words it looked up in
+a cache file in L{cachedir}, so every distinct word is only looked up once.
+"""
+
+import atexit
+import codecs
+import difflib
+import os
+import re
 import sys
+import threading
+
+from translate.misc import hash
 
 available = False
 
 try:
     # Enchant
-    from enchant import checker, DictNotFoundError, Error as EnchantError
+    import enchant
+    from enchant import Error as EnchantError
+    from enchant.tokenize import get_tokenizer, TokenizerNotFoundError
     available = True
-    checkers = {}
-    def check(text, lang):
-        if not lang in checkers:
+except ImportError:
+    enchant = None
+
+# the directory of the cache files of the spell checkers: None for the
+# default in the home directory of the user, "" to not keep cache files
+cachedir = None
+
+# the number of newly looked up words after which the cache file is written
+SAVE_EVERY = 1000
+
+# the directories where enchant and its providers keep the dictionaries and
+# the personal word lists: L{EnchantDictionary.describe} changes when one of
+# the files of the language in them changes
+enchantdirs = ["~/.config/enchant", "~/.enchant", "/usr/share/hunspell",
+               "/usr/share/myspell", "/usr/share/myspell/dicts", "/usr/lib/aspell"]
+
+wordre = re.compile(ur"\w+(?:['’-]\w+)*", re.UNICODE)
+
+
+class WordListDictionary(object):
+    """A dictionary that knows the words in a list, for languages without an
+    enchant dictionary (and for testing). Words are also correct in lower
+    case, and the suggestions for a word are the most similar words in the
+    list."""
+
+    def __init__(self, words):
+        self.words = set(words)
+        self.lowerwords = set([word.lower() for word in self.words])
+
+    def fromfile(cls, filename):
+        """Returns a dictionary of the words in a UTF-8 file with a word on
+        each line."""
+        wordfile = codecs.open(filename, "r", "utf-8")
+        try:
+            return cls([line.strip() for line in wordfile if line.strip()])
+        finally:
+            wordfile.close()
+    fromfile = classmethod(fromfile)
+
+    def describe(self):
+        """Returns a description that changes when the words change."""
+        words = u"\n".join(sorted(self.words)).encode("utf-8")
+        return "wordlist %s" % hash.md5_f(words).hexdigest()
+
+    def tokenize(self, text):
+        """Yields the words in text with their positions."""
+        for match in wordre.finditer(text):
+            yield match.group(), match.start()
+
+    def check(self, word):
+        return word in self.words or word.lower() in self.lowerwords
+
+    def suggest(self, word):
+        return difflib.get_close_matches(word, self.words, 5)
+
+
+class EnchantDictionary(object):
+    """An enchant dictionary, with the enchant tokenizer of the language."""
+
+    def __init__(self, lang):
+        self.dictionary = enchant.Dict(lang)
+        # some versions only report an error when checking something
+        self.dictionary.check(u'bla')
+        try:
+            self.tokenizer = get_tokenizer(lang)
+        except TokenizerNotFoundError:
+            self.tokenizer = get_tokenizer()
+
+    def describe(self):
+        """Returns a description that changes when the files of the
+        dictionary in L{enchantdirs}, or the provider, change."""
+        provider = getattr(self.dictionary, "provider", None)
+        tag = self.dictionary.tag
+        filenames = [getattr(provider, "file", None)]
+        for directory in enchantdirs:
+            for extension in (".dic", ".aff", ".exc", ".multi"):
+                filenames.append(os.path.join(os.path.expanduser(directory), tag + extension))
+        modified = ["%s %d" % (filename, os.path.getmtime(filename))
+                    for filename in filenames if filename and os.path.isfile(filename)]
+        return "enchant %s %s %s" % (getattr(provider, "name", ""), tag,
+                                     hash.md5_f("\n".join(modified)).hexdigest())
+
+    def tokenize(self, text):
+        """Yields the words in text with their positions."""
+        return self.tokenizer(text)
+
+    def check(self, word):
+        return self.dictionary.check(word)
+
+    def suggest(self, word):
+        return self.dictionary.suggest(word)
+
+
+class SpellChecker(object):
+    """Checks the spelling of text with a dictionary. The result of looking
+    up each word is remembered, and kept in the cache file if one is
+    given."""
+
+    def __init__(self, dictionary, cachefile=None):
+        """
+        @param dictionary: a L{WordListDictionary}, L{EnchantDictionary} or
+        anything else with the same methods
+        @param cachefile: the file with the results of earlier look ups
+        """
+        self.dictionary = dictionary
+        self.cachefile = cachefile
+        # maps words to None if they are correct, otherwise to suggestions
+        self.words = {}
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        if cachefile:
+            self.words.update(self.load())
+
+    def load(self):
+        """Returns the words in the cache file, if it was made with the same
+        dictionary."""
+        words = {}
+        if not os.path.exists(self.cachefile):
+            return words
+        cachefile = codecs.open(self.cachefile, "r", "utf-8")
+        try:
+            if cachefile.readline().rstrip("\n") != u"# " + self.dictionary.describe():
+                return words
+            for line in cachefile:
+                line = line.rstrip("\n")
+                if line.startswith(u"+"):
+                    words[line[1:]] = None
+                elif line.startswith(u"-"):
+                    parts = line[1:].split(u"\t")
+                    words[parts[0]] = parts[1:]
+        finally:
+            cachefile.close()
+        return words
+
+    def save(self):
+        """Writes the words to the cache file, together with the ones that
+        other processes wrote there in the mean time."""
+        if not self.cachefile or not self.unsaved:
+            return
+        self.lock.acquire()
+        try:
+            words = self.load()
+            words.update(self.words)
+            directory = os.path.dirname(self.cachefile)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            # write another file and rename it, so readers never see half
+            # a file
+            tempname = "%s.%d" % (self.cachefile, os.getpid())
+            cachefile = codecs.open(tempname, "w", "utf-8")
             try:
-                checkers[lang] = checker.SpellChecker(lang)
-                # some versions only report an error when checking something
-                checkers[lang].check(u'bla')
-            except EnchantError, e:
-                # sometimes this is raised instead of DictNotFoundError
-                print >> sys.stderr, str(e)
-                checkers[lang] = None
-
-        if not checkers[lang]:
+                cachefile.write(u"# %s\n" % self.dictionary.describe())
+                for word, suggestions in words.iteritems():
+                    if suggestions is None:
+                        cachefile.write(u"+%s\n" % word)
+                    else:
+                        cachefile.write(u"-%s\n" % u"\t".join([word] + suggestions))
+            finally:
+                cachefile.close()
+            if os.name == "nt" and os.path.exists(self.cachefile):
+                os.remove(self.cachefile)
+            os.rename(tempname, self.cachefile)
+            self.unsaved = 0
+        finally:
+            self.lock.release()
+
+    def checkwords(self, words):
+        """Looks up the words that weren't looked up before, each once."""
+        newwords = {}
+        for word in set(words):
+            if word not in self.words:
+                if self.dictionary.check(word):
+                    newwords[word] = None
+                else:
+                    newwords[word] = list(self.dictionary.suggest(word))
+        if not newwords:
             return
-        spellchecker = checkers[lang]
-        spellchecker.set_text(unicode(text))
-        for err in spellchecker:
-            yield err.word, err.wordpos, err.suggest()
+        # L{save} iterates over the words while holding the lock
+        self.lock.acquire()
+        try:
+            self.words.update(newwords)
+            self.unsaved += len(newwords)
+            unsaved = self.unsaved
+        finally:
+            self.lock.release()
+        if unsaved >= SAVE_EVERY:
+            self.save()
 
-except ImportError:
-    def check(text, lang):
+    def check(self, text):
+        """Yields (word, position, suggestions) for every misspelled word in
+        text."""
+        for word, index in self.dictionary.tokenize(unicode(text)):
+            if word not in self.words:
+                self.checkwords([word])
+            suggestions = self.words[word]
+            if suggestions is not None:
+                yield word, index, list(suggestions)
+
+    def checkmany(self, texts):
+        """Returns a list with the results of L{check} for each of the texts
+        as a list. Every distinct word in all the texts is looked up once."""
+        texts = [list(self.dictionary.tokenize(unicode(text))) for text in texts]
+        self.checkwords([word for words in texts for word, index in words])
+        results = []
+        for words in texts:
+            results.append([(word, index, list(self.words[word]))
+                            for word, index in words if self.words[word] is not None])
+        return results
+
+
+_dictionaries = {}
+_checkers = {}
+_checkerslock = threading.Lock()
+
+def setdictionary(lang, dictionary):
+    """Makes the spell checker of the language use the given dictionary (a
+    L{WordListDictionary}, for example) instead of the enchant dictionary."""
+    global available
+    _checkerslock.acquire()
+    try:
+        if lang in _checkers and _checkers[lang] is not None:
+            _checkers[lang].save()
+        _dictionaries[lang] = dictionary
+        _checkers.pop(lang, None)
+        available = True
+    finally:
+        _checkerslock.release()
+
+def getcachefile(lang):
+    """Returns the cache file of the spell checker of the language, or None
+    if L{cachedir} is empty."""
+    directory = cachedir
+    if directory is None:
+        userdir = os.path.expanduser("~")
+        if os.name == "nt":
+            directory = os.path.join(userdir, "Translate Toolkit", "spelling")
+        else:
+            directory = os.path.join(userdir, ".translate_toolkit", "spelling")
+    if not directory:
+        return None
+    return os.path.join(directory, "%s.cache" % lang)
+
+def getchecker(lang):
+    """Returns the shared L{SpellChecker} of the language, or None if there
+    is no dictionary for it."""
+    _checkerslock.acquire()
+    try:
+        if not lang in _checkers:
+            dictionary = _dictionaries.get(lang)
+            if dictionary is None and enchant is not None:
+                try:
+                    dictionary = EnchantDictionary(lang)
+                except EnchantError, e:
+                    # sometimes this is raised instead of DictNotFoundError
+                    print >> sys.stderr, str(e)
+            if dictionary is None:
+                _checkers[lang] = None
+            else:
+                _checkers[lang] = SpellChecker(dictionary, getcachefile(lang))
+        return _checkers[lang]
+    finally:
+        _checkerslock.release()
+
+def check(text, lang):
+    """Yields (word, position, suggestions) for every misspelled word in
+    text."""
+    spellchecker = getchecker(lang)
+    if spellchecker is None:
         return []
+    return spellchecker.check(text)
+
+def checkmany(texts, lang):
+    """Returns a list with the results of L{check} for each of the texts as
+    a list, looking up every distinct word only once."""
+    spellchecker = getchecker(lang)
+    if spellchecker is None:
+        return [[] for text in texts]
+    return spellchecker.checkmany(texts)
+
+def savecaches():
+    """Writes the words that the spell checkers looked up to their cache
+    files."""
+    for spellchecker in _checkers.values():
+        if spellchecker is not None:
+            spellchecker.save()
 
+atexit.register(savecaches)
@@ -936,3 +936,60 @@ def test_gconf():
     gnomechecker.locations = ['file.schemas.in.h:24']
     assert passes(gnomechecker.gconf, 'Blah "gconf_setting"', 'Bleh "gconf_setting"')
     assert fails(gnomechecker.gconf, 'Blah "gconf_setting"', 'Bleh "gconf_steling"')
+
+def test_sourcecache():
+    """tests that the results for source strings are reused for other units
+    and languages, but not where they depend on the language"""
+    checker = checks.StandardChecker(checks.CheckerConfig(accelmarkers=["&"], varmatches=[("%", 1)]))
+    unit = po.pounit(u'&Open %s "file"')
+    unit.target = u'&Maak %s "lêer" oop'
+    assert checker.run_filters(unit) == {}
+    assert checker.cachestats()["misses"] == 1
+    assert ("filtervariables", u'&Open %s "file"') in checker.sourceresults
+    unit.target = u'Maak "lêer" oop'
+    assert sorted(checker.run_filters(unit).keys()) == ["accelerators", "printf", "variables"]
+    assert checker.cachestats()["hits"] == 1
+    checker.config.updatetargetlanguage("fr")
+    unit.target = u'&Ouvrir %s « fichier »'
+    assert checker.run_filters(unit) == {}
+    checker.config.updatetargetlanguage("af")
+    assert "doublequoting" in checker.run_filters(unit)
+    assert checker.cachestats()["size"] == 1
+    checker.setconfig(checks.CheckerConfig())
+    assert checker.cachestats()["size"] == 0
+
+def test_checkplan():
+    """tests that the check plan runs the preconditions first, leaves out
+    the tests the language ignores and is compiled again when the language
+    changes"""
+    checker = checks.StandardChecker()
+    plan = checker.getplan()
+    assert checker.getplan() is plan
+    preconditions = checker.preconditions.keys()
+    assert [entry[0] for entry in plan[:len(preconditions)]] == preconditions
+    assert plan[0][4] == checker.preconditions[plan[0][0]]
+    assert "startcaps" in [entry[0] for entry in plan]
+    checker.config.updatetargetlanguage("ja")
+    plan = checker.getplan()
+    assert "startcaps" not in [entry[0] for entry in plan]
+    assert len(plan) == len(checker.defaultfilters) - 2
+    unit = po.pounit(u"Open %s")
+    assert checker.run_filters(unit) == {"untranslated": u"checks whether a string has been translated at all"}
+    checker = checks.StandardChecker(limitfilters=["startcaps"])
+    assert checker.run_filters(unit) == {}
+    assert [entry[0] for entry in checker.getplan() if entry[3]] == ["startcaps"]
+
+def test_scanstring():
+    """tests that the whitespace, punctuation, bracket and tag tests share
+    one scan of each string"""
+    checker = checks.StandardChecker()
+    scan = checker.scanstring(u" <b>Open</b> (the  file), now. ")
+    assert (scan.startspace, scan.endspace) == (u" ", u" ")
+    assert scan.doublespaces == 1
+    assert scan.tags == [u"<b>", u"</b>"]
+    assert scan.last == u" "
+    assert scan.tokens == sorted([u"<", u">", u"<", u"/", u"> ", u"(", u")", u", ", u". "])
+    assert checker.scanstring(u" <b>Open</b> (the  file), now. ") is scan
+    assert checker.scanstring(u"   ").endspace == u"   "
+    checker.config.punctuation += u"n"
+    assert u"n" in [token[0] for token in checker.scanstring(u"Open").tokens]
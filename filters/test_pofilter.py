@@ -8,6 +8,10 @@ from translate.filters import pofilter
 from translate.filters import checks
 from translate.misc import wStringIO
 
+import os
+import shutil
+import sys
+
 
 class BaseTestFilter(object):
     """Base class for filter tests."""
@@ -220,6 +224,94 @@ msgstr "koei"
             print first_translatable(filter_result)
         assert headerless_len(filter_result.units) == 0
 
+    def test_failurecounts(self):
+        """Tests that the check filter counts the units failing each test."""
+        options, args = pofilter.cmdlineparser().parse_args([self.filename, "--nonotes"])
+        checkfilter = pofilter.pocheckfilter(options, None, pofilter.build_checkerconfig(options))
+        self.unit.target = "REST"
+        checkfilter.filterfile(self.translationstore)
+        checkfilter.filterfile(self.translationstore)
+        assert checkfilter.failurecounts == {"startcaps": 2, "simplecaps": 2}
+        summary = pofilter.summarizefailures({"startcaps": 2, "printf": 3, "simplecaps": 2}, 4)
+        assert summary.split("\n") == ["7 failures in 4 files", "       3  printf",
+                                       "       2  simplecaps", "       2  startcaps"]
+
+
+    def test_checkcache(self):
+        """Tests that the results of checks are reused from the statistics
+        cache for units that were checked before."""
+        from translate.storage import statsdb
+        testdir = "%s_testdir" % (self.__class__.__name__)
+        if os.path.exists(testdir):
+            shutil.rmtree(testdir)
+        os.mkdir(testdir)
+        defaultfile = statsdb.StatsCache.defaultfile
+        statsdb.StatsCache.defaultfile = os.path.realpath(os.path.join(testdir, "stats.db"))
+        try:
+            self.unit.target = "REST"
+            expected = str(self.filter(self.parse_text(str(self.translationstore))))
+            run_filters = checks.TeeChecker.run_filters
+            checked = []
+            def countingrun_filters(checker, unit):
+                checked.append(unit.source)
+                return run_filters(checker, unit)
+            checks.TeeChecker.run_filters = countingrun_filters
+            try:
+                for i in range(2):
+                    store = self.parse_text(str(self.translationstore))
+                    assert str(self.filter(store, cmdlineoptions=["--checkcache"])) == expected
+            finally:
+                checks.TeeChecker.run_filters = run_filters
+            assert checked == ["test"]
+        finally:
+            statsdb.StatsCache.defaultfile = defaultfile
+            shutil.rmtree(testdir)
+
+
+class TestParallelFilter:
+    """Tests filtering a directory tree in several processes."""
+    posource = 'msgid "test %%d"\nmsgstr "%s"\n\nmsgid "Fine"\nmsgstr "Goed"\n'
+
+    def setup_method(self, method):
+        """sets up a test directory with some files to filter"""
+        self.testdir = "%s_testdir" % (self.__class__.__name__)
+        self.teardown_method(method)
+        os.makedirs(os.path.join(self.testdir, "input", "sub"))
+        for name, target in [("a.po", "toets"), ("b.po", "Toets"), (os.path.join("sub", "c.po"), "TOETS"),
+                             ("d.po", "toets %d"), ("e.xlf", "<xliff")]:
+            source = self.posource % target
+            if name.endswith(".xlf"):
+                source = target
+            open(os.path.join(self.testdir, "input", name), "w").write(source)
+
+    def teardown_method(self, method):
+        """removes the test directory"""
+        if os.path.exists(self.testdir):
+            shutil.rmtree(self.testdir)
+
+    def run_filter(self, output, jobs):
+        """runs pofilter on the test directory, returns the output files"""
+        output = os.path.join(self.testdir, output)
+        oldargv = sys.argv
+        sys.argv = ["pofilter", "--progress=none", "-j", str(jobs), os.path.join(self.testdir, "input"), output]
+        try:
+            pofilter.cmdlineparser().run()
+        finally:
+            sys.argv = oldargv
+        outputfiles = {}
+        for dirpath, dirnames, filenames in os.walk(output):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                outputfiles[path[len(output):]] = open(path).read()
+        return outputfiles
+
+    def test_jobs(self):
+        """Tests that filtering in several processes gives the same files."""
+        expected = self.run_filter("serial", 1)
+        assert os.sep + os.path.join("sub", "c.po") in expected
+        assert os.sep + "d.po" not in expected
+        assert self.run_filter("parallel", 3) == expected
+
 
 class TestXliffFilter(BaseTestFilter):
     """Test class for xliff-specific tests."""
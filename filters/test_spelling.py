@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from translate.filters import spelling
+from translate.filters import checks
+from translate.storage import po
+
+import os
+import shutil
+import threading
+import time
+
+class CountingDictionary(spelling.WordListDictionary):
+    """A word list that remembers the words it looked up"""
+    def __init__(self, words):
+        spelling.WordListDictionary.__init__(self, words)
+        self.checked = []
+
+    def check(self, word):
+        self.checked.append(word)
+        return spelling.WordListDictionary.check(self, word)
+
+class FakeEnchantDict(object):
+    """Something that looks like an enchant dictionary, to describe it"""
+    tag = "af"
+    provider = None
+
+class TestSpelling:
+    def setup_method(self, method):
+        """sets up a directory for the cache files"""
+        self.testdir = os.path.realpath("%s_testdir" % (self.__class__.__name__))
+        self.teardown_method(method)
+        os.mkdir(self.testdir)
+        self.cachedir = spelling.cachedir
+        self.available = spelling.available
+        spelling.cachedir = self.testdir
+
+    def teardown_method(self, method):
+        """removes the cache files and the dictionaries of the tests"""
+        if os.path.exists(self.testdir):
+            shutil.rmtree(self.testdir)
+        spelling.cachedir = getattr(self, "cachedir", None)
+        spelling.available = getattr(self, "available", spelling.available)
+        for lang in ("af", "en"):
+            spelling._dictionaries.pop(lang, None)
+            spelling._checkers.pop(lang, None)
+
+    def test_wordlist(self):
+        """Test checking with a word list"""
+        wordlist = os.path.join(self.testdir, "af.txt")
+        open(wordlist, "w").write(u"Groot\ntrek\nlêer\n\n".encode("utf-8"))
+        dictionary = spelling.WordListDictionary.fromfile(wordlist)
+        assert dictionary.check(u"groot") and dictionary.check(u"lêer")
+        assert not dictionary.check(u"lêers")
+        assert dictionary.suggest(u"lêers") == [u"lêer"]
+        spellchecker = spelling.SpellChecker(dictionary)
+        assert list(spellchecker.check(u"Groot treks, lêer")) == [(u"treks", 6, [u"trek"])]
+
+    def test_describe_enchant(self):
+        """Test that the description of an enchant dictionary changes when its
+        files change"""
+        enchantdirs = spelling.enchantdirs
+        spelling.enchantdirs = [self.testdir]
+        try:
+            dictionary = object.__new__(spelling.EnchantDictionary)
+            dictionary.dictionary = FakeEnchantDict()
+            description = dictionary.describe()
+            assert description.startswith("enchant  af ")
+            wordlist = os.path.join(self.testdir, "af.dic")
+            open(wordlist, "w").write("lêer\n")
+            assert dictionary.describe() != description
+            description = dictionary.describe()
+            os.utime(wordlist, (0, 0))
+            assert dictionary.describe() != description
+        finally:
+            spelling.enchantdirs = enchantdirs
+
+    def test_checkmany(self):
+        """Test that every distinct word is looked up once"""
+        dictionary = CountingDictionary([u"die", u"lêer", u"is", u"oop"])
+        spellchecker = spelling.SpellChecker(dictionary)
+        results = spellchecker.checkmany([u"die lêer is oop", u"Die leer is toe", u""])
+        assert results == [[], [(u"leer", 4, [u"lêer"]), (u"toe", 12, [])], []]
+        assert sorted(dictionary.checked) == [u"Die", u"die", u"is", u"leer", u"lêer", u"oop", u"toe"]
+        assert list(spellchecker.check(u"Die leer")) == [(u"leer", 4, [u"lêer"])]
+        assert len(dictionary.checked) == 7
+
+    def test_cachefile(self):
+        """Test that the words are remembered in the cache file of the
+        dictionary"""
+        cachefile = os.path.join(self.testdir, "sub", "af.cache")
+        spellchecker = spelling.SpellChecker(CountingDictionary([u"lêer"]), cachefile)
+        spellchecker.checkmany([u"lêer leer"])
+        spellchecker.save()
+        dictionary = CountingDictionary([u"lêer"])
+        spellchecker = spelling.SpellChecker(dictionary, cachefile)
+        assert spellchecker.checkmany([u"lêer leer"]) == [[(u"leer", 5, [u"lêer"])]]
+        assert dictionary.checked == []
+        # another process adds words in the mean time
+        other = spelling.SpellChecker(CountingDictionary([u"lêer"]), cachefile)
+        other.checkmany([u"oop"])
+        spellchecker.checkmany([u"toe"])
+        other.save()
+        spellchecker.save()
+        assert sorted(spelling.SpellChecker(dictionary, cachefile).words) == [u"leer", u"lêer", u"oop", u"toe"]
+        # the words of another dictionary are not used
+        dictionary = CountingDictionary([u"lêer", u"leer"])
+        assert spelling.SpellChecker(dictionary, cachefile).words == {}
+
+    def test_checkwords_lock(self):
+        """Test that new words aren't added while the cache file is written"""
+        spellchecker = spelling.SpellChecker(CountingDictionary([u"lêer"]))
+        spellchecker.lock.acquire()
+        try:
+            thread = threading.Thread(target=spellchecker.checkwords, args=([u"lêer", u"leer"],))
+            thread.start()
+            time.sleep(0.1)
+            assert spellchecker.words == {}
+        finally:
+            spellchecker.lock.release()
+        thread.join()
+        assert spellchecker.words == {u"lêer": None, u"leer": [u"lêer"]}
+        assert spellchecker.unsaved == 2
+
+    def test_spellcheck(self):
+        """Test the spellcheck test and preparing it for many units with word
+        lists"""
+        spelling.setdictionary("en", spelling.WordListDictionary([u"Great", u"trek", u"Open", u"file"]))
+        dictionary = CountingDictionary([u"Groot", u"trek", u"Maak", u"lêer", u"oop"])
+        spelling.setdictionary("af", dictionary)
+        assert spelling.available
+        checker = checks.StandardChecker(checks.CheckerConfig(targetlanguage="af", accelmarkers=["&"]))
+        units = []
+        for source, target in [(u"Great trek", u"Groot trek"), (u"&Open file", u"Maak lêer &oop"),
+                               (u"Open the file", u"Maak die leer oop")]:
+            units.append(po.pounit(source))
+            units[-1].target = target
+        checker.prepare(units)
+        assert len(dictionary.checked) == len(set(dictionary.checked)) == 7
+        assert [checker.run_filters(unit).get("spellcheck") for unit in units] == \
+               [None, None, u"check spelling of die (could be ), check spelling of leer (could be lêer)"]
+        assert len(dictionary.checked) == 7
+        assert not os.path.exists(os.path.join(self.testdir, "af.cache"))
+        spelling.savecaches()
+        assert os.path.exists(os.path.join(self.testdir, "af.cache"))
@@ -205,6 +205,11 @@ class Common(object):
         memo[id(self)] = self
         return self
 
+    def __reduce__(self):
+        """Unpickles to the language object for the same code in the other
+        process, like L{__new__} would return it."""
+        return (self.__class__, (self.code,))
+
     def __repr__(self):
         """Give a simple string representation without address information to 
         be able to store it in text for comparison later."""
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from translate.lang import common
+from translate.lang import factory
+
+import pickle
 
 def test_characters():
     """Test the basic characters segmentation"""
@@ -94,3 +97,10 @@ def test_length_difference():
 def test_alter_length():
     """Test that we create the correct length by adding or removing characters"""
     assert common.Common.alter_length("One two three") == "One twOne two three"
+
+def test_pickle():
+    """Test that languages unpickle to the same language object"""
+    for code in ("", "af", "fr_FR"):
+        language = factory.getlanguage(code)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            assert pickle.loads(pickle.dumps(language, protocol)) is language
@@ -21,6 +21,8 @@
 from collections import deque
 from weakref import WeakValueDictionary
 import gc
+import threading
+import time
 
 class LRUCachingDict(WeakValueDictionary):
     """Caching dictionary like object that discards the least recently
@@ -118,3 +120,115 @@ class LRUCachingDict(WeakValueDictionary):
             self[key] = default
 
         return self[key]
+
+
+class LRUCache(object):
+    """Dictionary like cache holding at most maxsize items, discarding the
+    least recently used item when it is full.
+
+    Unlike L{LRUCachingDict} items are held by normal references, so any
+    value can be cached. If ttl is given, items expire after that many
+    seconds. The cache can be used from several threads at once, and it
+    counts hits and misses of L{get}.
+
+    Items can be added with a size (see L{set}), in which case maxsize
+    limits the total size of the items rather than their number.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # the total size of the cached items
+        self.used = 0
+        self._lock = threading.Lock()
+        # circular doubly linked list of [previous, next, key, value,
+        # expiry time, size] with the most recently used item at the end
+        self._root = root = []
+        root[:] = [root, root, None, None, None, 0]
+        self._map = {}
+
+    def _unlink(self, link):
+        previous, next = link[0], link[1]
+        previous[1] = next
+        next[0] = previous
+        self.used -= link[5]
+
+    def _append(self, link):
+        last = self._root[0]
+        link[0] = last
+        link[1] = self._root
+        last[1] = self._root[0] = link
+        self.used += link[5]
+
+    def get(self, key, default=None):
+        """Returns the value cached for key, or default if it isn't cached
+        or has expired."""
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is not None and link[4] is not None and link[4] < time.time():
+                self._unlink(link)
+                del self._map[key]
+                link = None
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+        finally:
+            self._lock.release()
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, size=1):
+        """Caches value for key, counting it as size towards maxsize (for
+        example its size in bytes). The least recently used items are
+        evicted until it fits, and it isn't cached at all if it is larger
+        than maxsize."""
+        if self.maxsize <= 0 or size > self.maxsize:
+            return
+        expires = None
+        if self.ttl:
+            expires = time.time() + self.ttl
+        self._lock.acquire()
+        try:
+            link = self._map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+            while self.used + size > self.maxsize:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._map[oldest[2]]
+            link = [None, None, key, value, expires, size]
+            self._append(link)
+            self._map[key] = link
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
+
+    def purge(self, function=None):
+        """Removes all items, or only those with keys for which function
+        returns True."""
+        self._lock.acquire()
+        try:
+            for key in self._map.keys():
+                if function is None or function(key):
+                    self._unlink(self._map.pop(key))
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Returns a dictionary with the size of the cache and the number of
+        hits and misses."""
+        return {"size": len(self._map), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses}
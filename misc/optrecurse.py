@@ -24,6 +24,7 @@ import os.path
 import fnmatch
 import traceback
 import optparse
+import shutil
 from translate.misc import progressbar
 from translate import __version__
 try:
@@ -176,18 +177,23 @@ class RecursiveOptionParser(optparse.OptionParser, object):
     def warning(self, msg, options=None, exc_info=None):
         """Print a warning message incorporating 'msg' to stderr and exit."""
         if options:
-            if options.errorlevel == "traceback":
-                errorinfo = "\n".join(traceback.format_exception(exc_info[0], exc_info[1], exc_info[2]))
-            elif options.errorlevel == "exception":
-                errorinfo = "\n".join(traceback.format_exception_only(exc_info[0], exc_info[1]))
-            elif options.errorlevel == "message":
-                errorinfo = str(exc_info[1])
-            else:
-                errorinfo = ""
+            errorinfo = self.formaterror(options, exc_info)
             if errorinfo:
                 msg += ": " + errorinfo
         print >> sys.stderr, "\n%s: warning: %s" % (self.get_prog_name(), msg)
 
+    def formaterror(self, options, exc_info):
+        """returns the description of the error in exc_info that
+        options.errorlevel asks for"""
+        if options.errorlevel == "traceback":
+            return "\n".join(traceback.format_exception(exc_info[0], exc_info[1], exc_info[2]))
+        elif options.errorlevel == "exception":
+            return "\n".join(traceback.format_exception_only(exc_info[0], exc_info[1]))
+        elif options.errorlevel == "message":
+            return str(exc_info[1])
+        else:
+            return ""
+
     def getusagestring(self, option):
         """returns the usage string for the given option"""
         optionstring = "|".join(option._short_opts + option._long_opts)
@@ -452,6 +458,21 @@ class RecursiveOptionParser(optparse.OptionParser, object):
 
     def recursiveprocess(self, options):
         """recurse through directories and process files"""
+        for inputpath, fileprocessor, fullinputpath, fulloutputpath, fulltemplatepath in self.recursefiles(options):
+            try:
+                success = self.processfile(fileprocessor, options, fullinputpath, fulloutputpath, fulltemplatepath)
+            except Exception, error:
+                if isinstance(error, KeyboardInterrupt):
+                    raise
+                self.warning("Error processing: input %s, output %s, template %s" % (fullinputpath, fulloutputpath, fulltemplatepath), options, sys.exc_info())
+                success = False
+            self.reportprogress(inputpath, success)
+        del self.progressbar
+
+    def recursefiles(self, options):
+        """recurse through directories and yield the files to process as
+        (inputpath, fileprocessor, fullinputpath, fulloutputpath,
+        fulltemplatepath) tuples, after setting up the progress bar"""
         if self.isrecursive(options.input, 'input') and getattr(options, "allowrecursiveinput", True):
             if not self.isrecursive(options.output, 'output'):
                 if not options.output:
@@ -494,15 +515,7 @@ class RecursiveOptionParser(optparse.OptionParser, object):
                     raise
                 self.warning("Couldn't handle input file %s" % inputpath, options, sys.exc_info())
                 continue
-            try:
-                success = self.processfile(fileprocessor, options, fullinputpath, fulloutputpath, fulltemplatepath)
-            except Exception, error:
-                if isinstance(error, KeyboardInterrupt):
-                    raise
-                self.warning("Error processing: input %s, output %s, template %s" % (fullinputpath, fulloutputpath, fulltemplatepath), options, sys.exc_info())
-                success = False
-            self.reportprogress(inputpath, success)
-        del self.progressbar
+            yield inputpath, fileprocessor, fullinputpath, fulloutputpath, fulltemplatepath
 
     def openinputfile(self, options, fullinputpath):
         """opens the input file"""
@@ -523,10 +536,10 @@ class RecursiveOptionParser(optparse.OptionParser, object):
     def finalizetempoutputfile(self, options, outputfile, fulloutputpath):
         """write the temp outputfile to its final destination"""
         outputfile.reset()
-        outputstring = outputfile.read()
-        outputfile = self.openoutputfile(options, fulloutputpath)
-        outputfile.write(outputstring)
-        outputfile.close()
+        finaloutputfile = self.openoutputfile(options, fulloutputpath)
+        # copy in blocks rather than making another copy of the whole file
+        shutil.copyfileobj(outputfile, finaloutputfile)
+        finaloutputfile.close()
 
     def opentemplatefile(self, options, fulltemplatepath):
         """opens the template file (if required)"""
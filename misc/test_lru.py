@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+from translate.misc import lru
+
+class TestLRUCache:
+    """Test the plain LRU cache"""
+    def test_eviction(self):
+        """Test that the least recently used item is evicted first"""
+        cache = lru.LRUCache(2)
+        cache["a"] = [1]
+        cache["b"] = [2]
+        assert cache.get("a") == [1]
+        cache["c"] = [3]
+        assert "b" not in cache
+        assert cache.get("a") == [1]
+        assert cache.get("c") == [3]
+        cache["c"] = [4]
+        assert len(cache) == 2
+        assert cache.get("c") == [4]
+
+    def test_counters(self):
+        """Test the hit and miss counters"""
+        cache = lru.LRUCache(10)
+        assert cache.get("a") is None
+        cache["a"] = []
+        assert cache.get("a") == []
+        assert cache.get("b", 0) == 0
+        assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 2}
+
+    def test_ttl(self):
+        """Test that items expire"""
+        cache = lru.LRUCache(10, ttl=0.01)
+        cache["a"] = 1
+        assert cache.get("a") == 1
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_purge(self):
+        """Test removing selected items"""
+        cache = lru.LRUCache(10)
+        for key in ("ab", "ac", "bc"):
+            cache[key] = key
+        cache.purge(lambda key: key.startswith("a"))
+        assert len(cache) == 1
+        assert cache.get("bc") == "bc"
+        cache.purge()
+        assert len(cache) == 0
+
+    def test_sizes(self):
+        """Test that maxsize limits the total size of sized items"""
+        cache = lru.LRUCache(10)
+        cache.set("a", 1, 4)
+        cache.set("b", 2, 4)
+        cache.set("c", 3, 4)
+        assert "a" not in cache
+        assert cache.used == 8
+        cache.set("d", 4, 11)
+        assert "d" not in cache
+        cache.set("b", 5, 9)
+        assert len(cache) == 1
+        assert cache.used == 9
+        cache.purge()
+        assert cache.used == 0
+
+    def test_disabled(self):
+        """Test that a cache of size 0 caches nothing"""
+        cache = lru.LRUCache(0)
+        cache["a"] = 1
+        assert cache.get("a") is None
@@ -23,9 +23,7 @@
 import logging
 import os
 
-def launch_server_wsgiref(host, port, app):
-    """use python's builtin simple_server, this is a last resort since
-    it doesn't support concurrency at all"""
+def _request_handler():
     from wsgiref import simple_server
     class CustomRequestHandler(simple_server.WSGIRequestHandler):
         """Custom request handler, disables some inefficient defaults"""
@@ -45,13 +43,88 @@ def launch_server_wsgiref(host, port, app):
             stderror."""
             logging.info("%s - - [%s] %s",
                          self.address_string(),  self.log_date_time_string(), format % args)
-        
-    server = simple_server.make_server(host, port, app, handler_class=CustomRequestHandler)
+    return CustomRequestHandler
+
+
+def launch_server_wsgiref(host, port, app, workers=None):
+    """use python's builtin simple_server, this is a last resort since
+    it doesn't support concurrency at all"""
+    from wsgiref import simple_server
+    server = simple_server.make_server(host, port, app, handler_class=_request_handler())
     logging.info("Starting wsgiref server, listening on port %s", port)
     server.serve_forever()
 
 
-def launch_server_django(host, port, app):
+def make_threaded_server(host, port, app, workers=10, backlog=None):
+    """Creates a wsgiref server that handles requests in a fixed pool of
+    worker threads.
+
+    @param workers: the number of worker threads
+    @param backlog: the number of accepted requests that may wait for a
+    worker, when the queue is full the server stops accepting new
+    connections (default: twice the number of workers)
+    """
+    import Queue
+    import threading
+    from wsgiref import simple_server
+
+    class ThreadPoolWSGIServer(simple_server.WSGIServer):
+        """A WSGI server with a bounded pool of worker threads."""
+
+        def __init__(self, server_address, handler_class):
+            simple_server.WSGIServer.__init__(self, server_address, handler_class)
+            self.requests = Queue.Queue(backlog or 2 * workers)
+            self.workers = []
+            for i in range(workers):
+                worker = threading.Thread(target=self.work, name="wsgi-worker-%d" % i)
+                worker.setDaemon(True)
+                worker.start()
+                self.workers.append(worker)
+
+        def process_request(self, request, client_address):
+            # blocks while all workers are busy and the queue is full
+            self.requests.put((request, client_address))
+
+        def work(self):
+            while True:
+                task = self.requests.get()
+                if task is None:
+                    break
+                request, client_address = task
+                try:
+                    try:
+                        self.finish_request(request, client_address)
+                    except Exception:
+                        self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+
+        def drain(self):
+            """Stops listening for connections, waits for all accepted
+            requests to be handled and stops the workers."""
+            self.server_close()
+            for worker in self.workers:
+                self.requests.put(None)
+            for worker in self.workers:
+                worker.join()
+
+    server = ThreadPoolWSGIServer((host, port), _request_handler())
+    server.set_app(app)
+    return server
+
+
+def launch_server_threaded(host, port, app, workers=10):
+    """use python's builtin simple_server with a pool of worker threads"""
+    server = make_threaded_server(host, port, app, workers)
+    logging.info("Starting threaded wsgiref server with %d workers, listening on port %s", workers, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down, waiting for pending requests")
+    server.drain()
+
+
+def launch_server_django(host, port, app, workers=None):
     """use django's development server, only works for django apps"""
     if 'DJANGO_SETTINGS_MODULE' not in os.environ:
         raise ImportError("no django settings module specified")
@@ -62,28 +135,28 @@ def launch_server_django(host, port, app):
     run(host, port, app)
 
 
-def launch_server_cherrypy(host, port, app):
+def launch_server_cherrypy(host, port, app, workers=10):
     """use cherrypy's wsgiserver, a multithreaded scallable server"""
     from cherrypy.wsgiserver import  CherryPyWSGIServer
 
-    server = CherryPyWSGIServer((host, port), app)
+    server = CherryPyWSGIServer((host, port), app, numthreads=workers)
     logging.info("Starting CherryPy server, listening on port %s", port)
     try:
         server.start()
     except KeyboardInterrupt:
         server.stop()
 
-#FIXME: implement threading http server based on BaseHTTPServer and wsgiref
+servers = [launch_server_cherrypy, launch_server_django, launch_server_threaded, launch_server_wsgiref]
 
-servers = [launch_server_cherrypy, launch_server_django, launch_server_wsgiref]
+def launch_server(host, port, app, workers=10):
+    """use the best possible wsgi server
 
-def launch_server(host, port, app):
-    """use the best possible wsgi server"""
+    @param workers: the number of requests to handle concurrently, for
+    servers that support it
+    """
     for server in servers:
         try:
-            server(host, port, app)
+            server(host, port, app, workers)
             break
         except ImportError:
             pass
-
-            
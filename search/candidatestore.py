@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009 Zuza Software Foundation
+#
+# This file is part of translate.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""Storage for the candidates of a translation memory matcher.
+
+All candidate stores give access to candidates by their position (sorted by
+the length of the source text) with the same methods: C{sourcelength()},
+C{source()}, C{sourceid()} and C{unit()}. Units are only created by
+C{unit()}, so a matcher only needs to create units for its results.
+"""
+
+import array
+
+from translate.storage import base
+from translate.misc.multistring import multistring
+
+FLAG_FUZZY = 1
+FLAG_PLURAL = 2
+
+
+def sourcelen(unit):
+    """Returns the length of the source string"""
+    return len(unit.source)
+
+def _unicode(text):
+    if isinstance(text, str):
+        return text.decode("utf-8")
+    return unicode(text)
+
+
+class CandidateStore(object):
+    """A compact, columnar store of candidates.
+
+    All strings are interned in a single UTF-8 buffer and referred to by
+    their id. Every candidate is a position in a few arrays: the ids of its
+    source, target and notes, the length of its source text (for the binary
+    search in the matcher) and some flag bits."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # string i is in self._buffer[self._offsets[i]:self._offsets[i+1]]
+        self._offsets = array.array('L', [0])
+        # maps the hash of a string to its id
+        self._interned = {}
+        self._sources = array.array('l')
+        self._targets = array.array('l')
+        self._notes = array.array('l')
+        self._lengths = array.array('L')
+        self._flags = array.array('B')
+        # maps the position of a candidate with plurals to the ids of all
+        # its source and target strings
+        self._plurals = {}
+
+    def _addstring(self, text):
+        self._buffer.extend(text.encode("utf-8"))
+        self._offsets.append(len(self._buffer))
+        return len(self._offsets) - 2
+
+    def intern(self, text):
+        """Returns the id of text, adding it to the buffer if it is new."""
+        text = _unicode(text)
+        key = hash(text)
+        stringid = self._interned.get(key)
+        if stringid is None:
+            stringid = self._interned[key] = self._addstring(text)
+        elif self.string(stringid) != text:
+            # Hash collision. This is rare enough to simply store it again.
+            stringid = self._addstring(text)
+        return stringid
+
+    def string(self, stringid):
+        """Returns the string with the given id."""
+        return self._buffer[self._offsets[stringid]:self._offsets[stringid+1]].decode("utf-8")
+
+    def add(self, source, target, notes=u"", fuzzy=False):
+        """Adds a candidate. The source and target can be multistrings."""
+        flags = 0
+        if fuzzy:
+            flags |= FLAG_FUZZY
+        if isinstance(source, multistring) and len(source.strings) > 1:
+            flags |= FLAG_PLURAL
+            self._plurals[len(self)] = ([self.intern(string) for string in source.strings],
+                                        [self.intern(string) for string in getattr(target, "strings", [target])])
+        source = _unicode(source)
+        self._sources.append(self.intern(source))
+        self._targets.append(self.intern(target))
+        self._notes.append(self.intern(notes or u""))
+        self._lengths.append(len(source))
+        self._flags.append(flags)
+
+    def sort(self, reverse=False):
+        """Sorts the candidates by the length of their source text. The sort
+        is stable, like list.sort()."""
+        order = sorted(xrange(len(self)), key=self._lengths.__getitem__, reverse=reverse)
+        for name in ("_sources", "_targets", "_notes", "_lengths", "_flags"):
+            column = getattr(self, name)
+            setattr(self, name, array.array(column.typecode, [column[i] for i in order]))
+        if self._plurals:
+            positions = dict([(old, new) for new, old in enumerate(order) if old in self._plurals])
+            self._plurals = dict([(positions[old], plurals) for old, plurals in self._plurals.iteritems()])
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def sourcelength(self, index):
+        """Returns the length of the source text of the given candidate."""
+        return self._lengths[index]
+
+    def sourceid(self, index):
+        """Returns a key for the source text of the given candidate that is
+        the same for all candidates with the same source text."""
+        return self._sources[index]
+
+    def source(self, index):
+        """Returns the source text of the given candidate."""
+        return self.string(self._sources[index])
+
+    def unit(self, index):
+        """Creates a unit for the given candidate."""
+        unit = base.TranslationUnit(self.string(self._sources[index]))
+        unit.target = self.string(self._targets[index])
+        unit.addnote(self.string(self._notes[index]))
+        unit.fuzzy = bool(self._flags[index] & FLAG_FUZZY)
+        if self._flags[index] & FLAG_PLURAL:
+            sources, targets = self._plurals[index]
+            unit.orig_source = multistring([self.string(stringid) for stringid in sources])
+            unit.orig_target = multistring([self.string(stringid) for stringid in targets])
+        return unit
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.unit(i) for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("candidate index out of range")
+        return self.unit(index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self.unit(index)
+
+    def _getunits(self):
+        return self
+    units = property(_getunits, doc="The candidates as a read-only sequence of units")
+
+
+class UnitCandidateStore(base.TranslationStore):
+    """A store with a full unit for every candidate in C{units}, for matchers
+    that need to modify their candidates."""
+
+    def intern(self, text):
+        return text
+
+    def add(self, source, target, notes=u"", fuzzy=False):
+        """Adds a candidate. The source and target can be multistrings."""
+        simpleunit = base.TranslationUnit("")
+        # We need to ensure that we don't pass multistrings futher, since
+        # some modules (like the native Levenshtein) can't use it.
+        if isinstance(source, multistring):
+            if len(source.strings) > 1:
+                simpleunit.orig_source = source
+                simpleunit.orig_target = target
+            simpleunit.source = unicode(source)
+            simpleunit.target = unicode(target)
+        else:
+            simpleunit.source = source
+            simpleunit.target = target
+        simpleunit.addnote(notes)
+        simpleunit.fuzzy = fuzzy
+        self.units.append(simpleunit)
+
+    def sort(self, reverse=False):
+        self.units.sort(key=sourcelen, reverse=reverse)
+
+    def __len__(self):
+        return len(self.units)
+
+    def sourcelength(self, index):
+        return len(self.units[index].source)
+
+    def sourceid(self, index):
+        return self.units[index].source
+
+    def source(self, index):
+        return self.units[index].source
+
+    def unit(self, index):
+        return self.units[index]
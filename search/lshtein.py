@@ -27,40 +27,131 @@ http://trific.ath.cx/python/levenshtein/
 """
 
 import math
+import sys
 
-def python_distance(a, b, stopvalue=-1):
-    """Calculates the distance for use in similarity calculation. Python
-    version."""
+# The longest pattern for which myers_distance() can keep its bit vectors in
+# plain integers
+MAX_WORD_BITS = len(bin(sys.maxint)) - 2
+
+def banded_distance(a, b, stopvalue=-1):
+    """Calculates the distance, but only considers the diagonal band of the
+    matrix where a distance of at most stopvalue is still possible (Ukkonen).
+    Returns a value bigger than stopvalue as soon as that can't be attained.
+
+    This uses time O(stopvalue*len(b)) and works on arbitrary sequences."""
     l1 = len(a)
     l2 = len(b)
-    if stopvalue == -1:
+    if l1 > l2:
+        l1, l2 = l2, l1
+        a, b = b, a
+    if stopvalue < 0 or stopvalue > l2:
         stopvalue = l2
-    current = range(l1+1)
+    stopvalue = int(stopvalue)
+    if l2 - l1 > stopvalue:
+        return l2 - l1
+    #Every cell outside the band is considered to be "too far"
+    big = stopvalue + 1
+    previous = [big]*(l1+1)
+    current = [big]*(l1+1)
+    for j in range(min(l1, stopvalue) + 1):
+        previous[j] = j
     for i in range(1, l2+1):
-        previous, current = current, [i]+[0]*l1
-        least = l2
-        for j in range(1, l1 + 1):
-            change = previous[j-1]
-            if a[j-1] != b[i-1]:
-                change = change + 1
-            insert = previous[j] + 1
-            delete = current[j-1] + 1
-            current[j] = min(insert, delete, change)
-            if least > current[j]:
-                least = current[j]
-        #The smallest value in the current array is the best (lowest) value
-        #that can be attained in the end if the strings are identical further
+        start = max(1, i - stopvalue)
+        stop = min(l1, i + stopvalue)
+        if start == 1:
+            current[0] = i <= stopvalue and i or big
+            least = current[0]
+        else:
+            current[start-1] = big
+            least = big
+        char = b[i-1]
+        for j in range(start, stop + 1):
+            value = previous[j-1]
+            if a[j-1] != char:
+                value += 1
+            if previous[j] < value:
+                value = previous[j] + 1
+            if current[j-1] < value:
+                value = current[j-1] + 1
+            if value > big:
+                value = big
+            current[j] = value
+            if least > value:
+                least = value
+        #The smallest value in the band is the best (lowest) value that can be
+        #attained in the end if the strings are identical further
         if least > stopvalue:
             return least
+        previous, current = current, previous
+    return previous[l1]
+
+def myers_distance(a, b, stopvalue=-1):
+    """Calculates the distance with the bit-parallel algorithm of Myers (as
+    formulated by Hyyro), keeping a column of the matrix in the bits of an
+    integer. Returns a value bigger than stopvalue as soon as that can't be
+    attained.
 
-    return current[l1]
+    This uses time O(len(b)) if the shorter string is not longer than
+    MAX_WORD_BITS."""
+    l1 = len(a)
+    l2 = len(b)
+    if l1 > l2:
+        l1, l2 = l2, l1
+        a, b = b, a
+    if l1 == 0:
+        return l2
+    if stopvalue < 0:
+        stopvalue = l2
+    if l2 - l1 > stopvalue:
+        return l2 - l1
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << l1) - 1
+    last = 1 << (l1 - 1)
+    positive = mask
+    negative = 0
+    score = l1
+    remaining = l2
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | negative
+        xh = ((((eq & positive) + positive) & mask) ^ positive) | eq
+        hpositive = negative | (~(xh | positive) & mask)
+        hnegative = positive & xh
+        if hpositive & last:
+            score += 1
+        elif hnegative & last:
+            score -= 1
+        remaining -= 1
+        #The score can decrease by at most one for every remaining character
+        if score - remaining > stopvalue:
+            return score - remaining
+        hpositive = ((hpositive << 1) | 1) & mask
+        hnegative = (hnegative << 1) & mask
+        positive = hnegative | (~(xv | hpositive) & mask)
+        negative = hpositive & xv
+    return score
 
-def native_distance(a, b, stopvalue=0):
+def python_distance(a, b, stopvalue=-1):
+    """Calculates the distance for use in similarity calculation. Python
+    version. The calculation is stopped as soon as the distance is known to be
+    bigger than stopvalue, in which case a value bigger than stopvalue is
+    returned."""
+    if min(len(a), len(b)) <= MAX_WORD_BITS:
+        return myers_distance(a, b, stopvalue)
+    return banded_distance(a, b, stopvalue)
+
+def native_distance(a, b, stopvalue=-1):
     """Same as python_distance in functionality. This uses the fast C 
     version if we detected it earlier.
 
     Note that this does not support arbitrary sequence types, but only 
-    string types."""
+    string types. The C version has no way of stopping early, so we can only
+    avoid calling it when the difference in length is already too big."""
+    lengthdifference = abs(len(a) - len(b))
+    if stopvalue >= 0 and lengthdifference > stopvalue:
+        return lengthdifference
     return Levenshtein.distance(a, b)
 
 try:
@@ -110,7 +201,9 @@ class LevenshteinComparer:
                - Calculation is stopped as soon as a similarity of stoppercentage becomes
                  unattainable. See the use of the variable stopvalue.
                - Implementation uses memory O(min(len(a), len(b))
-               - Excecution time is O(len(a)*len(b))
+               - Without python-Levenshtein, excecution time is O(len(b)) if the
+                 shorter string fits in MAX_WORD_BITS and O(stopvalue*len(b))
+                 otherwise
         """
         l1, l2 = len(a), len(b)
         if l1 == 0 or l2 == 0:
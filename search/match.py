@@ -23,16 +23,16 @@
 import heapq
 import re
 
+from translate.search import candidatestore
 from translate.search import lshtein
+from translate.search import qgram
+from translate.search import snapshot
 from translate.search import terminology
 from translate.storage import base
 from translate.storage import po
-from translate.misc.multistring import multistring
 
 
-def sourcelen(unit):
-    """Returns the length of the source string"""
-    return len(unit.source)
+sourcelen = candidatestore.sourcelen
 
 
 class matcher(object):
@@ -40,15 +40,18 @@ class matcher(object):
 
     sort_reverse = False
 
-    def __init__(self, store, max_candidates=10, min_similarity=75, max_length=70, comparer=None, usefuzzy=False):
+    def __init__(self, store, max_candidates=10, min_similarity=75, max_length=70, comparer=None, usefuzzy=False, useindex=False):
         """max_candidates is the maximum number of candidates that should be assembled,
         min_similarity is the minimum similarity that must be attained to be included in
-        the result, comparer is an optional Comparer with similarity() function"""
+        the result, comparer is an optional Comparer with similarity() function.
+        If useindex is true, a q-gram index is used to skip candidates that can't
+        reach min_similarity (only with the default Levenshtein comparer)."""
         if comparer is None:
             comparer = lshtein.LevenshteinComparer(max_length)
         self.comparer = comparer
         self.setparameters(max_candidates, min_similarity, max_length)
         self.usefuzzy = usefuzzy
+        self.useindex = useindex and isinstance(comparer, lshtein.LevenshteinComparer)
         self.inittm(store)
         self.addpercentage = True
 
@@ -60,6 +63,10 @@ class matcher(object):
         if source and target and (self.usefuzzy or not unit.isfuzzy()):
             if len(source) < 2:
                 return False
+            # We keep the ids of the interned strings, so that we don't keep
+            # another copy of every string
+            source = self.internstrings(source)
+            target = self.internstrings(target)
             if source in self.existingunits and self.existingunits[source] == target:
                 return False
             else:
@@ -67,18 +74,33 @@ class matcher(object):
                 return True
         return False
 
+    def internstrings(self, text):
+        """Returns a key for text (or all strings of a multistring) that
+        doesn't keep another copy of it."""
+        strings = getattr(text, "strings", [text])
+        if len(strings) == 1:
+            return self.candidates.intern(strings[0])
+        return tuple([self.candidates.intern(string) for string in strings])
+
+    def newcandidates(self):
+        """Returns an empty candidate store (see L{candidatestore})."""
+        return candidatestore.CandidateStore()
+
     def inittm(self, stores, reverse=False):
-        """Initialises the memory for later use. We use simple base units for
-        speedup."""
+        """Initialises the memory for later use. We use a compact candidate
+        store for speedup."""
         # reverse is deprectated - just use self.sort_reverse
         self.existingunits = {}
-        self.candidates = base.TranslationStore()
+        self.candidates = self.newcandidates()
+        self.index = None
+        if self.useindex:
+            self.index = qgram.QGramIndex()
 
         if isinstance(stores, base.TranslationStore):
             stores = [stores]
         for store in stores:
             self.extendtm(store.units, store=store, sort=False)
-        self.candidates.units.sort(key=sourcelen, reverse=self.sort_reverse)
+        self.candidates.sort(reverse=self.sort_reverse)
         # print "TM initialised with %d candidates (%d to %d characters long)" % \
         #        (len(self.candidates.units), len(self.candidates.units[0].source), len(self.candidates.units[-1].source))
 
@@ -94,29 +116,57 @@ class matcher(object):
         """
         if isinstance(units, base.TranslationUnit):
             units = [units]
+        if isinstance(self.candidates, snapshot.CandidateList):
+            # We can't modify a snapshot, so we copy the candidates first,
+            # remembering them so that they aren't added again
+            readonly = self.candidates
+            self.candidates = self.newcandidates()
+            for unit in readonly:
+                source = getattr(unit, "orig_source", unit.source)
+                target = getattr(unit, "orig_target", unit.target)
+                self.candidates.add(source, target, unit.getnotes(), unit.fuzzy)
+                self.existingunits[self.internstrings(source)] = self.internstrings(target)
+            readonly.close()
+            if self.index is not None:
+                # The snapshot indexed the candidates by their positions
+                self.index = qgram.QGramIndex()
+                for index in xrange(len(self.candidates)):
+                    self.index.add(self.candidates.source(index), self.candidates.sourceid(index))
         candidates = filter(self.usable, units)
         for candidate in candidates:
-            simpleunit = base.TranslationUnit("")
-            # We need to ensure that we don't pass multistrings futher, since
-            # some modules (like the native Levenshtein) can't use it.
-            if isinstance(candidate.source, multistring):
-                if len(candidate.source.strings) > 1:
-                    simpleunit.orig_source = candidate.source
-                    simpleunit.orig_target = candidate.target
-                simpleunit.source = unicode(candidate.source)
-                simpleunit.target = unicode(candidate.target)
-            else:
-                simpleunit.source = candidate.source
-                simpleunit.target = candidate.target
             # If we now only get translator comments, we don't get programmer
             # comments in TM suggestions (in Pootle, for example). If we get all
             # notes, pot2po adds all previous comments as translator comments
             # in the new po file
-            simpleunit.addnote(candidate.getnotes(origin="translator"))
-            simpleunit.fuzzy = candidate.isfuzzy()
-            self.candidates.units.append(simpleunit)
+            self.candidates.add(candidate.source, candidate.target,
+                    candidate.getnotes(origin="translator"), candidate.isfuzzy())
+            if self.index is not None:
+                index = len(self.candidates) - 1
+                self.index.add(self.candidates.source(index), self.candidates.sourceid(index))
         if sort:
-            self.candidates.units.sort(key=sourcelen, reverse=self.sort_reverse)
+            self.candidates.sort(reverse=self.sort_reverse)
+
+    def loadsnapshot(self, filename):
+        """Uses the candidates from the given snapshot file (see
+        L{snapshot.save}) instead of the current ones. The file is only opened
+        when the candidates are first needed."""
+        self.existingunits = {}
+        self.candidates = snapshot.CandidateList(filename)
+        self.index = None
+        if self.useindex:
+            # Unfortunately this means reading all the candidates now
+            self.index = qgram.QGramIndex()
+            for index in xrange(len(self.candidates)):
+                self.index.add(self.candidates.source(index), self.candidates.sourceid(index))
+
+    def savesnapshot(self, filename, tmfiles=()):
+        """Saves the current candidates to a snapshot file that can be loaded
+        with loadsnapshot().
+
+        @param tmfiles: The names of the files the TM was built from. The
+        snapshot is considered stale when any of them changes.
+        """
+        snapshot.save(filename, self.candidates, tmfiles, self.usefuzzy)
 
     def setparameters(self, max_candidates=10, min_similarity=75, max_length=70):
         """Sets the parameters without reinitialising the tm. If a parameter
@@ -145,6 +195,36 @@ class matcher(object):
         translation memory. If self.addpercentage is true (default) the match
         quality is given as a percentage in the notes.
         """
+        return self.buildunits(self.bestcandidates(text))
+
+    def matches_batch(self, texts, workers=None):
+        """Returns a list with the result of matches() for each of the given
+        source texts.
+
+        @type texts: list
+        @param texts: The texts that will be searched for in the translation
+        memory
+        @param workers: The number of processes to use. Every process receives
+        the candidates only once when it is started.
+        @rtype: list
+        @return: a list of lists of units, in the same order as texts
+        """
+        if not workers or workers <= 1 or len(texts) <= 1:
+            return [self.matches(text) for text in texts]
+        import multiprocessing
+        pool = multiprocessing.Pool(workers, _initworker, (self,))
+        try:
+            chunksize = max(1, len(texts) // (workers * 4))
+            results = pool.map(_matchworker, texts, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+        return [self.buildunits(result) for result in results]
+
+    def bestcandidates(self, text):
+        """Returns the best candidates for the given source text as a list of
+        (score, position) tuples with the best one first. The position is that
+        of the candidate in self.candidates."""
         bestcandidates = [(0.0, None)]*self.MAX_CANDIDATES
         #We use self.MIN_SIMILARITY, but if we already know we have max_candidates
         #that are better, we can adjust min_similarity upwards for speedup
@@ -157,11 +237,12 @@ class matcher(object):
 
         # minimum source string length to be considered
         startlength = self.getstartlength(min_similarity, text)
+        candidates = self.candidates
         startindex = 0
-        endindex = len(self.candidates.units)
+        endindex = len(candidates)
         while startindex < endindex:
             mid = (startindex + endindex) // 2
-            if sourcelen(self.candidates.units[mid]) < startlength:
+            if candidates.sourcelength(mid) < startlength:
                 startindex = mid + 1
             else:
                 endindex = mid
@@ -170,15 +251,29 @@ class matcher(object):
         stoplength = self.getstoplength(min_similarity, text)
         lowestscore = 0
 
-        for candidate in self.candidates.units[startindex:]:
-            cmpstring = candidate.source
-            if len(cmpstring) > stoplength:
+        # With the q-gram index we can skip candidates that don't share enough
+        # q-grams with the text to reach min_similarity. We only do this if
+        # the comparer won't truncate the strings.
+        shared = None
+        if self.index is not None and len(text) <= self.comparer.MAX_LEN:
+            shared = self.index.shared(text, startlength, stoplength)
+
+        for index in xrange(startindex, len(candidates)):
+            cmplength = candidates.sourcelength(index)
+            if cmplength > stoplength:
                 break
-            similarity = self.comparer.similarity(text, cmpstring, min_similarity)
+            if shared is not None:
+                longest = max(len(text), cmplength)
+                if longest <= self.comparer.MAX_LEN:
+                    # the biggest distance that still gives min_similarity
+                    maxdistance = int(longest * (100 - min_similarity) / 100.0 + 1e-6)
+                    if shared.get(candidates.sourceid(index), 0) < self.index.lowerbound(len(text), cmplength, maxdistance):
+                        continue
+            similarity = self.comparer.similarity(text, candidates.source(index), min_similarity)
             if similarity < min_similarity:
                 continue
             if similarity > lowestscore:
-                heapq.heapreplace(bestcandidates, (similarity, candidate))
+                heapq.heapreplace(bestcandidates, (similarity, index))
                 lowestscore = bestcandidates[0][0]
                 if lowestscore >= 100:
                     break
@@ -193,12 +288,16 @@ class matcher(object):
         bestcandidates = filter(notzero, bestcandidates)
         #Sort for use as a general list, and reverse so the best one is at index 0
         bestcandidates.sort(reverse=True)
-        return self.buildunits(bestcandidates)
+        return bestcandidates
 
     def buildunits(self, candidates):
-        """Builds a list of units conforming to base API, with the score in the comment"""
+        """Builds a list of units conforming to base API, with the score in the comment
+
+        @param candidates: (score, position) tuples as given by bestcandidates()
+        """
         units = []
-        for score, candidate in candidates:
+        for score, index in candidates:
+            candidate = self.candidates.unit(index)
             if hasattr(candidate, "orig_source"):
                 candidate.source = candidate.orig_source
                 candidate.target = candidate.orig_target
@@ -242,6 +341,10 @@ class terminologymatcher(matcher):
         self.addpercentage = False
         self.match_info = {}
 
+    def newcandidates(self):
+        """We modify our candidates, so we need full units."""
+        return candidatestore.UnitCandidateStore()
+
     def inittm(self, store):
         """Normal initialisation, but convert all source strings to lower case"""
         matcher.inittm(self, store)
@@ -279,6 +382,10 @@ class terminologymatcher(matcher):
         l = len(context_re.sub("", unit.source))
         return l <= self.MAX_LENGTH and l >= self.getstartlength(None, None)
 
+    def matches_batch(self, texts, workers=None):
+        """Terminology matching is cheap, so we always do it in this process."""
+        return [self.matches(text) for text in texts]
+
     def matches(self, text):
         """Normal matching after converting text to lower case. Then replace
         with the original unit to retain comments, etc."""
@@ -298,6 +405,20 @@ class terminologymatcher(matcher):
         return matches
 
 
+# The matcher of a worker process in matches_batch()
+_workermatcher = None
+
+def _initworker(tmmatcher):
+    """Initialises a worker process of matcher.matches_batch()"""
+    global _workermatcher
+    _workermatcher = tmmatcher
+
+def _matchworker(text):
+    """Returns the best candidates for text as (score, position) tuples, so
+    that we don't have to send units back to the parent process."""
+    return _workermatcher.bestcandidates(text)
+
+
 # utility functions used by virtaal and tmserver to convert matching units in easily marshallable dictionaries
 def unit2dict(unit):
     """converts a pounit to a simple dict structure for use over the web"""
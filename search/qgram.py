@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009 Zuza Software Foundation
+#
+# This file is part of translate.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""An inverted q-gram index used to prune candidates before calculating
+edit distances.
+
+Two strings with a Levenshtein distance of at most k share at least
+max(len(a), len(b)) - q + 1 - k*q of their q-grams (counted with
+multiplicity). Candidates sharing fewer q-grams with the text can therefore
+never reach the required similarity and don't need to be compared at all.
+"""
+
+
+def qgrams(text, q=3):
+    """Returns a dictionary with the q-grams of text and their counts."""
+    profile = {}
+    for i in range(len(text) - q + 1):
+        gram = text[i:i+q]
+        profile[gram] = profile.get(gram, 0) + 1
+    return profile
+
+
+class QGramIndex:
+    """An inverted index of the q-grams of a set of strings. The postings of
+    every q-gram are kept in buckets by the length of the indexed strings,
+    so that lookups can ignore strings outside a range of lengths."""
+
+    def __init__(self, q=3):
+        self.q = q
+        self.postings = {}
+        self.indexed = set()
+
+    def add(self, text, key=None):
+        """Adds text to the index under the given key (the text itself by
+        default). Adding a key more than once has no effect."""
+        if key is None:
+            key = text
+        if key in self.indexed:
+            return
+        self.indexed.add(key)
+        length = len(text)
+        for gram, count in qgrams(text, self.q).iteritems():
+            self.postings.setdefault(gram, {}).setdefault(length, {})[key] = count
+
+    def shared(self, text, minlength=0, maxlength=None):
+        """Returns a dictionary mapping the key of every indexed string that
+        has any q-gram in common with text to the number of q-grams they
+        share. Only strings from minlength to maxlength characters long are
+        counted."""
+        common = {}
+        for gram, count in qgrams(text, self.q).iteritems():
+            for length, bucket in self.postings.get(gram, {}).iteritems():
+                if length < minlength or (maxlength is not None and length > maxlength):
+                    continue
+                for candidate, candidatecount in bucket.iteritems():
+                    common[candidate] = common.get(candidate, 0) + min(count, candidatecount)
+        return common
+
+    def lowerbound(self, length1, length2, maxdistance):
+        """Returns the minimum number of q-grams that strings of the given
+        lengths must share to be within maxdistance of each other."""
+        return max(length1, length2) - self.q + 1 - maxdistance * self.q
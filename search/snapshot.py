@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009 Zuza Software Foundation
+#
+# This file is part of translate.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""Snapshots of the sorted candidates of a translation memory matcher.
+
+Building a L{matcher<match.matcher>} means parsing all the TM files, removing
+duplicates and sorting the candidates. A snapshot stores the result in a
+compact binary file that can be memory mapped, so that the next start only
+needs to read the candidates that are actually compared. A L{CandidateList}
+can be used by a matcher like any other candidate store (see
+L{candidatestore}).
+
+The file consists of a header, metadata (in JSON) describing the TM files
+the snapshot was built from, a table with the length of every source string
+(for the binary search in the matcher), a table with the offset of every
+record, and the records themselves.
+"""
+
+import mmap
+import os
+import struct
+try:
+    import json #available since Python 2.6
+except ImportError:
+    import simplejson as json #API compatible with the json module
+
+from translate.storage import base
+from translate.misc.multistring import multistring
+
+SNAPSHOT_VERSION = 1
+"""The version of the file format. Snapshots with another version are
+considered stale."""
+
+MAGIC = "TTKTMSNP"
+
+_header = struct.Struct("<8sIIQ")
+_length = struct.Struct("<I")
+_offset = struct.Struct("<Q")
+_flags = struct.Struct("<B")
+
+FLAG_FUZZY = 1
+FLAG_PLURAL = 2
+
+
+def fileinfo(tmfiles):
+    """Returns a list with the absolute path, modification time and size of
+    each of the given files."""
+    info = []
+    for tmfile in tmfiles:
+        stat = os.stat(tmfile)
+        info.append([os.path.abspath(tmfile), stat.st_mtime, stat.st_size])
+    return info
+
+def _packstring(text):
+    data = text.encode("utf-8")
+    return _length.pack(len(data)) + data
+
+def _packunit(unit):
+    """Returns the record for a candidate unit."""
+    flags = 0
+    if getattr(unit, "fuzzy", False):
+        flags |= FLAG_FUZZY
+    orig_source = getattr(unit, "orig_source", None)
+    if orig_source is not None:
+        flags |= FLAG_PLURAL
+    parts = [_flags.pack(flags), _packstring(unit.source), _packstring(unit.target), _packstring(unit.getnotes())]
+    if orig_source is not None:
+        for strings in (orig_source.strings, unit.orig_target.strings):
+            parts.append(_length.pack(len(strings)))
+            parts.extend([_packstring(string) for string in strings])
+    return "".join(parts)
+
+def save(filename, units, tmfiles=(), usefuzzy=False):
+    """Writes a snapshot of the given (sorted) candidate units.
+
+    @param tmfiles: The files the candidates were read from. The snapshot is
+    stale as soon as any of them changes.
+    @param usefuzzy: Whether fuzzy units were used as candidates
+    """
+    meta = json.dumps({"files": fileinfo(tmfiles), "usefuzzy": usefuzzy})
+    lengths = []
+    offsets = []
+    records = []
+    position = 0
+    for unit in units:
+        record = _packunit(unit)
+        lengths.append(_length.pack(len(unit.source)))
+        offsets.append(_offset.pack(position))
+        records.append(record)
+        position += len(record)
+    offsets.append(_offset.pack(position))
+    # We write to a temporary file first so that a process that opens the
+    # snapshot at the same time never sees half a file.
+    tempname = "%s.%d.tmp" % (filename, os.getpid())
+    snapshotfile = open(tempname, "wb")
+    try:
+        snapshotfile.write(_header.pack(MAGIC, SNAPSHOT_VERSION, len(lengths), len(meta)))
+        snapshotfile.write(meta)
+        snapshotfile.write("".join(lengths))
+        snapshotfile.write("".join(offsets))
+        for record in records:
+            snapshotfile.write(record)
+    finally:
+        snapshotfile.close()
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(tempname, filename)
+
+
+class CandidateList(object):
+    """A read-only list of the candidate units in a snapshot file.
+
+    The file is only opened when it is first needed, and units are only
+    created for the records that are accessed."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._map = None
+
+    def _open(self):
+        snapshotfile = open(self.filename, "rb")
+        try:
+            self._map = mmap.mmap(snapshotfile.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            snapshotfile.close()
+        magic, version, count, metalength = _header.unpack_from(self._map, 0)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError("%s is not a translation memory snapshot of version %d" % (self.filename, SNAPSHOT_VERSION))
+        self._count = count
+        self._meta = json.loads(self._map[_header.size:_header.size + metalength])
+        self._lengths = _header.size + metalength
+        self._offsets = self._lengths + count * _length.size
+        self._records = self._offsets + (count + 1) * _offset.size
+
+    def _getmap(self):
+        if self._map is None:
+            self._open()
+        return self._map
+    map = property(_getmap)
+
+    def _getmeta(self):
+        self._getmap()
+        return self._meta
+    meta = property(_getmeta)
+
+    def close(self):
+        """Closes the memory map. It is opened again when needed."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        self._getmap()
+        return self._count
+
+    def sourcelength(self, index):
+        """Returns the length of the source string of the given candidate
+        without reading the record."""
+        return _length.unpack_from(self.map, self._lengths + index * _length.size)[0]
+
+    def sourceid(self, index):
+        """Returns a key for the source text of the given candidate. Sources
+        are not interned in a snapshot, so this is simply the position."""
+        return index
+
+    def source(self, index):
+        """Returns the source text of the given candidate."""
+        snapshotmap = self.map
+        position = self._records + _offset.unpack_from(snapshotmap, self._offsets + index * _offset.size)[0]
+        return self._readstring(position + _flags.size)[0]
+
+    def unit(self, index):
+        """Creates a unit for the given candidate."""
+        return self._readunit(index)
+
+    def _readstring(self, position):
+        length = _length.unpack_from(self._map, position)[0]
+        position += _length.size
+        return self._map[position:position + length].decode("utf-8"), position + length
+
+    def _readunit(self, index):
+        snapshotmap = self.map
+        position = self._records + _offset.unpack_from(snapshotmap, self._offsets + index * _offset.size)[0]
+        flags = _flags.unpack_from(snapshotmap, position)[0]
+        position += _flags.size
+        source, position = self._readstring(position)
+        target, position = self._readstring(position)
+        notes, position = self._readstring(position)
+        unit = base.TranslationUnit(source)
+        unit.target = target
+        unit.addnote(notes)
+        unit.fuzzy = bool(flags & FLAG_FUZZY)
+        if flags & FLAG_PLURAL:
+            plurals = []
+            for i in range(2):
+                count = _length.unpack_from(snapshotmap, position)[0]
+                position += _length.size
+                strings = []
+                for j in range(count):
+                    string, position = self._readstring(position)
+                    strings.append(string)
+                plurals.append(multistring(strings))
+            unit.orig_source, unit.orig_target = plurals
+        return unit
+
+    def _iterunits(self, indices):
+        for index in indices:
+            yield self._readunit(index)
+
+    def __getitem__(self, index):
+        """Returns the unit at the given index."""
+        if isinstance(index, slice):
+            return [self._readunit(i) for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("candidate index out of range")
+        return self._readunit(index)
+
+    def __iter__(self):
+        return self._iterunits(xrange(len(self)))
+
+    def _getunits(self):
+        return self
+    units = property(_getunits, doc="The candidates as a read-only sequence of units")
+
+    def isstale(self, tmfiles, usefuzzy=False):
+        """Returns whether the snapshot doesn't correspond to the given TM
+        files (anymore), or doesn't exist."""
+        if not os.path.exists(self.filename):
+            return True
+        try:
+            meta = self.meta
+        except (ValueError, struct.error, EnvironmentError):
+            return True
+        try:
+            # compare what JSON gives us for the current files
+            files = json.loads(json.dumps(fileinfo(tmfiles)))
+            return meta["files"] != files or meta["usefuzzy"] != usefuzzy
+        except EnvironmentError:
+            return True
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from translate.search import candidatestore
+from translate.misc.multistring import multistring
+
+class TestCandidateStore:
+    """Test the columnar candidate store"""
+    def test_add(self):
+        """Test adding and reading candidates"""
+        store = candidatestore.CandidateStore()
+        store.add(u"Open file", u"Maak lêer oop", u"a note", fuzzy=True)
+        store.add(u"Close", u"Sluit")
+        assert len(store) == 2
+        assert store.source(0) == u"Open file"
+        assert store.sourcelength(0) == 9
+        unit = store.unit(0)
+        assert unit.source == u"Open file"
+        assert unit.target == u"Maak lêer oop"
+        assert unit.getnotes() == u"a note"
+        assert unit.fuzzy
+        assert not hasattr(unit, "orig_source")
+        unit = store[1]
+        assert unit.target == u"Sluit"
+        assert unit.getnotes() == u""
+        assert not unit.fuzzy
+        assert [unit.source for unit in store.units] == [u"Open file", u"Close"]
+
+    def test_intern(self):
+        """Test that equal strings are only stored once"""
+        store = candidatestore.CandidateStore()
+        store.add(u"File", u"Lêer")
+        store.add(u"Files", u"Lêer")
+        assert store.intern(u"Lêer") == store.intern("L\xc3\xaaer")
+        assert store.sourceid(0) != store.sourceid(1)
+        assert store.sourceid(0) == store.intern(u"File")
+        assert store.string(store.intern(u"New")) == u"New"
+
+    def test_plurals(self):
+        """Test that plural candidates keep all their strings"""
+        store = candidatestore.CandidateStore()
+        store.add(multistring([u"%d file", u"%d files"]), multistring([u"%d lêer", u"%d lêers"]))
+        unit = store.unit(0)
+        assert unit.source == u"%d file"
+        assert unit.target == u"%d lêer"
+        assert unit.orig_source.strings == [u"%d file", u"%d files"]
+        assert unit.orig_target.strings == [u"%d lêer", u"%d lêers"]
+
+    def test_sort(self):
+        """Test that sorting is stable and keeps the columns together"""
+        store = candidatestore.CandidateStore()
+        store.add(u"Longer text", u"Langer teks")
+        store.add(u"abc", u"1")
+        store.add(multistring([u"%d cat", u"%d cats"]), multistring([u"%d kat", u"%d katte"]))
+        store.add(u"xyz", u"2", fuzzy=True)
+        store.sort()
+        assert [store.source(i) for i in range(len(store))] == [u"abc", u"xyz", u"%d cat", u"Longer text"]
+        assert store.unit(1).fuzzy
+        assert store.unit(2).orig_target.strings == [u"%d kat", u"%d katte"]
+        store.sort(reverse=True)
+        assert [store.source(i) for i in range(len(store))] == [u"Longer text", u"%d cat", u"abc", u"xyz"]
@@ -32,3 +32,28 @@ class TestLevenshtein:
         assert levenshtein.similarity(sentence, sentence[0:62], 0) > 25
         assert levenshtein.similarity(sentence, sentence[0:62], 0) < 50
 
+
+    def test_bounded_distance(self):
+        """Tests that the bounded distance functions stop early correctly"""
+        long1 = "A long, dreary sentence about a cow that never new his mother."
+        long2 = "A long, weary sentence about a cow that never knew its mother!"
+        for distance in (lshtein.python_distance, lshtein.banded_distance, lshtein.myers_distance):
+            assert distance("word", "word", 0) == 0
+            assert distance("word", "woord", 1) == 1
+            assert distance("word", "wood", 0) > 0
+            assert distance("kitten", "sitting") == 3
+            assert distance("kitten", "sitting", 3) == 3
+            assert distance("kitten", "sitting", 2) > 2
+            assert distance("", "word", 2) > 2
+            assert distance(long1, long2) == 6
+            assert distance(long1, long2, 6) == 6
+            assert distance(long1, long2, 5) > 5
+
+    def test_long_distance(self):
+        """Tests the distance of strings longer than MAX_WORD_BITS"""
+        a = "abcdefghij" * 10
+        b = "abcdefghij" * 5 + "abcdxfghij" * 5
+        assert lshtein.python_distance(a, b) == 5
+        assert lshtein.python_distance(a, b, 5) == 5
+        assert lshtein.python_distance(a, b, 4) > 4
+        assert lshtein.python_distance(a, b[1:], 10) == 6
@@ -78,6 +78,18 @@ class TestMatch:
         assert len(candidates) == 1
         assert candidates[0] == "Open file"
 
+    def test_matches_batch(self):
+        """Test that batch matching gives the same results as normal matching"""
+        csvfile = self.buildcsv(["hand", "asdf", "fdas", "haas", "pond", "Open file", "Close file"])
+        matcher = match.matcher(csvfile, max_candidates=1)
+        texts = ["hond", "Open files", "Nothing", "fdsa"]
+        expected = [self.candidatestrings(matcher.matches(text)) for text in texts]
+        for workers in (None, 2):
+            results = matcher.matches_batch(texts, workers=workers)
+            assert [self.candidatestrings(units) for units in results] == expected
+            assert results[1][0].target == "Open file"
+            assert results[1][0].getnotes() == "90%"
+
     def test_terminology(self):
         csvfile = self.buildcsv(["file", "computer", "directory"])
         matcher = match.terminologymatcher(csvfile)
@@ -126,3 +138,23 @@ class TestMatch:
         assert candidates == ["preorder"]
         candidates = self.candidatestrings(matcher.matches("You can pre order"))
         assert candidates == ["pre order"]
+
+    def test_index(self):
+        """Test that the q-gram index doesn't change the results"""
+        def results(units):
+            # candidates with equal scores can come back in any order
+            return sorted([(unit.source, unit.getnotes()) for unit in units])
+
+        sources = ["Open file", "Open files", "Open the file", "Close file",
+            "Save file as...", "Save all files", "Open a file...", "Opens file",
+            "file", "Undo", "Redo", "Open recent file", "Delete file"]
+        csvfile = self.buildcsv(sources)
+        plain = match.matcher(csvfile, max_candidates=20, min_similarity=50)
+        indexed = match.matcher(csvfile, max_candidates=20, min_similarity=50, useindex=True)
+        assert indexed.index is not None
+        for text in sources + ["Open file...", "Save file", "Undone", "fil"]:
+            assert results(indexed.matches(text)) == results(plain.matches(text))
+        csvfile2 = self.buildcsv(["Open file..."])
+        plain.extendtm(csvfile2.units)
+        indexed.extendtm(csvfile2.units)
+        assert results(indexed.matches("Open file...")) == results(plain.matches("Open file..."))
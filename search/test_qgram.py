@@ -0,0 +1,40 @@
+from translate.search import qgram
+from translate.search import lshtein
+
+class TestQGramIndex:
+    """Test the q-gram index"""
+    def test_qgrams(self):
+        """Test the q-gram profile of a string"""
+        assert qgram.qgrams("abcab", 2) == {"ab": 2, "bc": 1, "ca": 1}
+        assert qgram.qgrams("ab", 3) == {}
+
+    def test_shared(self):
+        """Test counting of shared q-grams"""
+        index = qgram.QGramIndex(q=2)
+        index.add("abab")
+        index.add("abcd")
+        index.add("abab")
+        shared = index.shared("abab")
+        assert shared == {"abab": 3, "abcd": 1}
+        assert "xyz" not in index.shared("xyz")
+
+    def test_shared_lengths(self):
+        """Test that only strings in the given range of lengths are counted"""
+        index = qgram.QGramIndex(q=2)
+        for string in ("ab", "abab", "ababab"):
+            index.add(string)
+        assert index.shared("abab", 3, 5) == {"abab": 3}
+        assert index.shared("abab", 4) == {"abab": 3, "ababab": 3}
+        assert index.shared("abab", maxlength=4) == {"ab": 1, "abab": 3}
+
+    def test_lowerbound(self):
+        """Test that the lower bound holds for some strings"""
+        index = qgram.QGramIndex()
+        strings = ["Open file", "Open files", "Close file", "pen fil", "file Open"]
+        for string in strings:
+            index.add(string)
+        for text in strings:
+            shared = index.shared(text)
+            for string in strings:
+                dist = lshtein.python_distance(text, string)
+                assert shared.get(string, 0) >= index.lowerbound(len(text), len(string), dist)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from translate.search import match
+from translate.search import snapshot
+from translate.storage import po
+
+tm_source = r'''msgid "Open file"
+msgstr "Maak lêer oop"
+
+# translator comment
+msgid "Close file"
+msgstr "Maak lêer toe"
+
+#, fuzzy
+msgid "Save file"
+msgstr "Stoor lêer"
+
+msgid "%d file"
+msgid_plural "%d files"
+msgstr[0] "%d lêer"
+msgstr[1] "%d lêers"
+'''
+
+def rm_rf(path):
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            os.remove(os.path.join(dirpath, filename))
+    os.removedirs(path)
+
+class TestSnapshot:
+    def get_test_path(self, method):
+        return os.path.realpath("%s_%s" % (self.__class__.__name__, method.__name__))
+
+    def setup_method(self, method):
+        self.path = self.get_test_path(method)
+        if os.path.exists(self.path):
+            rm_rf(self.path)
+        os.makedirs(self.path)
+        self.tmfile = os.path.join(self.path, "tm.po")
+        open(self.tmfile, "w").write(tm_source)
+        self.snapshotfile = os.path.join(self.path, "tm.snapshot")
+
+    def teardown_method(self, method):
+        if os.path.exists(self.path):
+            rm_rf(self.path)
+
+    def test_roundtrip(self):
+        """Test that the candidates survive a snapshot unchanged"""
+        tmmatcher = match.matcher(po.pofile(tm_source), usefuzzy=True)
+        tmmatcher.savesnapshot(self.snapshotfile, [self.tmfile])
+        candidates = snapshot.CandidateList(self.snapshotfile)
+        assert len(candidates) == len(tmmatcher.candidates.units) == 4
+        for original, loaded in zip(tmmatcher.candidates.units, candidates):
+            assert loaded.source == original.source
+            assert loaded.target == original.target
+            assert loaded.getnotes() == original.getnotes()
+            assert loaded.fuzzy == original.fuzzy
+            assert getattr(loaded, "orig_source", None) == getattr(original, "orig_source", None)
+            assert getattr(loaded, "orig_target", None) == getattr(original, "orig_target", None)
+        assert candidates.sourcelength(0) == len(candidates[0].source)
+        assert [unit.source for unit in candidates[2:]] == [candidates[2].source, candidates[3].source]
+        assert candidates[-1].source == candidates[3].source
+        candidates.close()
+
+    def test_matching(self):
+        """Test that a matcher gives the same results from a snapshot"""
+        tmmatcher = match.matcher(po.pofile(tm_source), usefuzzy=True, min_similarity=50)
+        tmmatcher.savesnapshot(self.snapshotfile, [self.tmfile])
+        loaded = match.matcher([], usefuzzy=True, min_similarity=50)
+        loaded.loadsnapshot(self.snapshotfile)
+        assert loaded.candidates.units._map is None
+        for text in ("Open files", "Save the file", "%d files", "Nothing"):
+            # candidates with equal scores can come back in any order
+            assert sorted([str(unit) for unit in loaded.matches(text)]) == sorted([str(unit) for unit in tmmatcher.matches(text)])
+        # we can still extend the TM afterwards, without adding the units
+        # that are already in it again
+        loaded.extendtm(po.pofile('msgid "Open a file"\nmsgstr "Maak \'n lêer oop"\n').units)
+        assert len(loaded.candidates.units) == 5
+        loaded.extendtm(po.pofile(tm_source).units)
+        assert len(loaded.candidates.units) == 5
+        assert loaded.matches("Open a file")[0].target == u"Maak 'n lêer oop"
+
+    def test_matching_index(self):
+        """Test that a matcher with an index still finds the candidates of a
+        snapshot after extending the TM"""
+        tmmatcher = match.matcher(po.pofile(tm_source), usefuzzy=True, min_similarity=50)
+        tmmatcher.savesnapshot(self.snapshotfile, [self.tmfile])
+        loaded = match.matcher([], usefuzzy=True, useindex=True)
+        loaded.loadsnapshot(self.snapshotfile)
+        loaded.extendtm(po.pofile('msgid "Open a file"\nmsgstr "Maak \'n lêer oop"\n').units)
+        assert loaded.matches("Close files")[0].target == u"Maak lêer toe"
+
+    def test_stale(self):
+        """Test that changes to the TM files make the snapshot stale"""
+        candidates = snapshot.CandidateList(self.snapshotfile)
+        assert candidates.isstale([self.tmfile])
+        tmmatcher = match.matcher(po.pofile(tm_source))
+        tmmatcher.savesnapshot(self.snapshotfile, [self.tmfile])
+        candidates = snapshot.CandidateList(self.snapshotfile)
+        assert not candidates.isstale([self.tmfile])
+        assert candidates.isstale([self.tmfile], usefuzzy=True)
+        assert candidates.isstale([])
+        mtime = os.stat(self.tmfile).st_mtime
+        os.utime(self.tmfile, (mtime + 10, mtime + 10))
+        assert candidates.isstale([self.tmfile])
+        candidates.close()
+
+    def test_bad_version(self):
+        """Test that a file that is not a snapshot is considered stale"""
+        open(self.snapshotfile, "w").write("Not a snapshot, but long enough for the header")
+        candidates = snapshot.CandidateList(self.snapshotfile)
+        assert candidates.isstale([self.tmfile])
@@ -31,6 +31,24 @@ server_url = 'http://localhost:1234/'
 server = xmlrpclib.Server(server_url)
 UnitClass = tbx.tbxunit
 
+def printmatches(text, candidates):
+    if len(candidates):
+        print "Likely matches:"
+        columnwidth = min(int(len(text)*1.3)+5, 35)
+        for score, original, translation in candidates:
+            print "%s %-*s | %s".encode('utf-8') % (score, columnwidth, original, translation)
+    else:
+        print "No likely matches found"
+
+if "--batch" in sys.argv:
+    # look up the matches for all lines at once
+    texts = [text.strip().decode("utf-8") for text in sys.stdin]
+    texts = [text for text in texts if text != ""]
+    for text, candidates in zip(texts, server.matchesbatch(texts)):
+        print text
+        printmatches(text, candidates)
+    sys.exit()
+
 text = sys.stdin.readline()
 while text:
     text = text.strip().decode("utf-8")
@@ -55,12 +73,5 @@ while text:
         candidates = server.matches(text)
         #alternate example, slightly faster:
         #candidates = server.matches(text, 5, 70)
-        if len(candidates):
-            print "Likely matches:"
-            columnwidth = min(int(len(text)*1.3)+5, 35)
-            for score, original, translation in candidates:
-                print "%s %-*s | %s".encode('utf-8') % (score, columnwidth, original, translation)
-        else:
-            print "No likely matches found"
+        printmatches(text, candidates)
     text = sys.stdin.readline()
-
@@ -33,7 +33,9 @@ from translate.storage import tmx
 from translate.storage import po
 from translate.storage import csvl10n
 from translate.search import match
+from translate.search import snapshot
 from translate.misc.multistring import multistring
+from translate.misc import lru
 
 from SimpleXMLRPCServer import SimpleXMLRPCServer
 from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler
@@ -44,12 +46,24 @@ class lookupRequestHandler(SimpleXMLRPCRequestHandler):
     # or perhaps the url can specify the file to be queried
 
 class lookupServer(SimpleXMLRPCServer):
-    def __init__(self, addr, storage):
-        """Loads the initial tbx file from the given filename"""
+    def __init__(self, addr, storage, tmsnapshot=None, filename=None, cache_size=1000):
+        """Loads the initial tbx file from the given filename
+
+        If tmsnapshot is given, the translation memory is loaded from that
+        snapshot file if it is up to date with the file filename, otherwise
+        the snapshot is (re)built. The results of the last cache_size
+        calls to matches are cached."""
         SimpleXMLRPCServer.__init__(self, addr, requestHandler=lookupRequestHandler, logRequests=1)
+        self.cache = lru.LRUCache(cache_size)
         self.storage = storage
         self.storage.makeindex()
-        self.matcher = match.matcher(storage)
+        self.matcher = match.matcher([])
+        if tmsnapshot and filename and not snapshot.CandidateList(tmsnapshot).isstale([filename]):
+            self.matcher.loadsnapshot(tmsnapshot)
+        else:
+            self.matcher.inittm(storage)
+            if tmsnapshot and filename:
+                self.matcher.savesnapshot(tmsnapshot, [filename])
         print "Performing lookup from %d units" % len(storage.units)
         print "Translation memory using %d units" % len(self.matcher.candidates.units)
 
@@ -98,9 +112,27 @@ class lookupServer(SimpleXMLRPCServer):
 
     def public_matches(self, message, max_candidates=15, min_similarity=50):
         """Returns matches from the storage with the associated similarity"""
-        self.matcher.setparameters(max_candidates=max_candidates, min_similarity=min_similarity)
         if not isinstance(message, unicode):
             message = unicode(message)
+        # the storage never changes, so cached results stay valid
+        key = (message, max_candidates, min_similarity)
+        clean_candidates = self.cache.get(key)
+        if clean_candidates is None:
+            clean_candidates = self.cache[key] = self.internal_matches(message, max_candidates, min_similarity)
+        return clean_candidates
+
+    def public_matchesbatch(self, messages, max_candidates=15, min_similarity=50):
+        """Returns the result of matches() for each of the messages, in the
+        same order, to save a request for every message"""
+        return [self.public_matches(message, max_candidates, min_similarity) for message in messages]
+
+    def public_cachestats(self):
+        """Returns the size of the matches cache and its hit and miss
+        counts"""
+        return self.cache.stats()
+
+    def internal_matches(self, message, max_candidates, min_similarity):
+        self.matcher.setparameters(max_candidates=max_candidates, min_similarity=min_similarity)
         candidates = self.matcher.matches(message)
         clean_candidates = []
         for unit in candidates:
@@ -126,7 +158,8 @@ class lookupOptionParser(convert.ConvertOptionParser):
         inputbase, inputext = self.splitinputext(options.input)
         asdf, storagebuilder = self.outputoptions[inputext, None]
         storage = storagebuilder(open(options.input))
-        server = lookupServer((options.address, int(options.port)), storage)
+        server = lookupServer((options.address, int(options.port)), storage, options.tmsnapshot, options.input,
+                              options.cache_size)
         try:
             server.serve_forever()
         except:
@@ -155,6 +188,10 @@ def main():
                       help="set target language code", metavar="LANG")
     parser.add_option("", "--source-language", dest="sourcelanguage", default='en',
                       help="set source language code", metavar="LANG")
+    parser.add_option("", "--tmsnapshot", dest="tmsnapshot", default=None,
+                      help="a file for keeping a snapshot of the translation memory, so that it loads faster next time")
+    parser.add_option("", "--cache-size", dest="cache_size", type="int", default=1000,
+                      help="the number of lookups to cache (default: 1000)")
     parser.remove_option("--output")
     parser.remove_option("--exclude")
     parser.passthrough.append("sourcelanguage")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from StringIO import StringIO
+from wsgiref import util
+import multiprocessing.dummy
+import threading
+import time
+try:
+    import json #available since Python 2.6
+except ImportError:
+    import simplejson as json #API compatible with the json module
+
+from translate.misc import lru
+from translate.services import tmserver
+from translate.storage import base
+
+class RacingCache(lru.LRUCache):
+    """A cache that lets a change to the TM happen while a lookup stores its
+    result"""
+    def __init__(self, server, *args):
+        lru.LRUCache.__init__(self, *args)
+        self.server = server
+        self.writers = []
+
+    def __setitem__(self, key, value):
+        if not self.writers:
+            writer = threading.Thread(target=self.server.write, args=(lambda slang, tlang: None, "en", "af"))
+            self.writers.append(writer)
+            writer.start()
+            time.sleep(0.1)
+        lru.LRUCache.__setitem__(self, key, value)
+
+class TestTMServer:
+    def setup_method(self, method):
+        self.server = tmserver.TMServer(":memory:", None)
+        self.server.tmdb.add_list([{"source": u"Open the file", "target": u"Maak die lêer oop", "context": u""}],
+                                  "en", "af")
+
+    def teardown_method(self, method):
+        self.server.close()
+
+    def request(self, method, path, body="", expected="200 OK"):
+        environ = {"REQUEST_METHOD": method, "PATH_INFO": path,
+                   "CONTENT_LENGTH": str(len(body)), "wsgi.input": StringIO(body)}
+        util.setup_testing_defaults(environ)
+        status = []
+        response = "".join(self.server.rest(environ, lambda *args: status.append(args[0])))
+        assert status == [expected]
+        if expected != "200 OK":
+            return response
+        return json.loads(response)
+
+    def test_translate_units(self):
+        """Test looking up many units in one request"""
+        sources = ["Open the files", "Nothing like it", "Open the file", "Open the files"]
+        results = self.request("POST", "/en/af/units", json.dumps(sources))
+        assert len(results) == 4
+        assert results[1] == []
+        assert results[2][0]["quality"] == 100
+        assert results[0] == results[3] == self.request("GET", "/en/af/unit/Open the files")
+        assert results[0][0]["target"] == u"Maak die lêer oop"
+
+    def test_translate_units_distinct(self):
+        """Test that every distinct source is only looked up once"""
+        looked = []
+        lookup = self.server.lookup
+        def countinglookup(source, slang, tlang):
+            looked.append(source)
+            return lookup(source, slang, tlang)
+        self.server.lookup = countinglookup
+        self.server.workers = 4
+        sources = ["Open the file", "Open the files", "Open the file", "Open the files"]
+        results = self.request("POST", "/en/af/units", json.dumps(sources))
+        assert sorted(looked) == ["Open the file", "Open the files"]
+        assert results[0] == results[2] and results[1] == results[3]
+        assert results[0][0]["quality"] == 100
+
+    def test_translate_units_invalid(self):
+        """Test that a body that isn't a list of strings is refused"""
+        for body in ("not json", '{"source": "Open the file"}', '"Open the file"', '["Open the file", 1]', '[null]'):
+            response = self.request("POST", "/en/af/units", body, expected="400 Bad Request")
+            assert response.startswith("400 Bad Request")
+
+    def test_cache(self):
+        """Test that repeated lookups come from the cache"""
+        first = self.server.lookup("Open the file", "en", "af")
+        assert first[0]["target"] == u"Maak die lêer oop"
+        assert self.server.lookup(u"Open the file", "en", "af") is first
+        assert self.server.lookup("Open the file", "en_US", "af") is not first
+        stats = self.server.cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 2)
+
+    def test_invalidation(self):
+        """Test that changes only invalidate lookups for the same
+        languages"""
+        assert len(self.server.lookup("Open the files", "en", "af")) == 1
+        assert len(self.server.lookup("Open the files", "en", "fr")) == 0
+        unit = base.TranslationUnit(u"Open the files")
+        unit.target = u"Ouvrir les fichiers"
+        self.server.write(self.server.tmdb.add_unit, "en", "fr", unit)
+        assert len(self.server.cache) == 1
+        assert self.server.lookup("Open the files", "en", "fr")[0]["quality"] == 100
+        unit.target = u"Maak die lêers oop"
+        self.server.write(self.server.tmdb.add_unit, "en", "af", unit)
+        assert len(self.server.lookup("Open the files", "en", "af")) == 2
+
+    def test_invalidation_race(self):
+        """Test that a lookup that finishes while a change is made isn't
+        cached after the change"""
+        self.server.cache = RacingCache(self.server, 10)
+        self.server.lookup("Open the file", "en", "af")
+        self.server.cache.writers[0].join()
+        assert len(self.server.cache) == 0
+
+    def test_lookup_pool(self):
+        """Test that concurrent batches share one pool of lookup threads"""
+        pools = []
+        Pool = multiprocessing.dummy.Pool
+        def slowpool(*args):
+            time.sleep(0.05)
+            pools.append(Pool(*args))
+            return pools[-1]
+        multiprocessing.dummy.Pool = slowpool
+        try:
+            threads = [threading.Thread(target=self.server.lookup_batch,
+                                        args=(["Open the file", "Open the files"], "en", "af"))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            multiprocessing.dummy.Pool = Pool
+        assert len(pools) == 1
@@ -25,6 +25,7 @@ with clients using JSON over HTTP."""
 import StringIO
 import logging
 import sys
+import threading
 from cgi import parse_qs
 from optparse import OptionParser
 try:
@@ -33,8 +34,10 @@ except ImportError:
     import simplejson as json #API compatible with the json module
 from wsgiref import simple_server
 
+from translate.misc import lru
 from translate.misc import selector
 from translate.misc import wsgi
+from translate.lang import data
 from translate.storage import factory
 from translate.storage import base
 from translate.storage import tmdb
@@ -43,9 +46,23 @@ class TMServer(object):
     """A RESTful JSON TM server."""
 
     def __init__(self, tmdbfile, tmfiles, max_candidates=3, min_similarity=75,
-            max_length=1000, prefix="", source_lang=None, target_lang=None):
+            max_length=1000, prefix="", source_lang=None, target_lang=None, workers=10,
+            cache_size=1000, cache_ttl=600):
 
-        self.tmdb = tmdb.TMDB(tmdbfile, max_candidates, min_similarity, max_length)
+        self.tmdb = tmdb.TMDB(tmdbfile, max_candidates, min_similarity, max_length,
+                              pool_size=workers)
+        # lookups run concurrently, all changes are made one at a time by
+        # the writer
+        self.writer = tmdb.WriteQueue()
+        # results of recent lookups, see lookup()
+        self.cache = lru.LRUCache(cache_size, cache_ttl)
+        self.cache_generation = 0
+        # held to store a lookup, and to change the generation and purge
+        self._cache_lock = threading.Lock()
+        self.workers = workers
+        # the threads for lookup_batch(), started on the first batch
+        self._lookup_pool = None
+        self._lookup_pool_lock = threading.Lock()
 
         #load files into db
         if isinstance(tmfiles, list):
@@ -69,19 +86,108 @@ class TMServer(object):
                       POST=self.add_store,
                       DELETE=self.forget_store)
 
+        self.rest.add("/{slang}/{tlang}/units",
+                      POST=self.translate_units)
+
+        self.rest.add("/stats", GET=self.get_stats)
+
+    def lookup(self, source, slang, tlang):
+        """Returns the TM suggestions for source, from the cache if they
+        were looked up recently."""
+        if isinstance(source, str):
+            source = unicode(source, "utf-8")
+        key = (source, _langs(slang), _langs(tlang),
+               self.tmdb.min_similarity, self.tmdb.max_candidates)
+        candidates = self.cache.get(key)
+        if candidates is None:
+            generation = self.cache_generation
+            candidates = self.tmdb.translate_unit(source, slang, tlang)
+            # don't cache results that might predate a change made while we
+            # were looking them up
+            self._cache_lock.acquire()
+            try:
+                if generation == self.cache_generation:
+                    self.cache[key] = candidates
+            finally:
+                self._cache_lock.release()
+        return candidates
+
+    def lookup_batch(self, sources, slang, tlang):
+        """Returns the TM suggestions for each of the sources, in the same
+        order. Every distinct source is only looked up once, and the lookups
+        are spread over a pool of threads."""
+        distinct = []
+        positions = {}
+        for source in sources:
+            if source not in positions:
+                positions[source] = len(distinct)
+                distinct.append(source)
+        candidates = self._lookup_distinct(distinct, slang, tlang)
+        return [candidates[positions[source]] for source in sources]
+
+    def _lookup_distinct(self, sources, slang, tlang):
+        if len(sources) <= 1 or self.workers <= 1:
+            return [self.lookup(source, slang, tlang) for source in sources]
+        if self._lookup_pool is None:
+            # requests are served by several threads at the same time
+            self._lookup_pool_lock.acquire()
+            try:
+                if self._lookup_pool is None:
+                    from multiprocessing.dummy import Pool
+                    self._lookup_pool = Pool(self.workers)
+            finally:
+                self._lookup_pool_lock.release()
+        return self._lookup_pool.map(lambda source: self.lookup(source, slang, tlang), sources)
+
+    def write(self, function, slang, tlang, *args):
+        """Runs a change to the database in the writer, and forgets cached
+        lookups for the same languages."""
+        # lookups that started before the change aren't cached...
+        self._cache_lock.acquire()
+        try:
+            self.cache_generation += 1
+        finally:
+            self._cache_lock.release()
+        try:
+            return self.writer.submit(function, *(args + (slang, tlang)))
+        finally:
+            # ...and neither are the ones that started during it
+            langs = _langs(slang), _langs(tlang)
+            self._cache_lock.acquire()
+            try:
+                self.cache_generation += 1
+                self.cache.purge(lambda key: set(key[1]) & set(langs[0]) and set(key[2]) & set(langs[1]))
+            finally:
+                self._cache_lock.release()
+
+    def close(self):
+        """Finishes all pending changes to the database and closes it."""
+        if self._lookup_pool is not None:
+            self._lookup_pool.close()
+            self._lookup_pool.join()
+        self.writer.close()
+        self.tmdb.close()
+
     @selector.opliant
     def translate_unit(self, environ, start_response, uid, slang, tlang):
         start_response("200 OK", [('Content-type', 'text/plain')])
-        candidates = self.tmdb.translate_unit(uid, slang, tlang)
+        candidates = self.lookup(uid, slang, tlang)
         logging.debug("candidates: %s", unicode(candidates))
-        response = json.dumps(candidates, indent=4)
-        params = parse_qs(environ.get('QUERY_STRING', ''))
+        return [_jsonresponse(environ, candidates)]
+
+    @selector.opliant
+    def translate_units(self, environ, start_response, slang, tlang):
+        """return TM suggestions for a JSON list of source strings, as a list
+        of suggestion lists in the same order"""
         try:
-            callback = params.get('callback', [])[0]
-            response = "%s(%s)" % (callback, response)
-        except IndexError:
-            pass
-        return [response]
+            sources = json.loads(environ['wsgi.input'].read(int(environ['CONTENT_LENGTH'])))
+        except ValueError:
+            return _badrequest(start_response, "The body is not valid JSON.")
+        if not isinstance(sources, list) or [source for source in sources if not isinstance(source, basestring)]:
+            return _badrequest(start_response, "The body must be a JSON list of strings.")
+        start_response("200 OK", [('Content-type', 'text/plain')])
+        candidates = self.lookup_batch(sources, slang, tlang)
+        return [_jsonresponse(environ, candidates)]
 
     @selector.opliant
     def add_unit(self, environ, start_response, uid, slang, tlang):
@@ -90,7 +196,7 @@ class TMServer(object):
         data = json.loads(environ['wsgi.input'].read(int(environ['CONTENT_LENGTH'])))
         unit = base.TranslationUnit(data['source'])
         unit.target = data['target']
-        self.tmdb.add_unit(unit, slang, tlang)
+        self.write(self.tmdb.add_unit, slang, tlang, unit)
         return [""]
 
     @selector.opliant
@@ -100,7 +206,7 @@ class TMServer(object):
         data = json.loads(environ['wsgi.input'].read(int(environ['CONTENT_LENGTH'])))
         unit = base.TranslationUnit(data['source'])
         unit.target = data['target']
-        self.tmdb.add_unit(unit, slang, tlang)
+        self.write(self.tmdb.add_unit, slang, tlang, unit)
         return [""]
 
     @selector.opliant
@@ -126,7 +232,7 @@ class TMServer(object):
         data = StringIO.StringIO(environ['wsgi.input'].read(int(environ['CONTENT_LENGTH'])))
         data.name = sid
         store = factory.getobject(data)
-        count = self.tmdb.add_store(store, slang, tlang)
+        count = self.write(self.tmdb.add_store, slang, tlang, store)
         response = "added %d units from %s" % (count, sid)
         return [response]
 
@@ -135,7 +241,7 @@ class TMServer(object):
         """Add unit from POST data to tmdb."""
         start_response("200 OK", [('Content-type', 'text/plain')])
         units = json.loads(environ['wsgi.input'].read(int(environ['CONTENT_LENGTH'])))
-        count = self.tmdb.add_list(units, slang, tlang)
+        count = self.write(self.tmdb.add_list, slang, tlang, units)
         response = "added %d units from %s" % (count, sid)
         return [response]
 
@@ -147,6 +253,38 @@ class TMServer(object):
 
         return [response]
 
+    @selector.opliant
+    def get_stats(self, environ, start_response):
+        """return the hit and miss counts of the lookup cache"""
+        start_response("200 OK", [('Content-type', 'text/plain')])
+        return [json.dumps({"cache": self.cache.stats()})]
+
+
+def _jsonresponse(environ, data):
+    """serialises data as compact JSON, wrapped in the JSONP callback given
+    in the query string, if any"""
+    response = json.dumps(data, separators=(',', ':'))
+    params = parse_qs(environ.get('QUERY_STRING', ''))
+    try:
+        callback = params.get('callback', [])[0]
+        response = "%s(%s)" % (callback, response)
+    except IndexError:
+        pass
+    return response
+
+
+def _badrequest(start_response, message):
+    """responds with a 400 and the reason"""
+    start_response("400 Bad Request", [('Content-type', 'text/plain')])
+    return ["400 Bad Request\n\n" + message]
+
+
+def _langs(langs):
+    """normalises a language or list of languages to a tuple of codes"""
+    if not isinstance(langs, list):
+        langs = [langs]
+    return tuple([data.normalize_code(lang) for lang in langs])
+
 
 def main():
     parser = OptionParser()
@@ -162,12 +300,18 @@ def main():
                       help="adress to bind server to (default: localhost)")
     parser.add_option("-p", "--port", dest="port", type="int", default=8888,
                       help="port to listen on (default: 8888)")
+    parser.add_option("-j", "--workers", dest="workers", type="int", default=10,
+                      help="number of requests to handle concurrently (default: 10)")
     parser.add_option("--max-candidates", dest="max_candidates", type="int", default=3,
                       help="Maximum number of candidates")
     parser.add_option("--min-similarity", dest="min_similarity", type="int", default=75,
                       help="minimum similarity")
     parser.add_option("--max-length", dest="max_length", type="int", default=1000,
                       help="Maxmimum string length")
+    parser.add_option("--cache-size", dest="cache_size", type="int", default=1000,
+                      help="number of lookups to cache, 0 to disable caching (default: 1000)")
+    parser.add_option("--cache-ttl", dest="cache_ttl", type="int", default=600,
+                      help="seconds to cache lookups for, 0 for no limit (default: 600)")
     parser.add_option("--debug", action="store_true", dest="debug", default=False,
                       help="enable debugging features")
 
@@ -191,8 +335,13 @@ def main():
 
     application = TMServer(options.tmdbfile, options.tmfiles, max_candidates=options.max_candidates,
                            min_similarity=options.min_similarity, max_length=options.max_length,
-                           prefix="/tmserver", source_lang=options.source_lang, target_lang=options.target_lang)
-    wsgi.launch_server(options.bind, options.port, application.rest)
+                           prefix="/tmserver", source_lang=options.source_lang, target_lang=options.target_lang,
+                           workers=options.workers, cache_size=options.cache_size,
+                           cache_ttl=options.cache_ttl)
+    try:
+        wsgi.launch_server(options.bind, options.port, application.rest, options.workers)
+    finally:
+        application.close()
 
 
 if __name__ == '__main__':
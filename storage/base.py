@@ -668,6 +668,14 @@ class TranslationStore(object):
         self.fileobj = fileobj
         return dump
 
+    def serialize(self, fileobj):
+        """Writes the string representation to the given file object.
+
+        This is the same as writing C{str(self)}, but stores that can write
+        themselves piece by piece override it to avoid building the whole
+        file in memory."""
+        fileobj.write(str(self))
+
     def isempty(self):
         """Returns True if the object doesn't contain any translation units."""
         if len(self.units) == 0:
@@ -708,8 +716,7 @@ class TranslationStore(object):
             storefile = open(storefile, mode)
         self.fileobj = storefile
         self._assignname()
-        storestring = str(self)
-        storefile.write(storestring)
+        self.serialize(storefile)
         storefile.close()
 
     def save(self):
@@ -752,3 +759,12 @@ class TranslationStore(object):
         newstore._assignname()
         return newstore
     parsefile = classmethod(parsefile)
+
+    def iterparsefile(cls, storefile):
+        """Reads the given file (or opens the given filename) and yields its
+        units one by one. This implementation parses the whole file first;
+        formats that can parse incrementally override it so that huge files
+        don't need to be held in memory."""
+        for unit in cls.parsefile(storefile).units:
+            yield unit
+    iterparsefile = classmethod(iterparsefile)
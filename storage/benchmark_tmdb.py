@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009 Zuza Software Foundation
+#
+# This file is part of translate.
+#
+# translate is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# translate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with translate; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Benchmarks tmdb lookups against the old approach of scoring every row in
+the length window and sorting all of them.
+
+usage: benchmark_tmdb.py [units] [queries] [max_candidates]
+"""
+
+import os
+import random
+import sys
+import time
+
+from translate.storage import tmdb
+
+words = ["file", "open", "close", "save", "the", "a", "new", "document",
+         "window", "edit", "view", "help", "tools", "print", "preview",
+         "settings", "could", "not", "be", "found", "error", "while",
+         "loading", "%s", "folder", "name", "select", "all", "copy", "paste"]
+
+def sentence(length):
+    return " ".join([random.choice(words) for i in range(length)])
+
+def variation(text):
+    """changes one word of text, like a string changed in a new version"""
+    text = text.split()
+    text[random.randrange(len(text))] = random.choice(words)
+    return " ".join(text)
+
+def unheaped_translate_unit(db, unit_source, source_lang, target_lang):
+    """the lookup before the top-k heap: score all rows, sort, truncate"""
+    minlen = tmdb.min_levenshtein_length(len(unit_source), db.min_similarity)
+    maxlen = tmdb.max_levenshtein_length(len(unit_source), db.min_similarity, db.max_length)
+    query = """SELECT s.text, t.text, s.context, s.lang, t.lang FROM sources s JOIN targets t ON s.sid = t.sid
+    WHERE s.lang IN (?) AND t.lang IN (?) AND s.length >= ? AND s.length <= ?"""
+    cursor = db.connection.cursor()
+    cursor.execute(query, (source_lang, target_lang, minlen, maxlen))
+    results = []
+    for row in cursor:
+        quality = db.comparer.similarity(unit_source, row[0], db.min_similarity)
+        if quality >= db.min_similarity:
+            results.append({'source': row[0], 'target': row[1], 'context': row[2], 'quality': quality})
+    results.sort(key=lambda match: match['quality'], reverse=True)
+    return results[:db.max_candidates]
+
+def benchmark(num_units=20000, num_queries=200, max_candidates=3):
+    random.seed(20090101)
+    dbfile = "benchmark_tmdb.db"
+    if os.path.exists(dbfile):
+        os.remove(dbfile)
+    db = tmdb.TMDB(dbfile, max_candidates=max_candidates, min_similarity=50)
+    loader = db.bulk_loader()
+    sources = [sentence(random.randint(2, 8)) for i in range(num_units)]
+    for i, source in enumerate(sources):
+        loader.add_dict({"source": source, "target": "x%d" % i, "context": ""}, "en", "af")
+    loader.commit()
+    # plain lookups, no fulltext search
+    db.fulltext = False
+    # most lookups are for strings close to ones in the TM
+    queries = [variation(random.choice(sources)) for i in range(num_queries * 3 / 4)]
+    queries += [sentence(random.randint(2, 8)) for i in range(num_queries - len(queries))]
+
+    start = time.time()
+    expected = [unheaped_translate_unit(db, query, "en", "af") for query in queries]
+    unheaped = time.time() - start
+    start = time.time()
+    results = [db.translate_unit(query, "en", "af") for query in queries]
+    heaped = time.time() - start
+
+    for old, new in zip(expected, results):
+        assert [match["quality"] for match in old] == [match["quality"] for match in new]
+    print "%d units, %d queries, %d candidates" % (num_units, num_queries, max_candidates)
+    print "score and sort all rows: %.2fs" % unheaped
+    print "top-k heap:              %.2fs (%.1fx)" % (heaped, unheaped / heaped)
+    db.close()
+    os.remove(dbfile)
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:]])
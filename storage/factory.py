@@ -29,7 +29,9 @@ try:
 except ImportError:
     BZ2File = None
 import sys
+import types
 
+from translate.misc.lru import LRUCache
 from translate.storage import base
 from translate.storage import csvl10n
 from translate.storage import mo
@@ -106,6 +108,10 @@ def _examine_txt(storefile):
 
 hiddenclasses = {"txt": _examine_txt}
 
+# only stores of the normal classes are cached
+_defaultclasses = classes
+_defaulthiddenclasses = hiddenclasses
+
 def _guessextention(storefile):
     """Guesses the type of a file object by looking at the first few characters.
     The return value is a file extention ."""
@@ -167,11 +173,173 @@ def getclass(storefile, ignore=None, classes=classes, hiddenclasses=hiddenclasse
         raise ValueError("Unknown filetype (%s)" % storefilename)
     return storeclass
 
-def getobject(storefile, ignore=None, classes=classes, hiddenclasses=hiddenclasses):
+# the default memory budget of the store cache, in bytes of the files the
+# stores were parsed from
+STORE_CACHE_SIZE = 50 * 1024 * 1024
+
+_storecache = None
+
+def usecache(maxsize=STORE_CACHE_SIZE):
+    """Makes L{getobject} keep the stores that it parses from files for read
+    only use, so that asking for the same unchanged file again doesn't parse
+    it again. Stores are identified by the real path, the modification time
+    and the size of their file. When the files of the cached stores add up
+    to more than maxsize bytes, the least recently used stores are dropped.
+
+    The cache is for the whole process and is off by default. A maxsize of 0
+    turns it off again and drops all the cached stores.
+    """
+    global _storecache
+    if maxsize:
+        _storecache = LRUCache(maxsize)
+    else:
+        _storecache = None
+
+def cachestats():
+    """Returns a dictionary with the hits and misses of the store cache, the
+    number of cached stores (size) and the total bytes of their files
+    (used), or None if the cache isn't used."""
+    cache = _storecache
+    if cache is None:
+        return None
+    stats = cache.stats()
+    stats["used"] = cache.used
+    return stats
+
+class ReadOnlyError(Exception):
+    """Raised when something tries to change a store (or one of its units)
+    that L{getobject} shared from the store cache."""
+    pass
+
+# methods with these names (or names starting with these) change the store
+# or the unit that they are called on
+_changingprefixes = ("set", "add", "remove", "del", "update", "merge", "mark",
+                     "parse", "save", "insert", "init")
+_changingnames = ("makeobsolete", "resurrect")
+
+def _changes(name):
+    name = name.lstrip("_")
+    return name.startswith(_changingprefixes) or name in _changingnames
+
+def _unwrap(value):
+    if isinstance(value, (ReadOnlyStore, ReadOnlyUnit)):
+        return object.__getattribute__(value, "_real")
+    return value
+
+class ReadOnlyUnit(object):
+    """A view of a unit of a L{ReadOnlyStore} that can be read like the unit
+    itself, but raises L{ReadOnlyError} on any attempt to change it."""
+
+    __slots__ = ("_real",)
+
+    def __init__(self, unit):
+        object.__setattr__(self, "_real", unit)
+
+    def __class__(self):
+        return self._real.__class__
+    __class__ = property(__class__)
+
+    def __getattr__(self, name):
+        if _changes(name):
+            raise ReadOnlyError("Can't call %s() on a shared read only unit" % name)
+        return getattr(self._real, name)
+
+    def __setattr__(self, name, value):
+        raise ReadOnlyError("Can't set %s on a shared read only unit" % name)
+
+    def __delattr__(self, name):
+        raise ReadOnlyError("Can't delete %s from a shared read only unit" % name)
+
+    def __eq__(self, other):
+        return self._real == _unwrap(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._real)
+
+    def __str__(self):
+        return str(self._real)
+
+    def __repr__(self):
+        return repr(self._real)
+
+class ReadOnlyStore(object):
+    """A view of a store that can be read (and searched) like the store
+    itself, but raises L{ReadOnlyError} on any attempt to change the store or
+    its units. The store cache only hands out these views, so that no caller
+    can corrupt the store for the others."""
+
+    def __init__(self, store):
+        object.__setattr__(self, "_real", store)
+        object.__setattr__(self, "_views", {})
+        object.__setattr__(self, "units", tuple([self._view(unit) for unit in store.units]))
+
+    def __class__(self):
+        return self._real.__class__
+    __class__ = property(__class__)
+
+    def _view(self, unit):
+        view = self._views.get(id(unit))
+        if view is None:
+            view = self._views[id(unit)] = ReadOnlyUnit(unit)
+        return view
+
+    def _wrap(self, value):
+        if isinstance(value, base.TranslationUnit):
+            return self._view(value)
+        if isinstance(value, list):
+            return [self._wrap(item) for item in value]
+        if isinstance(value, types.GeneratorType):
+            return (self._wrap(item) for item in value)
+        return value
+
+    def __getattr__(self, name):
+        if _changes(name):
+            raise ReadOnlyError("Can't call %s() on a shared read only store" % name)
+        value = getattr(self._real, name)
+        if not callable(value) or isinstance(value, type):
+            return self._wrap(value)
+        def method(*args, **kwargs):
+            return self._wrap(value(*args, **kwargs))
+        return method
+
+    def __setattr__(self, name, value):
+        raise ReadOnlyError("Can't set %s on a shared read only store" % name)
+
+    def __delattr__(self, name):
+        raise ReadOnlyError("Can't delete %s from a shared read only store" % name)
+
+    def __str__(self):
+        return str(self._real)
+
+    def __repr__(self):
+        return "<read only %r>" % self._real
+
+def _getcached(cache, storefile, ignore):
+    realpath = os.path.realpath(storefile)
+    try:
+        stat = os.stat(realpath)
+    except OSError:
+        return getobject(storefile, ignore)
+    key = (realpath, stat.st_mtime, stat.st_size, ignore)
+    store = cache.get(key)
+    if store is None:
+        # older versions of the file will never be asked for again
+        cache.purge(lambda cachedkey: cachedkey[0] == realpath)
+        store = ReadOnlyStore(getobject(storefile, ignore))
+        cache.set(key, store, max(stat.st_size, 1))
+    return store
+
+def getobject(storefile, ignore=None, classes=classes, hiddenclasses=hiddenclasses, readonly=False):
     """Factory that returns a usable object for the type of file presented.
 
     @type storefile: file or str
     @param storefile: File object or file name.
+    @param readonly: The caller doesn't change the store, so that it can be
+    shared with other callers if the store cache is used (see L{usecache}).
+    The shared store is a L{ReadOnlyStore} that refuses any changes.
 
     Specify ignore to ignore some part at the back of the name (like .gz).
     """
@@ -182,6 +350,10 @@ def getobject(storefile, ignore=None, classes=classes, hiddenclasses=hiddenclass
         if os.path.isdir(storefile) or storefile.endswith(os.path.sep):
             from translate.storage import directory
             return directory.Directory(storefile)
+        cache = _storecache
+        if readonly and cache is not None and classes is _defaultclasses \
+           and hiddenclasses is _defaulthiddenclasses:
+            return _getcached(cache, storefile, ignore)
     storefilename = _getname(storefile)
     storeclass = getclass(storefile, ignore, classes=classes, hiddenclasses=hiddenclasses)
     if os.path.exists(storefilename) or not getattr(storefile, "closed", True):
@@ -195,6 +367,22 @@ def getobject(storefile, ignore=None, classes=classes, hiddenclasses=hiddenclass
         store.filename = storefilename
     return store
 
+def iterunits(storefile, ignore=None, classes=classes, hiddenclasses=hiddenclasses):
+    """Like L{getobject}, but yields the units of the file one by one. For
+    formats that can parse incrementally (like PO) only one unit at a time
+    is held in memory.
+
+    @type storefile: file or str
+    @param storefile: File object or file name.
+    """
+    storefilename = _getname(storefile)
+    storeclass = getclass(storefile, ignore, classes=classes, hiddenclasses=hiddenclasses)
+    name, ext = os.path.splitext(storefilename)
+    ext = ext[len(os.path.extsep):].lower()
+    if ext in decompressclass:
+        storefile = decompressclass[ext](storefilename)
+    return storeclass.iterparsefile(storefile)
+
 def supported_files():
     """Returns data about all supported files
 
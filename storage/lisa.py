@@ -349,6 +349,14 @@ class LISAfile(base.TranslationStore):
         return etree.tostring(self.document, pretty_print=True,
                               xml_declaration=True, encoding='utf-8')
 
+    def serialize(self, fileobj):
+        """Writes the file's XML to fileobj like L{__str__}, but lets lxml
+        write it out in pieces instead of building one big string"""
+        # lxml would write the encoding in uppercase in the declaration
+        fileobj.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        self.document.write(fileobj, pretty_print=True,
+                            xml_declaration=False, encoding='utf-8')
+
     def parse(self, xml):
         """Populates this object from the given xml string"""
         if not hasattr(self, 'filename'):
@@ -316,9 +316,241 @@ def parse_header(parse_state, store):
     decode_header(first_unit, parse_state.decode)
     return first_unit
 
-def parse_units(parse_state, store):
+def iter_units(parse_state, store):
+    """Yields the units as they are parsed, without adding them to the store.
+    Only the encoding of the store is set (from the header), so memory use is
+    bounded by the largest unit rather than the size of the file."""
     unit = parse_header(parse_state, store)
     while unit:
-        store.addunit(unit)
+        yield unit
         unit = parse_unit(parse_state)
+
+def parse_units(parse_state, store):
+    for unit in iter_units(parse_state, store):
+        store.addunit(unit)
     return parse_state.eof
+
+# A faster parser for files that are known to be in UTF-8. The whole file is
+# decoded at once and split into lines, and the rules above are applied to a
+# list of lines without reading, copying and decoding every line through a
+# chain of function calls. It must give exactly the same units as
+# parse_units() (see test_poparser.py).
+
+# str.isspace() considers only these characters as whitespace, while
+# unicode.isspace() accepts many more.
+WHITESPACE = u" \t\n\r\x0b\x0c"
+charsetre = re.compile(u"charset=([^\\s\\\\n]+)")
+UTF8 = ("utf-8", "utf8")
+
+def fast_lines(text):
+    """Splits text into lines like iterating over a file, dropping the lines
+    that ParseState.read_line() skips."""
+    lines = text.split(u"\n")
+    last = lines.pop()
+    result = [line + u"\n" for line in lines if line.strip(WHITESPACE)]
+    if last.strip(WHITESPACE):
+        result.append(last)
+    return result
+
+def fast_quoted(line, start_pos):
+    """parse_quoted() on a line"""
+    left = line.find(u'"', start_pos)
+    if left == start_pos or line[start_pos:left].strip(WHITESPACE) == u"" and line[start_pos:left]:
+        right = line.rfind(u'"')
+        if left != right:
+            return line[left:right+1]
+        else:
+            if line[-1:] >= u"\x80":
+                # parse_quoted() cuts a multibyte character in half here
+                raise ValueError("unterminated string: %r" % line)
+            return line[left:-1] + u'"'
+    return None
+
+class FastParser(object):
+    """Parses units from a list of lines (as given by L{fast_lines})."""
+
+    def __init__(self, lines, UnitClass):
+        self.lines = lines
+        self.count = len(lines)
+        self.pos = 0
+        self.UnitClass = UnitClass
+
+    def next_line(self):
+        if self.pos < self.count:
+            return self.lines[self.pos]
+        return u""
+
+    def parse_message(self, start_of_string, start_of_string_len, msg_list, msg_comment_list):
+        """parse_message(), parse_multiple_quoted() and parse_msg_comment()"""
+        lines = self.lines
+        count = self.count
+        pos = self.pos
+        if pos >= count or not lines[pos].startswith(start_of_string):
+            return
+        # like parse_quoted(), a line is only used if it is a quoted string
+        string = fast_quoted(lines[pos], start_of_string_len)
+        if string is not None:
+            pos += 1
+        while string is not None:
+            if not string.startswith(u'"_:'):
+                msg_list.append(string)
+                string = None
+                if pos < count:
+                    string = fast_quoted(lines[pos], 0)
+                    if string is not None:
+                        pos += 1
+            else:
+                while string is not None:
+                    msg_comment_list.append(string)
+                    comment_ends = string.find(u'\\n') > -1
+                    string = None
+                    if pos < count:
+                        string = fast_quoted(lines[pos], 0)
+                        if string is not None:
+                            pos += 1
+                    if comment_ends:
+                        break
+        self.pos = pos
+
+    def parse_msgstr_array(self, unit):
+        msgstr_dict = {}
+        found = False
+        while True:
+            line = self.next_line()
+            right_bracket_pos = line.find(u']', MSGSTR_ARRAY_ENTRY_LEN)
+            if right_bracket_pos < 0:
+                break
+            entry = []
+            self.parse_message(u'msgstr[', right_bracket_pos + 1, entry, [])
+            if not entry:
+                break
+            index = int(line[MSGSTR_ARRAY_ENTRY_LEN:right_bracket_pos])
+            if index not in msgstr_dict:
+                msgstr_dict[index] = []
+            msgstr_dict[index].extend(entry)
+            found = True
+        if found:
+            unit.msgstr = msgstr_dict
+        return found
+
+    def parse_msg_entries(self, unit):
+        self.parse_message(u'msgctxt', 7, unit.msgctxt, [])
+        self.parse_message(u'msgid', 5, unit.msgid, unit.msgidcomments)
+        if not (unit.msgid or unit.msgidcomments):
+            return False
+        self.parse_message(u'msgstr', 6, unit.msgstr, [])
+        if unit.msgstr:
+            return True
+        # parse_plural()
+        self.parse_message(u'msgid_plural', 12, unit.msgid_plural, unit.msgid_pluralcomments)
+        if not (unit.msgid_plural or unit.msgid_pluralcomments):
+            return False
+        if self.parse_msgstr_array(unit):
+            return True
+        self.parse_message(u'msgstr', 6, unit.msgstr, [])
+        return len(unit.msgstr) > 0
+
+    def parse_comment(self, unit):
+        """parse_comment(): returns a true value if parsing comments should
+        go on"""
+        line = self.next_line()
+        if not line or line[0] != u'#':
+            return None
+        next_char = line[1]
+        if next_char == u'.':
+            unit.automaticcomments.append(line)
+        elif next_char == u'|':
+            prevmsgid_lines = []
+            while self.next_line().startswith(u'#| '):
+                prevmsgid_lines.append(self.lines[self.pos][3:])
+                self.pos += 1
+            if not prevmsgid_lines:
+                # parse_comment() would never get past this line
+                raise ValueError("unexpected line: %r" % line)
+            previous = FastParser([line for line in prevmsgid_lines if line.strip(WHITESPACE)], self.UnitClass)
+            previous.parse_message(u'msgctxt', 7, unit.prev_msgctxt, [])
+            previous.parse_message(u'msgid', 5, unit.prev_msgid, [])
+            previous.parse_message(u'msgid_plural', 12, unit.prev_msgid_plural, [])
+            return self.next_line()
+        elif next_char == u':':
+            unit.sourcecomments.append(line)
+        elif next_char == u',':
+            unit.typecomments.append(line)
+        elif next_char == u'~':
+            return None
+        else:
+            unit.othercomments.append(line)
+        self.pos += 1
+        return line
+
+    def parse_obsolete(self, unit):
+        """read_obsolete_lines() and parse_obsolete()"""
+        if not self.next_line().startswith(u'#~ '):
+            return None
+        obsolete_lines = [self.lines[self.pos][3:]]
+        self.pos += 1
+        next_line = self.next_line()
+        if next_line.startswith(u'#~ msgid ') and obsolete_lines[-1].startswith(u'msgctxt'):
+            obsolete_lines.append(next_line[3:])
+            self.pos += 1
+            next_line = self.next_line()
+        while next_line.startswith(u'#~ ') and not (next_line.startswith(u'#~ msgid ') or next_line.startswith(u'#~ msgctxt')):
+            obsolete_lines.append(next_line[3:])
+            self.pos += 1
+            next_line = self.next_line()
+        obsolete = FastParser([line for line in obsolete_lines if line.strip(WHITESPACE)], self.UnitClass)
+        unit = obsolete.parse_unit(unit)
+        if unit is not None:
+            unit.makeobsolete()
+        return unit
+
+    def parse_unit(self, unit=None):
+        unit = unit or self.UnitClass()
+        parsed_comments = self.parse_comment(unit)
+        if parsed_comments:
+            while self.parse_comment(unit):
+                pass
+        obsolete_unit = self.parse_obsolete(unit)
+        if obsolete_unit is not None:
+            return obsolete_unit
+        parsed_msg_entries = self.parse_msg_entries(unit)
+        unit.infer_state()
+        if parsed_comments or parsed_msg_entries:
+            return unit
+        else:
+            return None
+
+def fast_parse_units(source, store, UnitClass):
+    """Parses the units of a PO file in UTF-8 (as a str) like
+    L{parse_units}, adding them to the store.
+
+    @return: False without changing the store if the file isn't in UTF-8 or
+    can't be decoded, so that the caller can use the normal parser
+    """
+    if startswith(source, '\xef\xbb\xbf'):
+        return False
+    try:
+        text = decode(source, "utf-8")
+    except UnicodeDecodeError:
+        return False
+    parser = FastParser(fast_lines(text), UnitClass)
+    header = parser.parse_unit()
+    if header is None:
+        return True
+    # set_encoding()
+    encoding = "utf-8"
+    if isinstance(header.msgstr, list) and len(header.msgstr) > 0:
+        charset = charsetre.search(u"".join(header.msgstr))
+        if charset and charset.group(1) != u'CHARSET':
+            encoding = charset.group(1).encode("utf-8")
+    if encoding.lower() not in UTF8:
+        return False
+    # the normal parser doesn't decode these for the header
+    for attr in ('prev_msgctxt', 'prev_msgid', 'prev_msgid_plural'):
+        setattr(header, attr, [line.encode("utf-8") for line in getattr(header, attr)])
+    store._encoding = encoding
+    unit = header
+    while unit:
+        store.addunit(unit)
+        unit = parser.parse_unit()
+    return True
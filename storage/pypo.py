@@ -30,6 +30,7 @@ from translate.storage import pocommon, base, poparser
 from translate.storage.pocommon import encodingToUse
 import re
 import copy
+import codecs
 import cStringIO
 import urllib
 
@@ -116,6 +117,13 @@ def unquotefrompo(postr):
 def is_null(lst):
     return lst == [] or len(lst) == 1 and lst[0] == '""'
 
+def _linekey(lines):
+    """Returns a cheap snapshot of quoted lines (or a dict of them) that tells
+    whether they changed since an unquoted value was computed from them."""
+    if isinstance(lines, dict):
+        return tuple([(index, tuple(value)) for index, value in lines.iteritems()])
+    return tuple(lines)
+
 def extractstr(string):
     left = string.find('"')
     right = string.rfind('"')
@@ -158,6 +166,10 @@ class pounit(pocommon.pounit):
         self.obsoletemsgid_pluralcomments = []
         self.obsoletemsgid_plural = []
         self.obsoletemsgstr = []
+        # (snapshot of the quoted lines, unquoted strings), only filled in
+        # when source or target is asked for, see _unquoted()
+        self._sourcecache = None
+        self._targetcache = None
         pocommon.pounit.__init__(self, source)
 
     def _initallcomments(self, blankall=False):
@@ -189,6 +201,32 @@ class pounit(pocommon.pounit):
             multi.strings.append(pluralform)
         return multi
 
+    def _unquotedsource(self):
+        """Returns the unquoted msgid and msgid_plural (if any) as a list.
+
+        The lists of quoted lines are only unquoted on the first access after
+        they changed, so units that are only parsed and written out again are
+        never unquoted at all."""
+        key = (_linekey(self.msgid), _linekey(self.msgid_plural))
+        if self._sourcecache is None or self._sourcecache[0] != key:
+            strings = [unquotefrompo(self.msgid)]
+            if self.msgid_plural:
+                strings.append(unquotefrompo(self.msgid_plural))
+            self._sourcecache = (key, strings)
+        return self._sourcecache[1]
+
+    def _unquotedtarget(self):
+        """Returns the unquoted msgstr (all the plural forms) as a list, see
+        L{_unquotedsource}."""
+        key = _linekey(self.msgstr)
+        if self._targetcache is None or self._targetcache[0] != key:
+            if isinstance(self.msgstr, dict):
+                strings = map(unquotefrompo, self.msgstr.values())
+            else:
+                strings = [unquotefrompo(self.msgstr)]
+            self._targetcache = (key, strings)
+        return self._targetcache[1]
+
     def _set_source_vars(self, source):
         msgid = None
         msgid_plural = None
@@ -209,7 +247,8 @@ class pounit(pocommon.pounit):
 
     def getsource(self):
         """Returns the unescaped msgid"""
-        return self._get_source_vars(self.msgid, self.msgid_plural)
+        # a new multistring every time, since callers may change its strings
+        return multistring(self._unquotedsource(), self._encoding)
 
     def setsource(self, source):
         """Sets the msgid to the given (unescaped) value.
@@ -217,6 +256,7 @@ class pounit(pocommon.pounit):
         @param source: an unescaped source string.
         """
         self._rich_source = None
+        self._sourcecache = None
         self.msgid, self.msgid_plural = self._set_source_vars(source)
     source = property(getsource, setsource)
 
@@ -234,15 +274,12 @@ class pounit(pocommon.pounit):
 
     def gettarget(self):
         """Returns the unescaped msgstr"""
-        if isinstance(self.msgstr, dict):
-            multi = multistring(map(unquotefrompo, self.msgstr.values()), self._encoding)
-        else:
-            multi = multistring(unquotefrompo(self.msgstr), self._encoding)
-        return multi
+        return multistring(self._unquotedtarget(), self._encoding)
 
     def settarget(self, target):
         """Sets the msgstr to the given (unescaped) value"""
         self._rich_target = None
+        self._targetcache = None
         if isinstance(target, str):
             target = target.decode(self._encoding)
         if self.hasplural():
@@ -348,17 +385,14 @@ class pounit(pocommon.pounit):
         return copy.deepcopy(self)
 
     def _msgidlen(self):
-        if self.hasplural():
-            return len(unquotefrompo(self.msgid)) + len(unquotefrompo(self.msgid_plural))
-        else:
-            return len(unquotefrompo(self.msgid))
+        return sum([len(string) for string in self._unquotedsource()])
 
     def _msgstrlen(self):
+        strings = self._unquotedtarget()
         if isinstance(self.msgstr, dict):
-            combinedstr = "\n".join([unquotefrompo(msgstr) for msgstr in self.msgstr.itervalues()])
-            return len(combinedstr)
+            return len("\n".join(strings))
         else:
-            return len(unquotefrompo(self.msgstr))
+            return len(strings[0])
 
     def merge(self, otherpo, overwrite=False, comments=True, authoritative=False):
         """Merges the otherpo (with the same msgid) into this one.
@@ -731,14 +765,44 @@ class pofile(pocommon.pofile):
                 self.filename = input.name
             elif not getattr(self, 'filename', ''):
                 self.filename = ''
-            if isinstance(input, str):
-                input = cStringIO.StringIO(input)
+            if not isinstance(input, str):
+                input = input.read()
             # clear units to get rid of automatically generated headers before parsing
             self.units = []
-            poparser.parse_units(poparser.ParseState(input, pounit), self)
+            # Most files are in UTF-8, which the fast parser can handle
+            if not poparser.fast_parse_units(input, self, pounit):
+                self.units = []
+                poparser.parse_units(poparser.ParseState(cStringIO.StringIO(input), pounit), self)
         except Exception, e:
             raise base.ParseError(e)
 
+    def iterparsefile(cls, storefile):
+        """Reads the given file (or opens the given filename) and yields each
+        unit as soon as it is parsed. The units belong to a store holding
+        only the header, so memory use is bounded by the largest unit."""
+        if isinstance(storefile, basestring):
+            storefile = open(storefile, 'r')
+        store = cls()
+        store.units = []
+        store.fileobj = storefile
+        store._assignname()
+        units = poparser.iter_units(poparser.ParseState(storefile, pounit), store)
+        try:
+            while True:
+                try:
+                    unit = units.next()
+                except StopIteration:
+                    break
+                except Exception, e:
+                    raise base.ParseError(e)
+                unit._store = store
+                # like str(store), str(unit) should use the encoding of the file
+                unit._encoding = store._encoding
+                yield unit
+        finally:
+            storefile.close()
+    iterparsefile = classmethod(iterparsefile)
+
     def removeduplicates(self, duplicatestyle="merge"):
         """Make sure each msgid is unique ; merge comments etc from duplicates into original"""
         # TODO: can we handle consecutive calls to removeduplicates()? What
@@ -787,17 +851,36 @@ class pofile(pocommon.pofile):
             return output.encode(getattr(self, "_encoding", "UTF-8"))
         return output
 
-    def _getoutput(self):
-        """convert the units back to lines"""
-        lines = []
+    def serialize(self, fileobj):
+        """Writes the file to fileobj one unit at a time, encoded like
+        L{__str__}, without building the whole file in memory."""
+        encoder = codecs.getincrementalencoder(getattr(self, "_encoding", "UTF-8"))()
+        for chunk in self._iteroutput():
+            fileobj.write(encoder.encode(chunk))
+        fileobj.write(encoder.encode(u"", True))
+
+    def _iteroutput(self):
+        """yields the lines of the units, which together give _getoutput()"""
+        # Whitespace at the end of a unit is held back until we know that
+        # something else follows, since the file as a whole is stripped
+        pending = u""
+        written = False
         for unit in self.units:
             unitsrc = unit._getoutput() + u"\n"
-            lines.append(unitsrc)
-        lines = u"".join(lines).rstrip()
+            content = unitsrc.rstrip()
+            if content:
+                yield pending + content
+                pending = unitsrc[len(content):]
+                written = True
+            else:
+                pending += unitsrc
         #After the last pounit we will have \n\n and we only want to end in \n:
-        if lines:
-            lines += u"\n"
-        return lines
+        if written:
+            yield u"\n"
+
+    def _getoutput(self):
+        """convert the units back to lines"""
+        return u"".join(self._iteroutput())
 
     def encode(self, lines):
         """encode any unicode strings in lines in self._encoding"""
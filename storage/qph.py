@@ -163,3 +163,11 @@ class QphFile(lisa.LISAfile):
         if not "<!DOCTYPE QPH>" in output[:30]:
             output = "<!DOCTYPE QPH>" + output
         return output
+
+    def serialize(self, fileobj):
+        """Writes the file's XML to fileobj like L{__str__}, without building
+        one big string."""
+        if not "<!DOCTYPE QPH>" in (self.document.docinfo.doctype or "")[:30]:
+            fileobj.write("<!DOCTYPE QPH>")
+        self.document.write(fileobj, pretty_print=True,
+                            xml_declaration=False, encoding='utf-8')
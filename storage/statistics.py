@@ -28,6 +28,7 @@
 
 from translate import lang
 from translate.lang import factory
+from translate.storage import wordcount
 
 # calling classifyunits() in the constructor is probably not ideal. 
 # idea: have a property for .classification that calls it if necessary
@@ -47,6 +48,7 @@ class Statistics(object):
         self.sourcelanguage = sourcelanguage
         self.targetlanguage = targetlanguage
         self.language = lang.factory.getlanguage(self.sourcelanguage)
+        self.wordcounter = wordcount.counter(self.language, markup=False)
 #        self.init_checker(checkerstyle)
         
         self.classification = {}
@@ -107,7 +109,7 @@ class Statistics(object):
 
     def wordcount(self, text):
         """Returns the number of words in the given text."""
-        return len(self.language.words(text))
+        return self.wordcounter.count(text)
 
     def source_wordcount(self):
         """Returns the number of words in the source text."""
@@ -178,9 +180,17 @@ class Statistics(object):
         """Counts the source and target words in each of the units."""
         self.sourcewordcounts = []
         self.targetwordcounts = []
+        sources = []
+        targets = []
         for unit in self.unit_iter():
-            self.sourcewordcounts.append([self.wordcount(text) for text in getattr(unit.source, "strings", [""])])
-            self.targetwordcounts.append([self.wordcount(text) for text in getattr(unit.target, "strings", [""])])
+            sources.append(getattr(unit.source, "strings", [""]))
+            targets.append(getattr(unit.target, "strings", [""]))
+        for strings, wordcounts in ((sources, self.sourcewordcounts), (targets, self.targetwordcounts)):
+            counts = self.wordcounter.countmany([text for texts in strings for text in texts])
+            position = 0
+            for texts in strings:
+                wordcounts.append(counts[position:position+len(texts)])
+                position += len(texts)
 
     def reclassifyunit(self, item):
         """Updates the classification of a unit in self.classification.
@@ -188,8 +198,8 @@ class Statistics(object):
         @param item: an integer that is an index in .getunits().
         """
         unit = self.getunits()[item]
-        self.sourcewordcounts[item] = [self.wordcount(text) for text in unit.source.strings]
-        self.targetwordcounts[item] = [self.wordcount(text) for text in unit.target.strings]
+        self.sourcewordcounts[item] = self.wordcounter.countmany(unit.source.strings)
+        self.targetwordcounts[item] = self.wordcounter.countmany(unit.target.strings)
         classes = self.classifyunit(unit)
 #        if self.basefile.getsuggestions(item):
 #            classes.append("has-suggestion")
@@ -29,56 +29,45 @@
 from UserDict import UserDict
 
 from translate import __version__ as toolkitversion
+from translate.filters import spelling
 from translate.storage import factory
+from translate.storage.wordcount import counter
 from translate.misc.multistring import multistring
-from translate.lang.common import Common
+from translate.misc import hash
 
 try:
     from sqlite3 import dbapi2
 except ImportError:
     from pysqlite2 import dbapi2
+try:
+    import json #available since Python 2.6
+except ImportError:
+    import simplejson as json #API compatible with the json module
 import os.path
-import re
 import sys
 import stat
-import thread
-
-kdepluralre = re.compile("^_n: ")
-brtagre = re.compile("<br\s*?/?>")
-xmltagre = re.compile("<[^>]+>")
-numberre = re.compile("\\D\\.\\D")
+import threading
+import time
+import weakref
 
 state_strings = {0: "untranslated", 1: "translated", 2: "fuzzy"}
 
+wordcounter = counter()
+
 def wordcount(string):
-    # TODO: po class should understand KDE style plurals
-    string = kdepluralre.sub("", string)
-    string = brtagre.sub("\n", string)
-    string = xmltagre.sub("", string)
-    string = numberre.sub(" ", string)
     #TODO: This should still use the correct language to count in the target
     #language
-    return len(Common.words(string))
+    return wordcounter.count(string)
 
 def wordsinunit(unit):
     """Counts the words in the unit's source and target, taking plurals into
     account. The target words are only counted if the unit is translated."""
-    (sourcewords, targetwords) = (0, 0)
-    if isinstance(unit.source, multistring):
-        sourcestrings = unit.source.strings
-    else:
-        sourcestrings = [unit.source or ""]
-    for s in sourcestrings:
-        sourcewords += wordcount(s)
-    if not unit.istranslated():
-        return sourcewords, targetwords
-    if isinstance(unit.target, multistring):
-        targetstrings = unit.target.strings
-    else:
-        targetstrings = [unit.target or ""]
-    for s in targetstrings:
-        targetwords += wordcount(s)
-    return sourcewords, targetwords
+    return wordcounter.countunits([unit])[0]
+
+def wordsinunits(units):
+    """Returns the result of L{wordsinunit} for all units, counting every
+    distinct string only once."""
+    return wordcounter.countunits(units)
 
 class Record(UserDict):
     def __init__(self, record_keys, record_values=None, compute_derived_values = lambda x: x):
@@ -93,17 +82,17 @@ class Record(UserDict):
         return tuple(self[key] for key in self.record_keys)
 
     def __add__(self, other):
-        result = Record(self.record_keys)
+        result = Record(self.record_keys, compute_derived_values=self._compute_derived_values)
         for key in self.keys():
             result[key] = self[key] + other[key]
-        self._compute_derived_values(self)
+        self._compute_derived_values(result)
         return result
 
     def __sub__(self, other):
-        result = Record(self.record_keys)
+        result = Record(self.record_keys, compute_derived_values=self._compute_derived_values)
         for key in self.keys():
             result[key] = self[key] - other[key]
-        self._compute_derived_values(self)
+        self._compute_derived_values(result)
         return result
 
     def as_string_for_db(self):
@@ -113,24 +102,174 @@ def transaction(f):
     """Modifies f to commit database changes if it executes without exceptions.
     Otherwise it rolls back the database.
 
+    The outermost decorated call in a thread takes a connection from the pool
+    of the cache and gives it back when it is done, so that nested calls share
+    a single transaction.
+
     ALL publicly accessible methods in StatsCache MUST be decorated with this
     decorator.
     """
 
     def decorated_f(self, *args, **kwargs):
+        outermost = self._begin()
         try:
-            result = f(self, *args, **kwargs)
-            self.con.commit()
-            return result
-        except:
-            # If ANY exception is raised, we're left in an
-            # uncertain state and we MUST roll back any changes to avoid getting
-            # stuck in an inconsistent state.
-            if self.con:
-                self.con.rollback()
-            raise
+            try:
+                result = f(self, *args, **kwargs)
+                if outermost:
+                    self.con.commit()
+                return result
+            except:
+                # If ANY exception is raised, we're left in an
+                # uncertain state and we MUST roll back any changes to avoid getting
+                # stuck in an inconsistent state.
+                if outermost:
+                    error = sys.exc_info()[1]
+                    if isinstance(error, dbapi2.OperationalError) and "locked" in str(error):
+                        self.pool.countbusy()
+                    if self.con:
+                        self.con.rollback()
+                raise
+        finally:
+            self._end()
     return decorated_f
 
+# seconds to wait for a lock held by another connection or process before
+# giving up
+BUSY_TIMEOUT = 30
+
+# seconds to wait for a connection from the pool before giving up
+POOL_TIMEOUT = 60
+
+# the number of check results to keep, the least recently used ones are
+# forgotten first
+CHECK_CACHE_SIZE = 1000000
+
+def connect(statsfile):
+    """Opens a connection to statsfile that can be shared between threads."""
+    con = dbapi2.connect(statsfile, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    try:
+        # readers don't block the writer (or each other) in WAL mode
+        con.execute("""PRAGMA journal_mode=WAL;""")
+    except dbapi2.OperationalError:
+        # The journal mode is stored in the database, so we just use
+        # whatever another process left there.
+        pass
+    return con
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection of a L{ConnectionPool} became available in
+    time, usually because threads kept connections without releasing them."""
+    pass
+
+class ConnectionPool(object):
+    """A bounded pool of connections to a stats database.
+
+    Connections are opened when they are first needed, and at most C{size}
+    of them are ever in use at the same time. L{acquire} blocks until a
+    connection is available, or raises L{PoolTimeoutError} after
+    L{POOL_TIMEOUT} seconds. The pool counts how often and how long callers
+    had to wait for a connection, and how often SQLite gave up waiting for a
+    lock held by another connection."""
+
+    def __init__(self, statsfile, size=8):
+        self.statsfile = statsfile
+        self.size = size
+        self._idle = []
+        self._connections = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._free = size
+        self.acquired = 0
+        self.waits = 0
+        self.waittime = 0.0
+        self.timeouts = 0
+        self.busy = 0
+
+    def acquire(self, timeout=None):
+        """Returns a connection, which must be given back with L{release}.
+
+        @param timeout: the seconds to wait for a connection before raising
+        L{PoolTimeoutError}, L{POOL_TIMEOUT} by default
+        """
+        if timeout is None:
+            timeout = POOL_TIMEOUT
+        self._lock.acquire()
+        try:
+            if not self._free:
+                start = time.time()
+                while not self._free:
+                    remaining = start + timeout - time.time()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError("No connection to %s became available in %d seconds" %
+                                               (self.statsfile, timeout))
+                    self._available.wait(remaining)
+                self.waits += 1
+                self.waittime += time.time() - start
+            self._free -= 1
+            self.acquired += 1
+            if self._idle:
+                return self._idle.pop()
+            try:
+                con = connect(self.statsfile)
+            except:
+                self._free += 1
+                self._available.notify()
+                raise
+            self._connections.append(con)
+            return con
+        finally:
+            self._lock.release()
+
+    def release(self, con):
+        """Gives a connection returned by L{acquire} back to the pool."""
+        self._lock.acquire()
+        try:
+            self._idle.append(con)
+            self._free += 1
+            self._available.notify()
+        finally:
+            self._lock.release()
+
+    def countbusy(self):
+        """Counts a transaction that failed because the database was
+        locked for longer than L{BUSY_TIMEOUT}."""
+        self._lock.acquire()
+        try:
+            self.busy += 1
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Returns a dictionary with the number of connections, how often
+        connections were acquired, how often and for how many seconds callers
+        waited for one, how often they gave up waiting, and how many
+        transactions failed on a lock."""
+        self._lock.acquire()
+        try:
+            return {"size": self.size,
+                    "connections": len(self._connections),
+                    "idle": len(self._idle),
+                    "acquired": self.acquired,
+                    "waits": self.waits,
+                    "waittime": self.waittime,
+                    "timeouts": self.timeouts,
+                    "busy": self.busy}
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """Closes all connections. Connections still in use are closed as
+        well, so this should only be called once all work is done."""
+        self._lock.acquire()
+        try:
+            for con in self._connections:
+                con.close()
+            self._connections = []
+            self._idle = []
+        finally:
+            self._lock.release()
+
 UNTRANSLATED, TRANSLATED, FUZZY = 0, 1, 2
 def statefordb(unit):
     """Returns the numeric database state for the unit."""
@@ -154,6 +293,8 @@ class FileTotals(object):
 
     def __init__(self, cur):
         self.cur = cur
+
+    def create(self):
         self.cur.execute("""
             CREATE TABLE IF NOT EXISTS filetotals(
                 fileid                  INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -211,6 +352,67 @@ class FileTotals(object):
             WHERE fileid=?;
         """,  (fileid,))
 
+class DirTotals(object):
+    """The sums of the file totals of all cached files in and below every
+    directory that contains a cached file, keyed by the path of the
+    directory."""
+
+    keys = FileTotals.keys
+
+    def __init__(self, cur):
+        self.cur = cur
+
+    def create(self):
+        self.cur.execute("""SELECT name FROM sqlite_master
+            WHERE type='table' AND name='dirtotals';""")
+        exists = self.cur.fetchone() is not None
+        self.cur.execute("""
+            CREATE TABLE IF NOT EXISTS dirtotals(
+                path                    VARCHAR PRIMARY KEY,
+                translatedsourcewords   INTEGER NOT NULL,
+                fuzzysourcewords        INTEGER NOT NULL,
+                untranslatedsourcewords INTEGER NOT NULL,
+                translated              INTEGER NOT NULL,
+                fuzzy                   INTEGER NOT NULL,
+                untranslated            INTEGER NOT NULL,
+                translatedtargetwords   INTEGER NOT NULL);""")
+        if not exists:
+            self.rebuild()
+
+    def rebuild(self):
+        """Recalculates all directory totals from the file totals."""
+        self.cur.execute("""DELETE FROM dirtotals;""")
+        self.cur.execute("""
+            SELECT files.path, %(keys)s
+            FROM   files JOIN filetotals ON files.fileid = filetotals.fileid;""" %
+            {'keys': ",".join(["filetotals." + key for key in self.keys])})
+        for row in self.cur.fetchall():
+            self.add(row[0], Record(self.keys, row[1:]))
+
+    def __getitem__(self, path):
+        result = self.cur.execute("""
+            SELECT %(keys)s
+            FROM   dirtotals
+            WHERE  path=?;""" % {'keys': ",".join(self.keys)}, (path,))
+        return Record(self.keys, result.fetchone(), FileTotals._compute_derived_values)
+
+    def add(self, filepath, record):
+        """Adds the values in record to the totals of all directories
+        containing filepath."""
+        directories = []
+        path = os.path.dirname(filepath)
+        while path not in directories:
+            directories.append(path)
+            path = os.path.dirname(path)
+        self.cur.executemany("""
+            INSERT OR IGNORE INTO dirtotals
+            VALUES (?, 0, 0, 0, 0, 0, 0, 0);""", [(path,) for path in directories])
+        self.cur.executemany("""
+            UPDATE dirtotals
+            SET    %(sums)s
+            WHERE  path=?;""" % {'sums': ", ".join(["%s=%s+?" % (key, key) for key in self.keys])},
+            [tuple([record[key] for key in self.keys]) + (path,) for path in directories])
+
 def emptyfiletotals():
     """Returns a dictionary with all statistics initalised to 0."""
     return FileTotals.new_record()
@@ -235,6 +437,135 @@ def get_mod_info(file_path):
     assert not stat.S_ISDIR(file_stat.st_mode)
     return file_stat.st_mtime, file_stat.st_size
 
+def _unicodepath(filename):
+    if isinstance(filename, str):
+        filename = unicode(filename, sys.getfilesystemencoding())
+    return filename
+
+def unithash(unit):
+    """Returns a hash of everything about the unit that its statistics and
+    checks depend on: its id, source, target and state."""
+    parts = [unit.getid() or u"", unicode(statefordb(unit))]
+    for text in (unit.source, unit.target):
+        if isinstance(text, multistring):
+            parts.extend(text.strings)
+        else:
+            parts.append(text or u"")
+        parts.append(u"")
+    parts = [isinstance(part, unicode) and part.encode("utf-8") or part for part in parts]
+    return hash.md5_f("\0".join(parts)).hexdigest()
+
+def unitcheckhash(unit):
+    """Returns a hash of everything about the unit that the results of
+    checks depend on: its source and target (with all their plural forms),
+    whether it is fuzzy or marked for review, its locations, its notes and
+    its alternative translations."""
+    parts = []
+    for text in (unit.source, unit.target):
+        if isinstance(text, multistring):
+            parts.extend(text.strings)
+        else:
+            parts.append(text or u"")
+        parts.append(u"")
+    parts.append(unicode((unit.hasplural(), unit.isfuzzy(), unit.isreview())))
+    parts.extend(unit.getlocations())
+    parts.append(u"")
+    parts.append(unit.getnotes() or u"")
+    if hasattr(unit, "getalttrans"):
+        parts.extend([unicode(alttrans.target) for alttrans in unit.getalttrans()])
+    parts = [isinstance(part, unicode) and part.encode("utf-8") or part for part in parts]
+    return hash.md5_f("\0".join(parts)).hexdigest()
+
+def _canonical(value):
+    """Returns a representation of value that doesn't depend on the order of
+    the items of the dictionaries and sets in it."""
+    if isinstance(value, dict):
+        items = [(_canonical(key), _canonical(item)) for key, item in value.iteritems()]
+        items.sort()
+        return "{%s}" % ", ".join(["%s: %s" % item for item in items])
+    if isinstance(value, (set, frozenset)):
+        items = [_canonical(item) for item in value]
+        items.sort()
+        return "set([%s])" % ", ".join(items)
+    if isinstance(value, (list, tuple)):
+        return "[%s]" % ", ".join([_canonical(item) for item in value])
+    return repr(value)
+
+def _describespelling(lang):
+    """Returns a description of the dictionary that the spell checker of the
+    language uses, or "none"."""
+    spellchecker = None
+    if lang and spelling.available:
+        spellchecker = spelling.getchecker(lang)
+    if spellchecker is None:
+        return "none"
+    return spellchecker.dictionary.describe()
+
+def checkerhash(checker):
+    """Returns a hash of everything about the checker (or L{TeeChecker})
+    that the results of checks depend on: the version of the toolkit, the
+    classes, filters and configurations of its checkers, and the spelling
+    dictionaries they use."""
+    parts = [str(toolkitversion.build)]
+    for subchecker in getattr(checker, "checkers", [checker]):
+        parts.append("%s.%s" % (subchecker.__class__.__module__, subchecker.__class__.__name__))
+        parts.append(" ".join(sorted(subchecker.defaultfilters.keys())))
+        parts.append(_canonical(subchecker.config.__dict__))
+        if "spellcheck" in subchecker.defaultfilters:
+            # spellcheck() checks the source text as English
+            parts.append(_describespelling("en"))
+            parts.append(_describespelling(subchecker.config.targetlanguage))
+    return hash.md5_f("\0".join(parts)).hexdigest()
+
+def _suggestionstores(checker):
+    """Returns the suggestion stores that the checker (or L{TeeChecker})
+    uses, which checks can depend on too."""
+    return [subchecker.suggestion_store for subchecker in getattr(checker, "checkers", [checker])
+            if getattr(subchecker, "suggestion_store", None)]
+
+def unitrows(units, unitindex=None):
+    """Calculates the statistics of the translatable units as a list of
+    (unitid, unitindex, source, target, sourcewords, targetwords, state,
+    hash) tuples, ready to be stored in the units table.
+
+    @param unitindex: the index to use for the (single) unit, instead of its
+    position in units
+    """
+    translatable = [(unitindex or index, unit)
+                    for index, unit in enumerate(units) if unit.istranslatable()]
+    words = wordsinunits([unit for index, unit in translatable])
+    rows = []
+    for (index, unit), counts in zip(translatable, words):
+        rows.append(unitrow(unit, index, words=counts))
+    return rows
+
+def unitrow(unit, index, digest=None, words=None):
+    """Returns the row of unitrows() for a single unit. The digest is
+    calculated with unithash() and the words with wordsinunit() if they
+    aren't given."""
+    sourcewords, targetwords = words or wordsinunit(unit)
+    # what about plurals in .source and .target?
+    return (unit.getid(), index, unit.source, unit.target,
+            sourcewords, targetwords, statefordb(unit), digest or unithash(unit))
+
+def filerows(filename):
+    """Parses the file and returns its real path, its modification info
+    from before it was parsed and the result of L{unitrows} for its units.
+    Nothing here touches the database, so it can run in another process
+    and be stored with L{StatsCache.cachefilerows}."""
+    realpath = os.path.realpath(_unicodepath(filename))
+    mod_info = get_mod_info(realpath)
+    store = factory.getobject(realpath, readonly=True)
+    def plain(value):
+        # multistrings don't survive pickling intact, the database only
+        # stores their first string anyway
+        if isinstance(value, multistring):
+            return unicode(value)
+        return value
+    rows = [(unitid, index, plain(source), plain(target), sourcewords, targetwords, state, unithash)
+            for unitid, index, source, target, sourcewords, targetwords, state, unithash in unitrows(store.units)]
+    return realpath, mod_info, rows
+
 def suggestion_extension():
     return os.path.extsep + 'pending'
 
@@ -244,43 +575,21 @@ def suggestion_filename(filename):
 # ALL PUBLICLY ACCESSIBLE METHODS MUST BE DECORATED WITH THE transaction DECORATOR.
 class StatsCache(object):
     """An object instantiated as a singleton for each statsfile that provides
-    access to the database cache from a pool of StatsCache objects."""
+    access to the database cache through a pool of connections shared by all
+    threads.
+
+    Every thread that uses L{con}, L{cur}, L{file_totals} or L{dir_totals}
+    outside a transaction should call L{release} when it is done: the pool
+    only has a few connections, and once they are all kept by threads, the
+    others get a L{PoolTimeoutError}. The connection of a thread that ends
+    without calling L{release} is rolled back and given back to the pool when
+    the thread is garbage collected."""
     _caches = {}
+    _cacheslock = threading.Lock()
     defaultfile = None
-    con = None
-    """This cache's connection"""
-    cur = None
-    """The current cursor"""
+    checkcachesize = CHECK_CACHE_SIZE
 
     def __new__(cls, statsfile=None):
-        current_thread = thread.get_ident()
-        def make_database(statsfile):
-            def connect(cache):
-                cache.con = dbapi2.connect(statsfile)
-                cache.cur = cache.con.cursor()
-
-            def clear_old_data(cache):
-                try:
-                    cache.cur.execute("""SELECT toolkitbuild FROM files""")
-                    val = cache.cur.fetchone()
-                    # If the database is empty, we have no idea whether its layout
-                    # is correct, so we might as well delete it.
-                    if val is None or val[0] < toolkitversion.build:
-                        cache.con.close()
-                        del cache
-                        os.unlink(statsfile)
-                        return True
-                    return False
-                except dbapi2.OperationalError:
-                    return False
-            
-            cache = cls._caches.setdefault(current_thread, {})[statsfile] = object.__new__(cls)
-            connect(cache)
-            if clear_old_data(cache):
-                connect(cache)
-            cache.create()
-            return cache
-
         if not statsfile:
             if not cls.defaultfile:
                 userdir = os.path.expanduser("~")
@@ -295,16 +604,144 @@ class StatsCache(object):
             statsfile = cls.defaultfile
         else:
             statsfile = os.path.realpath(statsfile)
-        # First see if a cache for this file already exists:
-        if current_thread in cls._caches and statsfile in cls._caches[current_thread]:
-            return cls._caches[current_thread][statsfile]
-        # No existing cache. Let's build a new one and keep a copy
-        return make_database(statsfile)
+        cls._cacheslock.acquire()
+        try:
+            # First see if a cache for this file already exists:
+            if statsfile in cls._caches:
+                return cls._caches[statsfile]
+            # No existing cache. Let's build a new one and keep a copy
+            cache = object.__new__(cls)
+            cache.pool = ConnectionPool(statsfile)
+            cache._local = threading.local()
+            cache._pinned = {}
+            cache._migrate()
+            cls._caches[statsfile] = cache
+            return cache
+        finally:
+            cls._cacheslock.release()
+
+    def _take(self, pinned):
+        local = self._local
+        local.con = self.pool.acquire()
+        local.cur = local.con.cursor()
+        local.file_totals = FileTotals(local.cur)
+        local.dir_totals = DirTotals(local.cur)
+        local.depth = 0
+        local.pinned = pinned
+        if pinned:
+            # We watch the thread rather than the thread local data, since
+            # that is dropped at some point while the thread ends as well.
+            local.watch = weakref.ref(threading.currentThread(), self._reclaim)
+            self._pinned[local.watch] = local.con
+
+    def _reclaim(self, watch):
+        """Gives the connection of a thread that ended without calling
+        L{release} back to the pool."""
+        con = self._pinned.pop(watch, None)
+        if con is not None:
+            con.rollback()
+            self.pool.release(con)
+
+    def _begin(self):
+        """Makes sure the current thread has a connection for a transaction.
+        Returns True if this starts the outermost transaction."""
+        local = self._local
+        if getattr(local, "con", None) is None:
+            self._take(False)
+        local.depth += 1
+        return local.depth == 1
+
+    def _end(self):
+        """Ends a transaction started with L{_begin}, giving the connection
+        back to the pool after the outermost one."""
+        local = self._local
+        local.depth -= 1
+        if local.depth == 0 and not local.pinned:
+            self._give()
+
+    def _give(self):
+        local = self._local
+        con = local.con
+        if local.pinned:
+            del self._pinned[local.watch]
+            local.watch = None
+        local.con = local.cur = local.file_totals = local.dir_totals = None
+        self.pool.release(con)
+
+    def _connection(self):
+        """Returns the connection of the current thread. Outside a
+        transaction, a connection is taken from the pool and kept by the
+        thread until L{release} is called."""
+        if getattr(self._local, "con", None) is None:
+            self._take(True)
+        return self._local
+
+    con = property(lambda self: self._connection().con, doc="This thread's connection")
+    cur = property(lambda self: self._connection().cur, doc="The current cursor")
+    file_totals = property(lambda self: self._connection().file_totals)
+    dir_totals = property(lambda self: self._connection().dir_totals)
+
+    def release(self):
+        """Gives a connection kept by the current thread after using L{con}
+        or L{cur} outside a transaction back to the pool."""
+        local = self._local
+        if getattr(local, "con", None) is not None and local.pinned and local.depth == 0:
+            local.con.commit()
+            self._give()
+
+    def stats(self):
+        """Returns the counters of the connection pool, see
+        L{ConnectionPool.stats}."""
+        return self.pool.stats()
+
+    def _migrate(self):
+        """Creates the tables, first dropping the old ones if the cache was
+        made by an older version of the toolkit.
+
+        This holds an exclusive lock on the database, so other processes
+        using the same file wait for the migration instead of finding the
+        file deleted or half empty."""
+        self._begin()
+        con = self.con
+        try:
+            con.isolation_level = None
+            try:
+                self.cur.execute("""BEGIN EXCLUSIVE;""")
+                try:
+                    # The build of the toolkit that made the tables is kept
+                    # in the header of the database, so it is known even if
+                    # no file was cached yet. Databases made before it was
+                    # kept there have version 0, and start from scratch too.
+                    self.cur.execute("""PRAGMA user_version;""")
+                    version = self.cur.fetchone()[0]
+                    if version < toolkitversion.build:
+                        self._droptables()
+                    self.create()
+                    if version < toolkitversion.build:
+                        self.cur.execute("""PRAGMA user_version=%d;""" % toolkitversion.build)
+                    self.cur.execute("""COMMIT;""")
+                except:
+                    self.cur.execute("""ROLLBACK;""")
+                    raise
+            finally:
+                con.isolation_level = ""
+        finally:
+            self._end()
+
+    def _droptables(self):
+        self.cur.execute("""SELECT name FROM sqlite_master
+            WHERE type='table' AND name NOT LIKE 'sqlite_%';""")
+        for (table,) in self.cur.fetchall():
+            self.cur.execute("""DROP TABLE %s;""" % table)
+        self.cur.execute("""SELECT name FROM sqlite_master
+            WHERE type='table' AND name='sqlite_sequence';""")
+        if self.cur.fetchone():
+            self.cur.execute("""DELETE FROM sqlite_sequence;""")
 
     @transaction
     def create(self):
         """Create all tables and indexes."""
-        self.file_totals = FileTotals(self.cur)
+        self.file_totals.create()
 
         self.cur.execute("""CREATE TABLE IF NOT EXISTS files(
             fileid INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -313,6 +750,8 @@ class StatsCache(object):
             st_size INTEGER NOT NULL,
             toolkitbuild INTEGER NOT NULL);""")
 
+        self.dir_totals.create()
+
         self.cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS filepathindex
             ON files (path);""")
 
@@ -327,6 +766,11 @@ class StatsCache(object):
             sourcewords INTEGER,
             targetwords INTEGER);""")
 
+        self.cur.execute("""PRAGMA table_info(units);""")
+        if "hash" not in [column[1] for column in self.cur.fetchall()]:
+            # units cached before we stored hashes will just never match
+            self.cur.execute("""ALTER TABLE units ADD COLUMN hash VARCHAR;""")
+
         self.cur.execute("""CREATE INDEX IF NOT EXISTS fileidindex
             ON units(fileid);""")
 
@@ -348,6 +792,27 @@ class StatsCache(object):
         self.cur.execute("""CREATE INDEX IF NOT EXISTS uniterrorindex
             ON uniterrors(fileid, configid);""")
 
+        # units that changed since the checks with a configuration ran
+        self.cur.execute("""CREATE TABLE IF NOT EXISTS pendingchecks(
+            fileid INTEGER NOT NULL,
+            configid INTEGER NOT NULL,
+            unitindex INTEGER NOT NULL);""")
+
+        self.cur.execute("""CREATE INDEX IF NOT EXISTS pendingchecksindex
+            ON pendingchecks(fileid, configid);""")
+
+        # the failures of units with the same content, checked with the same
+        # checker, wherever they are (see runchecks())
+        self.cur.execute("""CREATE TABLE IF NOT EXISTS checkresults(
+            checkerhash VARCHAR NOT NULL,
+            unithash VARCHAR NOT NULL,
+            failures VARCHAR NOT NULL,
+            lastused INTEGER NOT NULL,
+            PRIMARY KEY (checkerhash, unithash));""")
+
+        self.cur.execute("""CREATE INDEX IF NOT EXISTS lastusedindex
+            ON checkresults(lastused);""")
+
     @transaction
     def _getfileid(self, filename, check_mod_info=True, store=None):
         """return fileid representing the given file in the statscache.
@@ -360,9 +825,7 @@ class StatsCache(object):
 
         store can be a TranslationFile object or a callback that returns one.
         """
-        if isinstance(filename, str):
-            filename = unicode(filename, sys.getfilesystemencoding())
-        realpath = os.path.realpath(filename)
+        realpath = os.path.realpath(_unicodepath(filename))
         self.cur.execute("""SELECT fileid, st_mtime, st_size FROM files
                 WHERE path=?;""", (realpath,))
         filerow = self.cur.fetchone()
@@ -382,8 +845,10 @@ class StatsCache(object):
         if callable(store):
             store = store()
         else:
-            store = store or factory.getobject(realpath)
+            store = store or factory.getobject(realpath, readonly=True)
 
+        if filerow:
+            return self._recachestore(store, filerow[0], mod_info)
         return self._cachestore(store, realpath, mod_info)
     
     def _getstoredcheckerconfig(self, checker):
@@ -400,43 +865,166 @@ class StatsCache(object):
     @transaction
     def _cacheunitstats(self, units, fileid, unitindex=None, file_totals_record=FileTotals.new_record()):
         """Cache the statistics for the supplied unit(s)."""
+        self._cacheunitrows(unitrows(units, unitindex), fileid, file_totals_record)
+        if unitindex:
+            return state_strings[statefordb(units[0])]
+        return ""
+
+    def _cacheunitrows(self, rows, fileid, file_totals_record=FileTotals.new_record()):
+        """Stores the rows calculated by unitrows() for the given file."""
         unitvalues = []
-        for index, unit in enumerate(units):
-            if unit.istranslatable():
-                sourcewords, targetwords = wordsinunit(unit)
-                if unitindex:
-                    index = unitindex
-                # what about plurals in .source and .target?
-                unitvalues.append((unit.getid(), fileid, index, \
-                                unit.source, unit.target, \
-                                sourcewords, targetwords, \
-                                statefordb(unit)))
-                file_totals_record = file_totals_record + FileTotals.new_record(statefordb(unit), sourcewords, targetwords)
+        for unitid, index, source, target, sourcewords, targetwords, state, digest in rows:
+            unitvalues.append((unitid, fileid, index, source, target, sourcewords, targetwords, state, digest))
+            file_totals_record = file_totals_record + FileTotals.new_record(state, sourcewords, targetwords)
         # XXX: executemany is non-standard
         self.cur.executemany("""INSERT INTO units
-            (unitid, fileid, unitindex, source, target, sourcewords, targetwords, state)
-            values (?, ?, ?, ?, ?, ?, ?, ?);""",
+            (unitid, fileid, unitindex, source, target, sourcewords, targetwords, state, hash)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?);""",
             unitvalues)
-        self.file_totals[fileid] = file_totals_record
-        if unitindex:
-            return state_strings[statefordb(units[0])]
-        return ""
+        self._setfiletotals(fileid, file_totals_record)
+
+    def _setfiletotals(self, fileid, record):
+        """Stores the totals of a file and updates the totals of its
+        directories with the difference."""
+        self.cur.execute("""SELECT path FROM files WHERE fileid=?;""", (fileid,))
+        (path,) = self.cur.fetchone()
+        difference = record - self.file_totals[fileid]
+        self.file_totals[fileid] = record
+        self.dir_totals.add(path, difference)
+
+    def _forgetfile(self, realpath):
+        """Removes a file and its statistics from the cache."""
+        self.cur.execute("""SELECT fileid FROM files WHERE
+            path=?;""", (realpath,))
+        filerow = self.cur.fetchone()
+        if filerow is None:
+            return
+        fileid = filerow[0]
+        self.dir_totals.add(realpath, FileTotals.new_record() - self.file_totals[fileid])
+        del self.file_totals[fileid]
+        for table in ("units", "uniterrors", "pendingchecks", "files"):
+            self.cur.execute("""DELETE FROM %s WHERE
+                fileid=?;""" % table, (fileid,))
 
     @transaction
     def _cachestore(self, store, realpath, mod_info):
         """Calculates and caches the statistics of the given store
         unconditionally."""
-        self.cur.execute("""DELETE FROM files WHERE
-            path=?;""", (realpath,))
-        self.cur.execute("""INSERT INTO files
-            (fileid, path, st_mtime, st_size, toolkitbuild) values (NULL, ?, ?, ?, ?);""",
-            (realpath, mod_info[0], mod_info[1], toolkitversion.build))
+        return self._cachestorerows(unitrows(store.units), realpath, mod_info)
+
+    def _cachestorerows(self, rows, realpath, mod_info):
+        self._forgetfile(realpath)
+        insert = """INSERT INTO files
+            (fileid, path, st_mtime, st_size, toolkitbuild) values (NULL, ?, ?, ?, ?);"""
+        values = (realpath, mod_info[0], mod_info[1], toolkitversion.build)
+        try:
+            self.cur.execute(insert, values)
+        except dbapi2.IntegrityError:
+            # Another thread or process cached the file since we looked. We
+            # hold the write lock now, so this time nobody can interfere.
+            self._forgetfile(realpath)
+            self.cur.execute(insert, values)
         fileid = self.cur.lastrowid
-        self.cur.execute("""DELETE FROM units WHERE
-            fileid=?""", (fileid,))
-        self._cacheunitstats(store.units, fileid)
+        self._cacheunitrows(rows, fileid)
         return fileid
 
+    @transaction
+    def _recachestore(self, store, fileid, mod_info):
+        """Updates the statistics of a cached file that changed. Only units
+        that changed are counted again, and their checks are marked as
+        pending."""
+        entries = [(index, unithash(unit), unit)
+                   for index, unit in enumerate(store.units) if unit.istranslatable()]
+        return self._recacherows(fileid, mod_info, entries, unitrow)
+
+    def _recacherows(self, fileid, mod_info, entries, makerow):
+        """Updates the units of a cached file to match entries, a list of
+        (unitindex, hash, item) tuples in the order of the file. Units with a
+        hash that is already cached are kept (and moved to their new index),
+        for the others makerow(item, unitindex, hash) is called to get their
+        row."""
+        self.cur.execute("""UPDATE files
+            SET st_mtime=?, st_size=?, toolkitbuild=?
+            WHERE fileid=?;""", (mod_info[0], mod_info[1], toolkitversion.build, fileid))
+        self.cur.execute("""SELECT id, unitindex, hash, sourcewords, targetwords, state
+            FROM units WHERE fileid=? ORDER BY unitindex;""", (fileid,))
+        cached = {}
+        for row in self.cur.fetchall():
+            cached.setdefault(row[2], []).append(row)
+
+        totals = FileTotals.new_record()
+        moved = []
+        # maps the old index of every unit we keep to its new index
+        newindex = {}
+        newrows = []
+        for index, digest, item in entries:
+            if cached.get(digest):
+                rowid, oldindex, _digest, sourcewords, targetwords, state = cached[digest].pop(0)
+                newindex[oldindex] = index
+                if oldindex != index:
+                    moved.append((index, rowid))
+                totals = totals + FileTotals.new_record(state, sourcewords, targetwords)
+            else:
+                newrows.append(makerow(item, index, digest))
+        removed = [(row[0],) for rows in cached.itervalues() for row in rows]
+
+        self.cur.executemany("""DELETE FROM units WHERE id=?;""", removed)
+        self.cur.executemany("""UPDATE units SET unitindex=? WHERE id=?;""", moved)
+        self._cacheunitrows(newrows, fileid, totals)
+
+        # Move the errors of units we kept along with them, and forget the
+        # others. The units that changed have to be checked again with every
+        # configuration that has checked this file.
+        self.cur.execute("""SELECT DISTINCT configid FROM uniterrors
+            WHERE fileid=?;""", (fileid,))
+        configids = [row[0] for row in self.cur.fetchall()]
+        for table, key in (("uniterrors", "errorid"), ("pendingchecks", "rowid")):
+            self.cur.execute("""SELECT %s, unitindex FROM %s
+                WHERE fileid=? AND unitindex >= 0;""" % (key, table), (fileid,))
+            updates, deletes = [], []
+            for rowid, index in self.cur.fetchall():
+                if index not in newindex:
+                    deletes.append((rowid,))
+                elif newindex[index] != index:
+                    updates.append((newindex[index], rowid))
+            self.cur.executemany("""DELETE FROM %s WHERE %s=?;""" % (table, key), deletes)
+            self.cur.executemany("""UPDATE %s SET unitindex=? WHERE %s=?;""" % (table, key), updates)
+        self.cur.executemany("""INSERT INTO pendingchecks
+            (fileid, configid, unitindex) values (?, ?, ?);""",
+            [(fileid, configid, row[1]) for configid in configids for row in newrows])
+        return fileid
+
+    @transaction
+    def dirtotals(self, dirname):
+        """Returns the sum of the totals of all the files in and below the
+        given directory that are in the cache, without checking whether the
+        files changed."""
+        path = os.path.realpath(_unicodepath(dirname))
+        return self.dir_totals[path]
+
+    @transaction
+    def needsupdate(self, filename):
+        """Returns True if the statistics of the file are not in the cache, or
+        the file changed since they were cached."""
+        realpath = os.path.realpath(_unicodepath(filename))
+        self.cur.execute("""SELECT st_mtime, st_size FROM files
+                WHERE path=?;""", (realpath,))
+        filerow = self.cur.fetchone()
+        return filerow is None or tuple(filerow) != get_mod_info(realpath)
+
+    @transaction
+    def cachefilerows(self, realpath, mod_info, rows):
+        """Caches the statistics calculated by L{filerows}, possibly in
+        another process."""
+        self.cur.execute("""SELECT fileid FROM files WHERE
+            path=?;""", (realpath,))
+        filerow = self.cur.fetchone()
+        if filerow:
+            entries = [(row[1], row[7], row) for row in rows]
+            return self._recacherows(filerow[0], mod_info, entries, lambda row, index, digest: row)
+        return self._cachestorerows(rows, realpath, mod_info)
+
+    @transaction
     def filetotals(self, filename, store=None):
         """Retrieves the statistics for the given file if possible, otherwise
         delegates to cachestore()."""
@@ -451,15 +1039,14 @@ class StatsCache(object):
         unitvalues = [dummy]
         # if we are doing a single unit, we want to return the checknames
         errornames = []
-        for index, unit in enumerate(units):
-            if unit.istranslatable():
-                # Correctly assign the unitindex
-                if unitindex:
-                    index = unitindex
-                failures = checker.run_filters(unit)
-                for checkname, checkmessage in failures.iteritems():
-                    unitvalues.append((index, fileid, configid, checkname, checkmessage))
-                    errornames.append("check-" + checkname)
+        # Correctly assign the unitindex
+        translatable = [(unitindex or index, unit)
+                        for index, unit in enumerate(units) if unit.istranslatable()]
+        results = self.runchecks(checker, [unit for index, unit in translatable])
+        for (index, unit), failures in zip(translatable, results):
+            for checkname, checkmessage in failures.iteritems():
+                unitvalues.append((index, fileid, configid, checkname, checkmessage))
+                errornames.append("check-" + checkname)
         checker.setsuggestionstore(None)
 
         if unitindex:
@@ -483,9 +1070,85 @@ class StatsCache(object):
         # fill up the database without much use.
         self.cur.execute("""DELETE FROM uniterrors WHERE
             fileid=?;""", (fileid,))
+        self.cur.execute("""DELETE FROM pendingchecks WHERE
+            fileid=?;""", (fileid,))
         self._cacheunitschecks(store.units, fileid, configid, checker)
         return fileid
 
+    @transaction
+    def _cachependingchecks(self, fileid, store, checker, configid, unitindices):
+        """Runs the checks for the units that changed since the file was
+        last checked with this configuration."""
+        unitvalues = []
+        results = self.runchecks(checker, [store.units[index] for index in unitindices])
+        for index, failures in zip(unitindices, results):
+            for checkname, checkmessage in failures.iteritems():
+                unitvalues.append((index, fileid, configid, checkname, checkmessage))
+        checker.setsuggestionstore(None)
+        self.cur.executemany("""INSERT INTO uniterrors
+            (unitindex, fileid, configid, name, message)
+            values (?, ?, ?, ?, ?);""",
+            unitvalues)
+        self.cur.execute("""DELETE FROM pendingchecks WHERE
+            fileid=? AND configid=?;""", (fileid, configid))
+
+    @transaction
+    def runchecks(self, checker, units):
+        """Returns the failures that checker.run_filters() finds in each of
+        the units.
+
+        The failures are kept in the cache by the hash of the checker and
+        of the content of the unit (see L{checkerhash} and L{unitcheckhash}),
+        wherever the unit is. Only units that weren't checked with the same
+        checker before are checked, so files that were merged, reordered or
+        generated again are checked quickly. The least recently used
+        results are forgotten when there are more than checkcachesize."""
+        if _suggestionstores(checker):
+            # the suggestions aren't part of the hash
+            checker.prepare(units)
+            return [checker.run_filters(unit) for unit in units]
+        checkerdigest = checkerhash(checker)
+        digests = [unitcheckhash(unit) for unit in units]
+        cached = {}
+        unique = list(set(digests))
+        # stay below the limit of the number of parameters of SQLite
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start+500]
+            self.cur.execute("""SELECT unithash, failures FROM checkresults
+                WHERE checkerhash=? AND unithash IN (%s);""" % ", ".join(["?"] * len(chunk)),
+                [checkerdigest] + chunk)
+            for digest, failures in self.cur.fetchall():
+                cached[digest] = json.loads(failures)
+        checker.prepare([unit for unit, digest in zip(units, digests) if digest not in cached])
+        checked = {}
+        results = []
+        for unit, digest in zip(units, digests):
+            if digest in cached:
+                failures = cached[digest]
+            elif digest in checked:
+                failures = checked[digest]
+            else:
+                failures = checked[digest] = checker.run_filters(unit)
+            results.append(dict(failures))
+
+        self.cur.execute("""SELECT MAX(lastused) FROM checkresults;""")
+        lastused = (self.cur.fetchone()[0] or 0) + 1
+        self.cur.executemany("""UPDATE checkresults SET lastused=?
+            WHERE checkerhash=? AND unithash=?;""",
+            [(lastused, checkerdigest, digest) for digest in cached])
+        self.cur.executemany("""INSERT OR REPLACE INTO checkresults
+            (checkerhash, unithash, failures, lastused) values (?, ?, ?, ?);""",
+            [(checkerdigest, digest, json.dumps(failures), lastused)
+             for digest, failures in checked.iteritems()])
+        if checked:
+            self.cur.execute("""SELECT COUNT(*) FROM checkresults;""")
+            excess = self.cur.fetchone()[0] - self.checkcachesize
+            if excess > 0:
+                self.cur.execute("""DELETE FROM checkresults WHERE rowid IN
+                    (SELECT rowid FROM checkresults ORDER BY lastused LIMIT ?);""", (excess,))
+        return results
+
+    @transaction
     def get_unit_stats(self, fileid, unitid):
         values = self.cur.execute("""
             SELECT   state, sourcewords, targetwords
@@ -527,7 +1190,7 @@ class StatsCache(object):
         self.cur.execute("""DELETE FROM uniterrors WHERE
             fileid=? AND unitindex=?;""", (fileid, unitindex))
         if os.path.exists(suggestion_filename(filename)):
-            checker.setsuggestionstore(factory.getobject(suggestion_filename(filename), ignore=suggestion_extension()))
+            checker.setsuggestionstore(factory.getobject(suggestion_filename(filename), ignore=suggestion_extension(), readonly=True))
         state.extend(self._cacheunitschecks([unit], fileid, configid, checker, unitindex))
         return state
 
@@ -540,20 +1203,29 @@ class StatsCache(object):
                 ORDER BY unitindex;""", (fileid, configid))
             return self.cur.fetchone(), self.cur
 
+        def getstore(store):
+            if callable(store):
+                store = store()
+            else:
+                store = store or factory.getobject(filename, readonly=True)
+            if os.path.exists(suggestion_filename(filename)):
+                checker.setsuggestionstore(factory.getobject(suggestion_filename(filename), ignore=suggestion_extension(), readonly=True))
+            return store
+
+        self.cur.execute("""SELECT unitindex FROM pendingchecks
+            WHERE fileid=? AND configid=?;""", (fileid, configid))
+        pending = [row[0] for row in self.cur.fetchall()]
+        if pending:
+            # only some units changed since we checked the file
+            self._cachependingchecks(fileid, getstore(store), checker, configid, pending)
+
         first, cur = geterrors()
         if first is not None:
             return first, cur
 
-        # This could happen if we haven't done the checks before, or the
-        # file changed, or we are using a different configuration
-        if callable(store):
-            store = store()
-        else:
-            store = store or factory.getobject(filename)
-
-        if os.path.exists(suggestion_filename(filename)):
-            checker.setsuggestionstore(factory.getobject(suggestion_filename(filename), ignore=suggestion_extension()))
-        self._cachestorechecks(fileid, store, checker, configid)
+        # This could happen if we haven't done the checks before, or we are
+        # using a different configuration
+        self._cachestorechecks(fileid, getstore(store), checker, configid)
         return geterrors()
 
     def _geterrors(self, filename, fileid, configid, checker, store):
@@ -573,6 +1245,7 @@ class StatsCache(object):
             (str(checker.config.__dict__),))
         return self.cur.lastrowid
 
+    @transaction
     def filechecks(self, filename, checker, store=None):
         """Retrieves the error statistics for the given file if possible,
         otherwise delegates to cachestorechecks()."""
@@ -591,6 +1264,7 @@ class StatsCache(object):
 
         return errors
 
+    @transaction
     def file_fails_test(self, filename, checker, name):
         fileid = self._getfileid(filename)
         configid = self._get_config_id(fileid, checker) 
@@ -602,6 +1276,7 @@ class StatsCache(object):
             WHERE fileid=? and configid=? and name=?;""", (fileid, configid, name))
         return self.cur.fetchone() is not None
 
+    @transaction
     def filestatestats(self, filename, store=None):
         """Return a dictionary of unit stats mapping sets of unit
         indices with those states"""
@@ -621,6 +1296,7 @@ class StatsCache(object):
 
         return stats
 
+    @transaction
     def filestats(self, filename, checker, store=None):
         """Return a dictionary of property names mapping sets of unit
         indices with those properties."""
@@ -629,6 +1305,7 @@ class StatsCache(object):
         stats.update(self.filestatestats(filename, store))
         return stats
 
+    @transaction
     def unitstats(self, filename, _lang=None, store=None):
         # For now, lang and store are unused. lang will allow the user to
         # base stats information on the given language. See the commented
@@ -22,6 +22,7 @@
 
 from translate.misc.multistring import multistring
 from translate.storage import base
+from translate.misc import wStringIO
 from translate.storage.placeables import general, parse as rich_parse
 from py import test
 import os
@@ -278,6 +279,17 @@ class TestTranslationStore(object):
         newstore = self.reparse(store)
         self.check_equality(store, newstore)
 
+    def test_serialize(self):
+        """Tests that serialize() writes the same as str()"""
+        store = self.StoreClass()
+        unit1 = store.addsourceunit("Test String")
+        unit1.target = "Test String"
+        unit2 = store.addsourceunit(u"T\xebst String 2")
+        unit2.target = u"T\xebst String 2"
+        outputfile = wStringIO.StringIO()
+        store.serialize(outputfile)
+        assert outputfile.getvalue() == str(store)
+
     def test_files(self):
         """Tests saving to and loading from files"""
         store = self.StoreClass()
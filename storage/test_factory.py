@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from translate.storage import base
 from translate.storage import factory
 from translate.storage.directory import Directory
 from translate.misc import wStringIO
@@ -106,6 +107,73 @@ class BaseTestFactory:
         store = factory.getobject(filename)
         assert isinstance(store, self.expected_instance)
 
+    def test_iterunits(self):
+        """Test that iterunits yields the units of the file."""
+        filename = os.path.join(self.testdir, self.filename + '.gz')
+        gzfile = GzipFile(filename, mode="wb")
+        gzfile.write(self.file_content)
+        gzfile.close()
+        units = list(factory.iterunits(filename))
+        assert [unit.source for unit in units] == [unit.source for unit in factory.getobject(filename).units]
+        assert [unit.source for unit in factory.iterunits(givefile(self.filename, self.file_content))] == \
+               [unit.source for unit in units]
+
+    def test_cache(self):
+        """Test that read only stores are only parsed again when the file
+        changes."""
+        filename = os.path.join(self.testdir, self.filename)
+        open(filename, "w").write(self.file_content)
+        factory.usecache()
+        try:
+            store = factory.getobject(filename, readonly=True)
+            assert factory.getobject(filename, readonly=True) is store
+            assert factory.getobject(os.path.join(self.testdir, ".", self.filename), readonly=True) is store
+            assert factory.getobject(filename) is not store
+            stats = factory.cachestats()
+            assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+            assert stats["used"] == len(self.file_content)
+            open(filename, "a").write("\n")
+            newstore = factory.getobject(filename, readonly=True)
+            assert newstore is not store
+            assert factory.cachestats()["size"] == 1
+            factory.usecache(len(self.file_content))
+            assert factory.getobject(filename, readonly=True) is not newstore
+            assert factory.cachestats()["size"] == 0
+        finally:
+            factory.usecache(0)
+        assert factory.cachestats() is None
+        assert factory.getobject(filename, readonly=True) is not factory.getobject(filename, readonly=True)
+
+    def test_cache_readonly(self):
+        """Test that the stores shared by the cache can't be changed."""
+        filename = os.path.join(self.testdir, self.filename)
+        open(filename, "w").write(self.file_content)
+        factory.usecache()
+        try:
+            store = factory.getobject(filename, readonly=True)
+            original = factory.getobject(filename)
+            assert isinstance(store, original.__class__)
+            assert isinstance(store.units[0], base.TranslationUnit)
+            assert [unit.source for unit in store.units] == [unit.source for unit in original.units]
+            assert store.units[0] == original.units[0]
+            assert str(store) == str(original)
+            assert store.findunit(store.units[0].source) is store.units[0]
+            assert factory.getobject(store) is store
+            for change in (lambda: store.units[0].settarget(u"changed"),
+                           lambda: setattr(store.units[0], "target", u"changed"),
+                           lambda: store.addunit(original.units[0]),
+                           lambda: setattr(store, "units", []),
+                           lambda: store.units.append(original.units[0])):
+                try:
+                    change()
+                except (factory.ReadOnlyError, AttributeError):
+                    pass
+                else:
+                    assert False, "the shared store was changed"
+            assert str(factory.getobject(filename, readonly=True)) == str(original)
+        finally:
+            factory.usecache(0)
+
     def test_bz2file(self):
         """Test that we can open a gzip file correctly."""
         if not BZ2File:
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import ast
+import cStringIO
+import os
+
+from translate.storage import poparser
+from translate.storage import pypo
+
+def corpus():
+    """Returns every string constant that looks like PO in the tests of the
+    toolkit, and the PO files of the conformance tests."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.startswith("test_") and filename.endswith(".py"):
+                try:
+                    tree = ast.parse(open(path).read(), path)
+                except SyntaxError:
+                    continue
+                for node in ast.walk(tree):
+                    if isinstance(node, ast.Str) and "msgid" in node.s:
+                        if isinstance(node.s, unicode):
+                            sources.append(node.s.encode("utf-8"))
+                        else:
+                            sources.append(node.s)
+            elif filename.endswith(".po") and not dirpath.startswith(os.path.join(root, "Test")):
+                sources.append(open(path).read())
+    return sources
+
+# things that are unusual in real files
+edge_cases = [
+    '',
+    '\n\n',
+    '# just a comment\n',
+    'msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=CHARSET\\n"\n\nmsgid "a"\nmsgstr "b"\n',
+    'msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=utf8\\n"\n\nmsgid "\xc3\xa9"\nmsgstr "e"',
+    'msgid "no header"\nmsgstr "geen kop"\n\n#| msgid "old"\nmsgid "new"\nmsgstr "nuut"\n',
+    '#| msgctxt "c"\n#| msgid "old"\n#| msgid_plural "olds"\nmsgid "first"\nmsgstr ""\n',
+    'msgid "unterminated\nmsgstr "x"\n',
+    'msgid "a" \t\nmsgstr\t"b"\n   "c"\n\n\t\nmsgid "d"\nmsgstr "e"\n',
+    'msgid "_: comment\\n"\n"text"\nmsgstr "teks"\n',
+    'msgid ""\n"_: kde comment\\n"\n"text"\nmsgid_plural ""\n"_: plural comment"\n"texts"\nmsgstr[0] "t"\nmsgstr[1] "ts"\n',
+    'msgctxt "c"\nmsgid "a"\nmsgstr[0] "x"\nmsgstr[2] "z"\nmsgstr[2] "zz"\n',
+    'msgid "a"\nmsgid_plural "as"\nmsgstr "b"\n',
+    '#~ msgctxt "old context"\n#~ msgid "old"\n#~ msgstr "oud"\n\n#~ msgid "other"\n#~ msgstr ""\n#~ "more"\n',
+    '#, fuzzy\n#~ msgid "fuzzy obsolete"\n#~ msgstr "x"\n',
+    '#~ not a message\nmsgid "a"\nmsgstr "b"\n',
+    'msgid "a"\r\nmsgstr "b"\r\n\r\nmsgid "c"\r\nmsgstr "d"\r\n',
+    'msgid "\xc2\xa0"\nmsgstr "\xe2\x80\x83"\n\xc2\xa0\nmsgid "b"\nmsgstr "c"\n',
+    'garbage\nmsgid "a"\nmsgstr "b"\n',
+]
+
+def units(source, parse):
+    store = pypo.pofile()
+    store.units = []
+    parse(source, store)
+    # repr() to also compare types: u"a" == "a"
+    return repr(store._encoding), [repr(sorted([(key, value) for key, value in unit.__dict__.items() if key != "_store"]))
+                                   for unit in store.units]
+
+def slow_parse(source, store):
+    poparser.parse_units(poparser.ParseState(cStringIO.StringIO(source), pypo.pounit), store)
+
+def fast_parse(source, store):
+    assert poparser.fast_parse_units(source, store, pypo.pounit)
+
+class TestFastParser:
+    def test_corpus(self):
+        """Test that the fast parser gives exactly the same units as the
+        normal parser for all the PO in the tests"""
+        sources = corpus()
+        assert len(sources) > 100
+        compared = 0
+        for source in sources + edge_cases:
+            try:
+                expected = units(source, slow_parse)
+            except Exception:
+                continue
+            if not poparser.fast_parse_units(source, pypo.pofile(), pypo.pounit):
+                continue
+            compared += 1
+            assert units(source, fast_parse) == expected, source
+        assert compared > 100
+
+    def test_types(self):
+        """Test that the fast parser gives unicode strings, except for the
+        previous msgid of the first unit, like the normal parser"""
+        source = '#| msgid "old"\nmsgid "first"\nmsgstr ""\n\n#| msgid "old"\nmsgid "second"\nmsgstr ""\n'
+        for parse in (slow_parse, fast_parse):
+            store = pypo.pofile()
+            store.units = []
+            parse(source, store)
+            assert [type(line) for line in store.units[0].msgid + store.units[1].msgid] == [unicode, unicode]
+            assert type(store.units[0].prev_msgid[0]) == str
+            assert type(store.units[1].prev_msgid[0]) == unicode
+
+    def test_other_encodings(self):
+        """Test that files in other encodings are left to the normal parser"""
+        store = pypo.pofile()
+        latin1 = 'msgid ""\nmsgstr "Content-Type: text/plain; charset=ISO-8859-1\\n"\n\nmsgid "caf\xe9"\nmsgstr ""\n'
+        assert not poparser.fast_parse_units(latin1, store, pypo.pounit)
+        assert not poparser.fast_parse_units('msgid "caf\xe9"\nmsgstr ""\n', store, pypo.pounit)
+        assert not poparser.fast_parse_units('\xef\xbb\xbfmsgid "a"\nmsgstr "b"\n', store, pypo.pounit)
+        assert pypo.pofile(latin1).units[1].source == u"caf\xe9"
@@ -141,6 +141,40 @@ msgstr ""
         print str(unit)
         assert str(unit) == expected
 
+    def test_unquoted_cache(self):
+        """Tests that the unquoted source and target follow every change to
+        the quoted lines."""
+        unit = self.UnitClass("Cow")
+        assert unit.source == "Cow"
+        unit.msgid = ['"Bull"']
+        assert unit.source == "Bull"
+        unit.msgid.append('"s"')
+        assert unit.source == "Bulls"
+        unit.msgid_plural = ['"Cows"']
+        assert unit.source.strings == ["Bulls", "Cows"]
+        unit.source = "Ox"
+        assert unit.source.strings == ["Ox"]
+        assert unit.target == ""
+        unit.target = "Os"
+        assert unit.target == "Os"
+        unit.msgstr[0] = '"Bees"'
+        assert unit.target == "Bees"
+        unit.makeobsolete()
+        assert unit.source == unit.target == ""
+        unit.resurrect()
+        assert unit.source == "Ox"
+        assert unit.target == "Bees"
+        other = self.UnitClass("Ox")
+        other.target = "Bul"
+        unit.merge(other, overwrite=True)
+        assert unit.target == "Bul"
+
+    def test_unquoted_cache_copies(self):
+        """Tests that changing a returned source doesn't change the unit."""
+        unit = self.UnitClass("Cow")
+        unit.source.strings[0] = "Bull"
+        assert unit.source.strings == ["Cow"]
+
 class TestPYPOFile(test_po.TestPOFile):
     StoreClass = pypo.pofile
     def test_combine_msgidcomments(self):
@@ -266,3 +300,82 @@ msgstr[1] "toetse"
         assert pofile.units[4].prev_source == multistring([u"tast", u"tasts"])
 
         assert str(pofile) == posource
+
+    def test_iterparsefile(self):
+        """checks that iterparsefile yields the same units as parsing the
+        whole file, in the encoding of the file"""
+        posource = '''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=ISO-8859-1\\n"
+
+#: file.c:1
+msgid "Caf\xe9"
+msgstr "Kafee"
+
+#, fuzzy
+msgid "One"
+msgid_plural "Many"
+msgstr[0] "Een"
+msgstr[1] "Baie"
+
+#~ msgid "Old"
+#~ msgstr "Oud"
+'''
+        pofile = self.poparse(posource)
+        units = list(pypo.pofile.iterparsefile(wStringIO.StringIO(posource)))
+        assert len(units) == len(pofile.units) == 4
+        for unit, expected in zip(units, pofile.units):
+            assert unit.source == expected.source
+            assert unit.target == expected.target
+            assert unit.getlocations() == expected.getlocations()
+            assert unit.isobsolete() == expected.isobsolete()
+        assert units[1].source == u"Caf\xe9"
+        assert units[2].source.strings == [u"One", u"Many"]
+        assert units[2].isfuzzy()
+        assert "".join([str(unit) + "\n" for unit in units]).rstrip() + "\n" == str(pofile)
+        assert units[1]._store.filename == pofile.filename
+        assert units[1]._store.units == []
+
+    def test_iterparsefile_error(self):
+        """checks that iterparsefile raises ParseError like parse() does"""
+        units = pypo.pofile.iterparsefile(wStringIO.StringIO('msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=NOSUCHCHARSET\\n"\n\nmsgid "a"\nmsgstr "b"\n'))
+        assert raises(pypo.base.ParseError, list, units)
+
+    def test_serialize_whitespace(self):
+        """checks that serialize() strips the end of the file like str()"""
+        for posource in ['msgid "a"\nmsgstr "b"\n\n# trailing\n\n',
+                         '# lonely comment\n\nmsgid "a"\nmsgstr "b"\n',
+                         '# only a comment\n',
+                         '']:
+            pofile = self.poparse(posource)
+            pofile.addunit(self.StoreClass.UnitClass(""))
+            outputfile = wStringIO.StringIO()
+            pofile.serialize(outputfile)
+            assert outputfile.getvalue() == str(pofile)
+
+    def test_serialize_encoding(self):
+        """checks that serialize() writes in the encoding of the file"""
+        posource = 'msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=ISO-8859-1\\n"\n\nmsgid "caf\xe9"\nmsgstr "kafee"\n'
+        pofile = self.poparse(posource)
+        outputfile = wStringIO.StringIO()
+        pofile.serialize(outputfile)
+        assert outputfile.getvalue() == posource
+
+    def test_roundtrip_unquotes_nothing(self):
+        """checks that parsing and writing a file doesn't unquote the units"""
+        posource = 'msgid ""\nmsgstr ""\n"Content-Type: text/plain; charset=UTF-8\\n"\n\n#: a.c\nmsgid "one"\nmsgid_plural "two"\nmsgstr[0] "een"\nmsgstr[1] "twee"\n\n#~ msgid "old"\n#~ msgstr "oud"\n'
+        unquoted = []
+        unquotefrompo = pypo.unquotefrompo
+        def countingunquote(postr):
+            unquoted.append(postr)
+            return unquotefrompo(postr)
+        pypo.unquotefrompo = countingunquote
+        try:
+            pofile = self.poparse(posource)
+            assert str(pofile) == posource
+            assert unquoted == []
+            assert pofile.units[1].source.strings == ["one", "two"]
+            assert pofile.units[1].source.strings == ["one", "two"]
+            assert unquoted == [['"one"'], ['"two"']]
+        finally:
+            pypo.unquotefrompo = unquotefrompo
@@ -1,14 +1,18 @@
 #!/usr/bin/env python
 from translate import storage
 
+import gc
 import os
 import os.path
+import threading
+import time
 
 import py.test
 
 from translate.storage import statsdb, factory
 from translate.misc import wStringIO
 from translate.filters import checks
+from translate.filters import spelling
 import warnings
 
 fr_terminology_extract = r"""
@@ -77,9 +81,11 @@ msgstr ""
 """
 
 def rm_rf(path):
-    for dirpath, _, filenames in os.walk(path):
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
         for filename in filenames:
             os.remove(os.path.join(dirpath, filename))
+        for dirname in dirnames:
+            os.rmdir(os.path.join(dirpath, dirname))
     os.removedirs(path)
 
 class TestStatsDb:
@@ -148,3 +154,338 @@ class TestStatsDb:
         f1, cache1 = self.setup_file_and_db(jtoolkit_extract)
         f2, cache2 = self.setup_file_and_db(fr_terminology_extract)
         assert cache1 == cache2
+
+    def test_cachefilerows(self):
+        """Test that statistics calculated elsewhere are cached the same as
+        when the cache calculates them"""
+        f, cache = self.setup_file_and_db(jtoolkit_extract)
+        assert cache.needsupdate(f.filename)
+        expected = (cache.filetotals(f.filename), cache.unitstats(f.filename))
+        assert not cache.needsupdate(f.filename)
+        othercache = statsdb.StatsCache(os.path.join(self.path, "other.db"))
+        othercache.cachefilerows(*statsdb.filerows(f.filename))
+        assert not othercache.needsupdate(f.filename)
+        assert (othercache.filetotals(f.filename), othercache.unitstats(f.filename)) == expected
+
+    def test_dirtotals(self):
+        """Test that directory totals add up the totals of their files and
+        follow changes"""
+        cache = statsdb.StatsCache(os.path.join(self.path, "stats.db"))
+        os.makedirs(os.path.join(self.path, "af", "sub"))
+        filenames = [os.path.join(self.path, "af", "a.po"), os.path.join(self.path, "af", "sub", "b.po")]
+        open(filenames[0], "w").write(jtoolkit_extract)
+        open(filenames[1], "w").write(fr_terminology_extract)
+        totals = [cache.filetotals(filename) for filename in filenames]
+        assert cache.dirtotals(os.path.join(self.path, "af", "sub")) == totals[1]
+        assert cache.dirtotals(os.path.join(self.path, "af")) == totals[0] + totals[1]
+        assert cache.dirtotals(self.path)["total"] == totals[0]["total"] + totals[1]["total"]
+        assert cache.dirtotals(os.path.join(self.path, "nothing"))["total"] == 0
+
+        # the file changes
+        open(filenames[1], "w").write(fr_terminology_extract + '\nmsgid "new"\nmsgstr ""\n')
+        newtotals = cache.filetotals(filenames[1])
+        assert newtotals["untranslated"] == totals[1]["untranslated"] + 1
+        assert cache.dirtotals(os.path.join(self.path, "af")) == totals[0] + newtotals
+
+        # a single unit changes
+        store = factory.getobject(filenames[0])
+        cache.filestats(filenames[0], checks.UnitChecker())
+        store.units[4].settarget(u"")
+        cache.recacheunit(filenames[0], checks.UnitChecker(), store.units[4])
+        assert cache.dirtotals(os.path.join(self.path, "af")) == cache.filetotals(filenames[0]) + newtotals
+
+        # the totals are rebuilt for a database without them
+        expected = cache.dirtotals(self.path)
+        cache.cur.execute("DROP TABLE dirtotals")
+        cache.create()
+        assert cache.dirtotals(self.path) == expected
+
+    def test_incremental_recache(self):
+        """Test that only changed units are counted and checked again when a
+        file changes, with the same results as caching it from scratch"""
+        f, cache = self.setup_file_and_db(jtoolkit_extract)
+        checker = checks.UnitChecker()
+        cache.filestats(f.filename, checker)
+        cache.cur.execute("SELECT id FROM units ORDER BY unitindex")
+        ids = [row[0] for row in cache.cur.fetchall()]
+
+        # translate one unit and add a new one at the top
+        changed = jtoolkit_extract.replace('msgid ", please confirm login"\nmsgstr ""',
+                                           'msgid ", please confirm login"\nmsgstr ", bevestig asseblief"')
+        changed = changed.replace('#: web/server.py:57', 'msgid "New"\nmsgstr ""\n\n#: web/server.py:57')
+        assert changed.count("msgid") == jtoolkit_extract.count("msgid") + 1
+        open(f.filename, "w").write(changed)
+        os.utime(f.filename, (0, 0))
+
+        counted = []
+        wordsinunit = statsdb.wordsinunit
+        def countingwordsinunit(unit):
+            counted.append(unit.source)
+            return wordsinunit(unit)
+        checked = []
+        run_filters = checker.run_filters
+        def countingrun_filters(unit):
+            checked.append(unit.source)
+            return run_filters(unit)
+        statsdb.wordsinunit = countingwordsinunit
+        checker.run_filters = countingrun_filters
+        try:
+            stats = cache.filestats(f.filename, checker)
+            totals = cache.filetotals(f.filename)
+            unitstats = cache.unitstats(f.filename)
+        finally:
+            statsdb.wordsinunit = wordsinunit
+        assert sorted(counted) == sorted(checked) == [", please confirm login", "New"]
+        # unchanged units keep their rows
+        cache.cur.execute("SELECT id FROM units ORDER BY unitindex")
+        assert [row[0] for row in cache.cur.fetchall()][1:6] == ids[:5]
+
+        fresh = statsdb.StatsCache(os.path.join(self.path, "fresh.db"))
+        assert stats == fresh.filestats(f.filename, checks.UnitChecker())
+        assert totals == fresh.filetotals(f.filename)
+        assert unitstats == fresh.unitstats(f.filename)
+
+    def test_runchecks(self):
+        """Test that units are only checked again when their content or the
+        checker changes, wherever they are"""
+        f, cache = self.setup_file_and_db(jtoolkit_extract)
+        checker = checks.StandardChecker()
+        checked = []
+        run_filters = checker.run_filters
+        def countingrun_filters(unit):
+            checked.append(unit.source)
+            return run_filters(unit)
+        checker.run_filters = countingrun_filters
+        units = [unit for unit in f.units if unit.istranslatable()]
+        expected = [run_filters(unit) for unit in units]
+        assert cache.runchecks(checker, units) == expected
+        assert len(checked) == len(units)
+        # a reordered file with a changed unit
+        units.reverse()
+        expected.reverse()
+        units[0].target = u"Bevestig"
+        expected[0] = run_filters(units[0])
+        assert cache.runchecks(checker, units) == expected
+        assert checked[len(units):] == [units[0].source]
+        # another checker configuration
+        otherchecker = checks.StandardChecker(checks.CheckerConfig(targetlanguage="fr"))
+        assert statsdb.checkerhash(otherchecker) != statsdb.checkerhash(checker)
+        assert statsdb.checkerhash(checks.StandardChecker()) == statsdb.checkerhash(checker)
+        cache.runchecks(otherchecker, units[:2])
+        # the least recently used results are forgotten first
+        cache.checkcachesize = 3
+        try:
+            cache.runchecks(checker, units[1:3])
+            units[3].target = u"Nuut"
+            cache.runchecks(checker, units[3:4])
+            cache.cur.execute("SELECT COUNT(*) FROM checkresults")
+            assert cache.cur.fetchone()[0] == 3
+            del checked[:]
+            assert cache.runchecks(checker, units[1:3]) == expected[1:3]
+            assert checked == []
+            cache.runchecks(checker, units[:1])
+            assert checked == [units[0].source]
+        finally:
+            cache.checkcachesize = statsdb.CHECK_CACHE_SIZE
+        # suggestions aren't part of the hash
+        checker.suggestion_store = f
+        cache.runchecks(checker, units[:1])
+        assert checked == [units[0].source] * 2
+
+    def test_checkerhash(self):
+        """Test that the hash of a checker doesn't depend on the order of the
+        dictionaries in its configuration, but does on the toolkit version"""
+        first, second = checks.StandardChecker(), checks.StandardChecker()
+        # 1 and 9 go in the same slot, so they are iterated in the order
+        # they were added
+        first.config.validcharsmap = {1: None, 9: None}
+        second.config.validcharsmap = {9: None, 1: None}
+        first.config.notranslatewords = dict.fromkeys([u"Mozilla", u"Firefox"])
+        second.config.notranslatewords = dict.fromkeys([u"Firefox", u"Mozilla"])
+        assert str(first.config.validcharsmap) != str(second.config.validcharsmap)
+        assert statsdb.checkerhash(first) == statsdb.checkerhash(second)
+        build = statsdb.toolkitversion.build
+        oldhash = statsdb.checkerhash(first)
+        try:
+            statsdb.toolkitversion.build += 1
+            assert statsdb.checkerhash(first) != oldhash
+            assert statsdb.checkerhash(first) == statsdb.checkerhash(second)
+        finally:
+            statsdb.toolkitversion.build = build
+
+    def test_checkerhash_spelling(self):
+        """Test that the hash of a checker changes with its spelling
+        dictionaries"""
+        checker = checks.StandardChecker(checks.CheckerConfig(targetlanguage="af"))
+        assert "spellcheck" in checker.defaultfilters
+        cachedir, available = spelling.cachedir, spelling.available
+        spelling.cachedir = ""
+        try:
+            nodictionary = statsdb.checkerhash(checker)
+            spelling.setdictionary("af", spelling.WordListDictionary([u"leer"]))
+            first = statsdb.checkerhash(checker)
+            assert first != nodictionary
+            spelling.setdictionary("af", spelling.WordListDictionary([u"leer", u"oop"]))
+            assert statsdb.checkerhash(checker) != first
+            # without spellcheck, the dictionary doesn't matter
+            checker = checks.StandardChecker(checks.CheckerConfig(targetlanguage="af"), excludefilters={"spellcheck": True})
+            withoutspelling = statsdb.checkerhash(checker)
+            spelling.setdictionary("af", spelling.WordListDictionary([u"leer"]))
+            assert statsdb.checkerhash(checker) == withoutspelling
+        finally:
+            spelling.cachedir, spelling.available = cachedir, available
+            spelling._dictionaries.pop("af", None)
+            spelling._checkers.pop("af", None)
+
+    def test_runchecks_persist(self):
+        """Test that the check results are reused by other processes, even if
+        no file was cached"""
+        f, cache = self.setup_file_and_db(jtoolkit_extract)
+        units = [unit for unit in f.units if unit.istranslatable()]
+        expected = cache.runchecks(checks.StandardChecker(), units)
+        cache.release()
+        statsfile = os.path.realpath(os.path.join(self.path, "stats.db"))
+        # what another process would get
+        del statsdb.StatsCache._caches[statsfile]
+        try:
+            newcache = statsdb.StatsCache(statsfile)
+        finally:
+            cache.pool.close()
+        assert newcache is not cache
+        checker = checks.StandardChecker()
+        checked = []
+        def countingrun_filters(unit):
+            checked.append(unit.source)
+        checker.run_filters = countingrun_filters
+        assert newcache.runchecks(checker, units) == expected
+        assert checked == []
+
+    def test_threads(self):
+        """Test that threads share the cache and a bounded number of
+        connections"""
+        cache = statsdb.StatsCache(os.path.join(self.path, "threads.db"))
+        filenames = []
+        for i in range(4):
+            filenames.append(os.path.join(self.path, "file%d.po" % i))
+            open(filenames[-1], "w").write(jtoolkit_extract)
+        expected = statsdb.StatsCache(os.path.join(self.path, "expected.db")).filetotals(filenames[0])
+        results = []
+        caches = []
+        def count(filename):
+            caches.append(statsdb.StatsCache(os.path.join(self.path, "threads.db")))
+            for i in range(5):
+                results.append(caches[-1].filetotals(filename))
+        threads = [threading.Thread(target=count, args=(filename,)) for filename in filenames * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [expected] * 60
+        assert caches == [cache] * 12
+        stats = cache.stats()
+        assert stats["connections"] <= stats["size"]
+        assert stats["acquired"] >= 60
+        assert stats["busy"] == 0
+
+    def test_pool_waits(self):
+        """Test that the pool counts callers waiting for a connection"""
+        pool = statsdb.ConnectionPool(os.path.join(self.path, "pool.db"), size=1)
+        con = pool.acquire()
+        acquired = []
+        def acquire():
+            acquired.append(pool.acquire())
+            pool.release(acquired[-1])
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        time.sleep(0.1)
+        assert not acquired
+        pool.release(con)
+        thread.join()
+        assert acquired == [con]
+        stats = pool.stats()
+        assert stats["waits"] == 1
+        assert stats["waittime"] > 0
+        assert stats["acquired"] == 2
+        assert stats["connections"] == 1
+        pool.close()
+
+    def test_pool_timeout(self):
+        """Test that callers give up waiting for a connection that is never
+        released"""
+        pool = statsdb.ConnectionPool(os.path.join(self.path, "pool.db"), size=1)
+        con = pool.acquire()
+        py.test.raises(statsdb.PoolTimeoutError, pool.acquire, 0.1)
+        assert pool.stats()["timeouts"] == 1
+        pool.release(con)
+        assert pool.acquire(0.1) is con
+        pool.release(con)
+        pool.close()
+
+    def test_pinned_timeout(self):
+        """Test that threads using the cursor outside a transaction keep their
+        connection until they release it"""
+        cache = statsdb.StatsCache(os.path.join(self.path, "pinned.db"))
+        pool = cache.pool
+        cache.pool = statsdb.ConnectionPool(pool.statsfile, size=1)
+        pool.close()
+        errors = []
+        def usecursor():
+            try:
+                cache.cur.execute("SELECT COUNT(*) FROM files")
+            except statsdb.PoolTimeoutError, e:
+                errors.append(e)
+        timeout = statsdb.POOL_TIMEOUT
+        statsdb.POOL_TIMEOUT = 0.1
+        try:
+            usecursor()
+            thread = threading.Thread(target=usecursor)
+            thread.start()
+            thread.join()
+            assert len(errors) == 1
+            cache.release()
+            thread = threading.Thread(target=usecursor)
+            thread.start()
+            thread.join()
+            assert len(errors) == 1
+        finally:
+            statsdb.POOL_TIMEOUT = timeout
+
+    def test_pinned_thread_exit(self):
+        """Test that the connection of a thread that ends without releasing
+        it goes back to the pool"""
+        cache = statsdb.StatsCache(os.path.join(self.path, "exit.db"))
+        pool = cache.pool
+        cache.pool = statsdb.ConnectionPool(pool.statsfile, size=1)
+        pool.close()
+        def usecursor():
+            cache.cur.execute("SELECT COUNT(*) FROM files")
+        thread = threading.Thread(target=usecursor)
+        thread.start()
+        thread.join()
+        assert cache.pool.stats()["idle"] == 0
+        del thread
+        gc.collect()
+        assert cache.pool.stats()["idle"] == 1
+        assert not cache._pinned
+        cache.pool.acquire(timeout=0.1)
+
+    def test_migration(self):
+        """Test that a cache made by an older version is emptied in place"""
+        f, cache = self.setup_file_and_db(jtoolkit_extract)
+        cache.filetotals(f.filename)
+        cache.cur.execute("PRAGMA user_version=0")
+        cache.release()
+        statsfile = os.path.realpath(os.path.join(self.path, "stats.db"))
+        inode = os.stat(statsfile).st_ino
+        # another process still has the old file open
+        other = statsdb.dbapi2.connect(statsfile)
+        del statsdb.StatsCache._caches[statsfile]
+        try:
+            newcache = statsdb.StatsCache(statsfile)
+        finally:
+            cache.pool.close()
+        assert newcache is not cache
+        assert os.stat(statsfile).st_ino == inode
+        assert other.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+        other.close()
+        assert newcache.filetotals(f.filename) == cache.filetotals(f.filename)
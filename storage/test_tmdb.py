@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+from translate.storage import tmdb
+from translate.storage import po
+
+tm_source = r'''msgid "Open the file"
+msgstr "Maak die lêer oop"
+
+msgid "Close the file"
+msgstr "Maak die lêer toe"
+
+msgid "Save the file"
+msgstr "Stoor die lêer"
+'''
+
+def rm_rf(path):
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            os.remove(os.path.join(dirpath, filename))
+    os.removedirs(path)
+
+class TestTMDB:
+    def get_test_path(self, method):
+        return os.path.realpath("%s_%s" % (self.__class__.__name__, method.__name__))
+
+    def setup_method(self, method):
+        self.path = self.get_test_path(method)
+        if os.path.exists(self.path):
+            rm_rf(self.path)
+        os.makedirs(self.path)
+        self.dbfile = os.path.join(self.path, "tm.db")
+
+    def teardown_method(self, method):
+        if os.path.exists(self.path):
+            rm_rf(self.path)
+
+    def test_memory(self):
+        """Test that lookups see the units in an in-memory database"""
+        db = tmdb.TMDB(":memory:")
+        assert db.add_store(po.pofile(tm_source), "en", "af") == 3
+        results = db.translate_unit("Open the files", "en", "af")
+        assert results[0]["target"] == u"Maak die lêer oop"
+        db.close()
+
+    def test_concurrent_lookups(self):
+        """Test lookups from many threads on a database file"""
+        db = tmdb.TMDB(self.dbfile, pool_size=2)
+        db.add_store(po.pofile(tm_source), "en", "af")
+        results = []
+        def lookup():
+            for i in range(10):
+                results.append(db.translate_unit("Save the files", "en", "af")[0]["target"])
+        threads = [threading.Thread(target=lookup) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [u"Stoor die lêer"] * 50
+        # the pool never opens more connections than its size
+        assert len(db._tm_db["readers"]._connections) <= 2
+        db.close()
+
+    def test_readonly_lookups(self):
+        """Test that connections used for lookups can't change the database"""
+        if tmdb.dbapi2.sqlite_version_info < (3, 8, 0):
+            return
+        db = tmdb.TMDB(self.dbfile)
+        connection = db._acquire_reader()
+        try:
+            try:
+                connection.execute("DELETE FROM sources")
+                assert False, "expected an OperationalError"
+            except tmdb.dbapi2.OperationalError:
+                pass
+        finally:
+            db._release_reader(connection)
+        db.close()
+
+    def test_write_queue(self):
+        """Test that the write queue runs writes in order and passes on
+        results and errors"""
+        db = tmdb.TMDB(self.dbfile)
+        writer = tmdb.WriteQueue()
+        assert writer.submit(db.add_store, po.pofile(tm_source), "en", "af") == 3
+        try:
+            writer.submit(db.add_store, po.pofile(tm_source), None, None)
+            assert False, "expected a LanguageError"
+        except tmdb.LanguageError:
+            pass
+        writer.close()
+        assert db.translate_unit("Close the file", "en", "af")[0]["quality"] == 100
+        db.close()
+
+    def test_bulk(self):
+        """Test that a bulk import gives the same database as adding units
+        one by one"""
+        units = [{"source": u"File", "target": u"Lêer", "context": u""},
+                 {"source": u"File", "target": u"Lêer", "context": u""},
+                 {"source": u"File", "target": u"Dossier", "context": u""},
+                 {"source": u"File", "target": u"Lêer", "context": u"menu"},
+                 {"source": u"Open the new file", "target": u"Maak die nuwe lêer oop", "context": u""}]
+        def contents(db):
+            tables = []
+            for query in ("SELECT sid, text, context, lang, length FROM sources ORDER BY sid",
+                          "SELECT tid, sid, text, lang FROM targets ORDER BY tid"):
+                db.cursor.execute(query)
+                tables.append(db.cursor.fetchall())
+            if db.fulltext:
+                db.cursor.execute("SELECT docid FROM fulltext WHERE fulltext MATCH 'file' ORDER BY docid")
+                tables.append(db.cursor.fetchall())
+            return tables
+
+        expected = tmdb.TMDB(os.path.join(self.path, "rows.db"))
+        expected.add_store(po.pofile(tm_source), "en", "af")
+        expected.add_list(units, "en", "af")
+        expected.add_list(units[:2], "en_US", "af")
+
+        db = tmdb.TMDB(self.dbfile)
+        # some units are already in the database
+        db.add_list(units[2:4], "en", "af")
+        loader = db.bulk_loader(batch_size=2)
+        assert loader.add_store(po.pofile(tm_source), "en", "af") == 3
+        loader.add_list(units, "en", "af")
+        loader.add_list(units[:2], "en_US", "af")
+        loader.commit()
+        # the ids differ, since some units were added first
+        assert sorted([row[1:] for row in contents(db)[0]]) == sorted([row[1:] for row in contents(expected)[0]])
+        assert len(contents(db)[1]) == len(contents(expected)[1])
+        assert db.translate_unit("Open the file", "en", "af") == expected.translate_unit("Open the file", "en", "af")
+        assert db.translate_unit("File", "en_US", "af") == expected.translate_unit("File", "en_US", "af")
+        if db.fulltext:
+            assert len(contents(db)[2]) == len(contents(expected)[2])
+            # new units are indexed by the trigger again
+            db.add_dict({"source": u"Another file", "target": u"Nog 'n lêer", "context": u""}, "en", "af")
+            assert len(contents(db)[2]) == len(contents(expected)[2]) + 1
+        db.close()
+        expected.close()
+
+    def test_bulk_trigger(self):
+        """Test that other connections always see the fulltext trigger
+        during a bulk import, even when it fails"""
+        db = tmdb.TMDB(self.dbfile)
+        if not db.fulltext:
+            db.close()
+            return
+        other = tmdb.connect(self.dbfile, readonly=True)
+        def hastrigger():
+            return other.execute("""SELECT COUNT(*) FROM sqlite_master
+                WHERE type = 'trigger' AND name = 'sources_insert_trig'""").fetchone()[0] == 1
+        loader = db.bulk_loader()
+        loader.add_store(po.pofile(tm_source), "en", "af")
+        assert hastrigger()
+        loader.commit()
+        assert hastrigger()
+        loader = db.bulk_loader()
+        loader.add_store(po.pofile(tm_source), "en", "af")
+        db.cursor.execute("DROP TABLE temp.staging")
+        try:
+            loader.commit()
+        except Exception:
+            pass
+        else:
+            assert False, "the import should have failed"
+        assert hastrigger()
+        other.close()
+        db.close()
+
+    def test_bulk_same_ids(self):
+        """Test that a bulk import into an empty database assigns the same
+        ids as adding the units one by one"""
+        expected = tmdb.TMDB(os.path.join(self.path, "rows.db"))
+        expected.add_store(po.pofile(tm_source), "en", "af")
+        db = tmdb.TMDB(self.dbfile)
+        loader = db.bulk_loader()
+        loader.add_store(po.pofile(tm_source), "en", "af")
+        loader.commit()
+        query = "SELECT s.sid, s.text, t.tid, t.text FROM sources s JOIN targets t ON s.sid = t.sid ORDER BY t.tid"
+        assert db.cursor.execute(query).fetchall() == expected.cursor.execute(query).fetchall()
+        db.close()
+        expected.close()
+
+    def test_multiple_languages(self):
+        """Test lookups in more than one source or target language"""
+        db = tmdb.TMDB(":memory:")
+        db.add_store(po.pofile(tm_source), "en", "af")
+        db.add_list([{"source": u"Open the file", "target": u"Ouvrir le fichier", "context": u""}], "en_GB", "fr")
+        results = db.translate_unit("Open the file", ["en", "en_GB"], ["af", "fr"])
+        assert sorted([result["target"] for result in results]) == [u"Maak die lêer oop", u"Ouvrir le fichier"]
+        results = db.translate_unit("Open the file", ["en_GB", "de"], "fr")
+        assert [result["target"] for result in results] == [u"Ouvrir le fichier"]
+        assert db.translate_unit("Open the file", ["de"], ["af", "fr"]) == []
+        db.close()
+
+    def test_best_candidates(self):
+        """Test that lookups return the best max_candidates results, best
+        first"""
+        db = tmdb.TMDB(":memory:", max_candidates=2, min_similarity=50)
+        db.add_list([{"source": source, "target": source.upper(), "context": u""}
+                     for source in (u"Open file", u"Open the file", u"Open a file",
+                                    u"Open the new file", u"Open the files")], "en", "af")
+        results = db.translate_unit("Open the file", "en", "af")
+        assert [result["source"] for result in results] == [u"Open the file", u"Open the files"]
+        assert results[0]["quality"] == 100
+        db.max_candidates = 10
+        qualities = [result["quality"] for result in db.translate_unit("Open the file", "en", "af")]
+        assert len(qualities) == 5
+        assert qualities == sorted(qualities, reverse=True)
+        db.max_candidates = 0
+        assert db.translate_unit("Open the file", "en", "af") == []
+        db.close()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from translate.storage import wordcount
+from translate.storage import po
+from translate.lang import factory
+from translate.misc.multistring import multistring
+
+class TestWordCounter:
+    def test_count(self):
+        """Test counting words with and without markup"""
+        counter = wordcount.WordCounter()
+        assert counter.count(u"Open the file") == 3
+        assert counter.count(u"_n: One file\nMany files") == 4
+        assert counter.count(u"<b>Bold</b> text<br/>here") == 3
+        assert counter.count(u"Version 1.5") == 2
+        assert counter.count(u"") == 0
+        counter = wordcount.WordCounter(markup=False)
+        assert counter.count(u"<b>Bold</b> text<br/>here") == 2
+
+    def test_countmany(self):
+        """Test that a batch counts every distinct string once"""
+        counter = wordcount.WordCounter(maxsize=10)
+        counted = []
+        count = counter._count
+        def countingcount(text):
+            counted.append(text)
+            return count(text)
+        counter._count = countingcount
+        texts = [u"Open the file", u"Close", u"Open the file", u"", u"Close"]
+        assert counter.countmany(texts) == [3, 1, 3, 0, 1]
+        assert counted == [u"Open the file", u"Close", u""]
+        assert counter.countmany([u"Close", u"Save the file"]) == [1, 3]
+        assert counted[3:] == [u"Save the file"]
+        assert counter.stats()["hits"] == 1
+
+    def test_bounded(self):
+        """Test that the cache holds at most maxsize strings"""
+        counter = wordcount.WordCounter(maxsize=2)
+        counter.countmany([u"one", u"two words", u"three more words"])
+        assert counter.stats()["size"] == 2
+        assert u"one" not in counter.cache
+
+    def test_countunits(self):
+        """Test counting the words of units with plurals"""
+        store = po.pofile('''msgid "One file"
+msgid_plural "%d files"
+msgstr[0] "Een lêer"
+msgstr[1] "%d lêers"
+
+msgid "Open the file"
+msgstr ""
+
+#, fuzzy
+msgid "Close it"
+msgstr "Maak toe"
+''')
+        counter = wordcount.WordCounter()
+        assert counter.countunits(store.units) == [(4, 4), (3, 0), (2, 0)]
+        assert counter.countunits([store.units[0]]) == [(4, 4)]
+        assert counter.countunits([]) == []
+        unit = store.units[1]
+        unit.source = multistring([u"A", u"B c"])
+        assert counter.countunits([unit]) == [(3, 0)]
+
+    def test_counter(self):
+        """Test that counters are shared per language class"""
+        assert wordcount.counter() is wordcount.counter()
+        assert wordcount.counter(factory.getlanguage("af")) is wordcount.counter(factory.getlanguage("af"))
+        assert wordcount.counter(markup=False) is not wordcount.counter()
@@ -2,6 +2,7 @@
 
 from lxml import etree
 
+from translate.misc import wStringIO
 from translate.storage import xliff, lisa
 from translate.storage import test_base
 from translate.storage.placeables import StringElem
@@ -77,6 +78,26 @@ class TestXLIFFfile(test_base.TestTranslationStore):
         assert newfile.findunit("Bla").source == "Bla"
         assert newfile.findunit("dit") is None
 
+    def test_serialize(self):
+        """Tests that serialize() also removes the empty default file"""
+        test_base.TestTranslationStore.test_serialize(self)
+        xlfsource = '''<?xml version="1.0" encoding="utf-8"?>
+<xliff version="1.1" xmlns="urn:oasis:names:tc:xliff:document:1.1">
+        <file original="NoName" source-language="en-US">
+                <body/>
+        </file>
+        <file original="doc.txt" source-language="en-US">
+                <body>
+                        <trans-unit id="1"><source>Test</source></trans-unit>
+                </body>
+        </file>
+</xliff>'''
+        xlifffile = xliff.xlifffile.parsestring(xlfsource)
+        outputfile = wStringIO.StringIO()
+        xlifffile.serialize(outputfile)
+        assert "NoName" not in outputfile.getvalue()
+        assert outputfile.getvalue() == str(xlifffile)
+
     def test_rich_source(self):
         xlifffile = xliff.xlifffile()
         xliffunit = xlifffile.addsourceunit(u'')
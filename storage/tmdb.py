@@ -20,11 +20,14 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 """Module to provide a translation memory database."""
+import heapq
 import math
 import time
 import logging
 import re
+import sys
 import threading
+import Queue
 
 try:
     from sqlite3 import dbapi2
@@ -45,9 +48,279 @@ class LanguageError(Exception):
         return str(self.value)
 
 
+# seconds to wait for a lock held by another connection before giving up
+BUSY_TIMEOUT = 30
+
+
+def connect(db_file, readonly=False):
+    """Opens a connection to db_file that can be shared between threads.
+
+    @param readonly: refuse any changes made through the connection
+    """
+    connection = dbapi2.connect(db_file, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    if readonly:
+        try:
+            connection.execute("PRAGMA query_only = 1")
+        except dbapi2.OperationalError:
+            # older versions of SQLite don't know query_only
+            pass
+    return connection
+
+
+class ConnectionPool(object):
+    """A bounded pool of read-only connections to a database file.
+
+    Connections are opened when they are first needed, and at most C{size}
+    of them are ever in use at the same time. L{acquire} blocks until a
+    connection is available."""
+
+    def __init__(self, db_file, size=5):
+        self.db_file = db_file
+        self.size = size
+        self._idle = []
+        self._connections = []
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(size)
+
+    def acquire(self):
+        """Returns a connection, which must be given back with L{release}."""
+        self._available.acquire()
+        self._lock.acquire()
+        try:
+            if self._idle:
+                return self._idle.pop()
+            try:
+                connection = connect(self.db_file, readonly=True)
+            except:
+                self._available.release()
+                raise
+            self._connections.append(connection)
+            return connection
+        finally:
+            self._lock.release()
+
+    def release(self, connection):
+        """Gives a connection returned by L{acquire} back to the pool."""
+        self._lock.acquire()
+        try:
+            self._idle.append(connection)
+        finally:
+            self._lock.release()
+        self._available.release()
+
+    def close(self):
+        """Closes all connections. Connections still in use are closed as
+        well, so this should only be called once all work is done."""
+        self._lock.acquire()
+        try:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._idle = []
+        finally:
+            self._lock.release()
+
+
+class WriteQueue(object):
+    """Serialises calls that write to a database by running them one after
+    the other in a single thread."""
+
+    def __init__(self):
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="tmdb-writer")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            function, args, kwargs, done, result = task
+            try:
+                result["value"] = function(*args, **kwargs)
+            except:
+                result["error"] = sys.exc_info()
+            done.set()
+
+    def submit(self, function, *args, **kwargs):
+        """Runs function in the writer thread, waits for it to finish and
+        returns its result. Exceptions are raised in the calling thread."""
+        done = threading.Event()
+        result = {}
+        self._queue.put((function, args, kwargs, done, result))
+        done.wait()
+        if "error" in result:
+            raise result["error"][0], result["error"][1], result["error"][2]
+        return result["value"]
+
+    def close(self):
+        """Waits for all submitted writes to finish and stops the writer
+        thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+class BulkLoader(object):
+    """Adds large numbers of units to a TMDB.
+
+    Units are collected in a temporary staging table with C{executemany}
+    and only moved into the real tables by L{commit}, with a few set based
+    C{INSERT OR IGNORE} statements instead of a handful of queries per unit.
+    The fulltext index is updated once at the end instead of by a trigger
+    for every row. The result is the same as adding the units with
+    L{TMDB.add_store} and L{TMDB.add_list}.
+
+    The loader holds the write lock of the database until L{commit} or
+    L{rollback} is called."""
+
+    def __init__(self, tmdb, batch_size=10000):
+        self.tmdb = tmdb
+        self.batch_size = batch_size
+        self.batch = []
+        self.time = int(time.time())
+        self.lock = tmdb._tm_db["lock"]
+        self.lock.acquire()
+        try:
+            cursor = tmdb.cursor
+            cursor.execute("PRAGMA synchronous")
+            (self.synchronous,) = cursor.fetchone()
+            script = """
+PRAGMA synchronous = OFF;
+PRAGMA cache_size = 100000;
+DROP TABLE IF EXISTS temp.staging;
+CREATE TEMP TABLE staging (
+       source VARCHAR NOT NULL,
+       context VARCHAR,
+       source_lang VARCHAR NOT NULL,
+       length INTEGER NOT NULL,
+       target VARCHAR NOT NULL,
+       target_lang VARCHAR NOT NULL
+);
+"""
+            cursor.executescript(script)
+        except:
+            self.lock.release()
+            raise
+
+    def _flush(self):
+        if self.batch:
+            self.tmdb.cursor.executemany("INSERT INTO temp.staging VALUES (?, ?, ?, ?, ?, ?)", self.batch)
+            self.batch = []
+
+    def add_dict(self, unit, source_lang, target_lang):
+        """stages a unit represented as a dictionary"""
+        self.batch.append((unit["source"], unit["context"],
+                           data.normalize_code(source_lang), len(unit["source"]),
+                           unit["target"], data.normalize_code(target_lang)))
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def add_unit(self, unit, source_lang=None, target_lang=None):
+        """stages a unit, see L{TMDB.add_unit}"""
+        if unit.getsourcelanguage():
+            source_lang = unit.getsourcelanguage()
+        if unit.gettargetlanguage():
+            target_lang = unit.gettargetlanguage()
+
+        if not source_lang:
+            raise LanguageError("undefined source language")
+        if not target_lang:
+            raise LanguageError("undefined target language")
+
+        self.add_dict({"source": unit.source,
+                       "target": unit.target,
+                       "context": unit.getcontext()},
+                      source_lang, target_lang)
+
+    def add_store(self, store, source_lang, target_lang):
+        """stages all translated units in store, see L{TMDB.add_store}"""
+        count = 0
+        for unit in store.units:
+            if unit.istranslatable() and unit.istranslated():
+                self.add_unit(unit, source_lang, target_lang)
+                count += 1
+        return count
+
+    def add_list(self, units, source_lang, target_lang):
+        """stages all units in a list of dictionaries, see
+        L{TMDB.add_list}"""
+        count = 0
+        for unit in units:
+            self.add_dict(unit, source_lang, target_lang)
+            count += 1
+        return count
+
+    def commit(self):
+        """moves all staged units into the database and releases the write
+        lock"""
+        connection = self.tmdb.connection
+        cursor = self.tmdb.cursor
+        try:
+            self._flush()
+            # The fulltext trigger is dropped and created again in the same
+            # transaction as the inserts, so that other connections never see
+            # the database without it. The sqlite3 module commits before any
+            # DDL statement, so we manage this transaction ourselves.
+            isolation_level = connection.isolation_level
+            connection.isolation_level = None
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    self._move()
+                    cursor.execute("COMMIT")
+                except:
+                    cursor.execute("ROLLBACK")
+                    raise
+            finally:
+                connection.isolation_level = isolation_level
+        except:
+            self._finish()
+            raise
+        self._finish()
+
+    def _move(self):
+        cursor = self.tmdb.cursor
+        if self.tmdb.fulltext:
+            cursor.execute("DROP TRIGGER IF EXISTS sources_insert_trig")
+        cursor.execute("SELECT IFNULL(MAX(sid), 0) FROM sources")
+        (last_sid,) = cursor.fetchone()
+        # sources get their ids in the order they were first added
+        cursor.execute("""INSERT OR IGNORE INTO sources (text, context, lang, length)
+                          SELECT source, context, source_lang, length FROM temp.staging
+                          GROUP BY source, context, source_lang ORDER BY MIN(rowid)""")
+        cursor.execute("""INSERT OR IGNORE INTO targets (sid, text, lang, time)
+                          SELECT s.sid, st.target, st.target_lang, ? FROM temp.staging st
+                          JOIN sources s ON s.text = st.source AND s.context IS st.context
+                          AND s.lang = st.source_lang ORDER BY st.rowid""", (self.time,))
+        if self.tmdb.fulltext:
+            cursor.execute("INSERT INTO fulltext (docid, text) SELECT sid, text FROM sources WHERE sid > ?",
+                           (last_sid,))
+            cursor.execute("""CREATE TRIGGER sources_insert_trig AFTER INSERT ON sources FOR EACH ROW
+                              BEGIN
+                                  INSERT INTO fulltext (docid, text) VALUES (NEW.sid, NEW.text);
+                              END""")
+
+    def rollback(self):
+        """discards all staged units and releases the write lock"""
+        self.batch = []
+        self.tmdb.connection.rollback()
+        self._finish()
+
+    def _finish(self):
+        try:
+            script = """
+DROP TABLE IF EXISTS temp.staging;
+PRAGMA synchronous = %d;
+""" % self.synchronous
+            self.tmdb.cursor.executescript(script)
+        finally:
+            self.lock.release()
+
+
 class TMDB(object):
     _tm_dbs = {}
-    def __init__(self, db_file, max_candidates=3, min_similarity=75, max_length=1000):
+    def __init__(self, db_file, max_candidates=3, min_similarity=75, max_length=1000, pool_size=5):
 
         self.max_candidates = max_candidates
         self.min_similarity = min_similarity
@@ -56,28 +329,70 @@ class TMDB(object):
         self.db_file = db_file
         # share connections to same database file between different instances
         if db_file not in self._tm_dbs:
-            self._tm_dbs[db_file] = {}
+            self._tm_dbs[db_file] = self._open_database(pool_size)
         self._tm_db = self._tm_dbs[db_file]
 
         #FIXME: do we want to do any checks before we initialize the DB?
-        self.init_database()
-        self.fulltext = False
-        self.init_fulltext()
+        self._tm_db["lock"].acquire()
+        try:
+            self.init_database()
+            self.fulltext = False
+            self.init_fulltext()
+            self.preload_db()
+        finally:
+            self._tm_db["lock"].release()
 
         self.comparer = LevenshteinComparer(self.max_length)
 
-        self.preload_db()
-
-    def _get_connection(self, index):
-        current_thread = threading.currentThread()
-        if current_thread not in self._tm_db:
-            connection = dbapi2.connect(self.db_file)
-            cursor = connection.cursor()
-            self._tm_db[current_thread] = (connection, cursor)
-        return self._tm_db[current_thread][index]
-    
-    connection = property(lambda self: self._get_connection(0))
-    cursor = property(lambda self: self._get_connection(1))
+    def _open_database(self, pool_size):
+        """Opens the single connection used for writing and the pool of
+        connections used for lookups."""
+        connection = connect(self.db_file)
+        readers = None
+        # every connection to :memory: is a different database, so lookups
+        # have to share the connection used for writing
+        if self.db_file != ":memory:":
+            try:
+                # in WAL mode readers don't block the writer, nor the other
+                # way round
+                connection.execute("PRAGMA journal_mode = WAL")
+            except dbapi2.OperationalError, e:
+                logging.debug("failed to enable WAL journal: " + str(e))
+            readers = ConnectionPool(self.db_file, pool_size)
+        return {"connection": connection,
+                "cursor": connection.cursor(),
+                "lock": threading.RLock(),
+                "readers": readers,
+               }
+
+    connection = property(lambda self: self._tm_db["connection"],
+                          doc="The connection used for writing")
+    cursor = property(lambda self: self._tm_db["cursor"])
+
+    def _acquire_reader(self):
+        if self._tm_db["readers"] is None:
+            self._tm_db["lock"].acquire()
+            return self.connection
+        return self._tm_db["readers"].acquire()
+
+    def _release_reader(self, connection):
+        if self._tm_db["readers"] is None:
+            self._tm_db["lock"].release()
+        else:
+            self._tm_db["readers"].release(connection)
+
+    def close(self):
+        """Closes all connections to the database. They are shared by all
+        TMDB instances using the same database file."""
+        if self._tm_dbs.get(self.db_file) is self._tm_db:
+            del self._tm_dbs[self.db_file]
+        self._tm_db["lock"].acquire()
+        try:
+            if self._tm_db["readers"] is not None:
+                self._tm_db["readers"].close()
+            self._tm_db["connection"].close()
+        finally:
+            self._tm_db["lock"].release()
 
     
     def init_database(self):
@@ -92,7 +407,8 @@ CREATE TABLE IF NOT EXISTS sources (
        length INTEGER NOT NULL
 );
 CREATE INDEX IF NOT EXISTS sources_context_idx ON sources (context);
-CREATE INDEX IF NOT EXISTS sources_lang_idx ON sources (lang);
+DROP INDEX IF EXISTS sources_lang_idx;
+CREATE INDEX IF NOT EXISTS sources_lang_length_idx ON sources (lang, length);
 CREATE INDEX IF NOT EXISTS sources_length_idx ON sources (length);
 CREATE UNIQUE INDEX IF NOT EXISTS sources_uniq_idx ON sources (text, context, lang);
 
@@ -211,6 +527,13 @@ DROP TRIGGER IF EXISTS sources_delete_trig;
         """inserts units represented as dictionaries in database"""
         source_lang = data.normalize_code(source_lang)
         target_lang = data.normalize_code(target_lang)
+        self._tm_db["lock"].acquire()
+        try:
+            self._add_dict(unit, source_lang, target_lang, commit)
+        finally:
+            self._tm_db["lock"].release()
+
+    def _add_dict(self, unit, source_lang, target_lang, commit):
         try:
             try:
                 self.cursor.execute("INSERT INTO sources (text, context, lang, length) VALUES(?, ?, ?, ?)",
@@ -249,40 +572,48 @@ DROP TRIGGER IF EXISTS sources_delete_trig;
     def add_store(self, store, source_lang, target_lang, commit=True):
         """insert all units in store in database"""
         count = 0
-        for unit in store.units:
-            if unit.istranslatable() and unit.istranslated():
-                self.add_unit(unit, source_lang, target_lang, commit=False)
-                count += 1
-        if commit:
-            self.connection.commit()
+        self._tm_db["lock"].acquire()
+        try:
+            for unit in store.units:
+                if unit.istranslatable() and unit.istranslated():
+                    self.add_unit(unit, source_lang, target_lang, commit=False)
+                    count += 1
+            if commit:
+                self.connection.commit()
+        finally:
+            self._tm_db["lock"].release()
         return count
 
     def add_list(self, units, source_lang, target_lang, commit=True):
         """insert all units in list into the database, units are
         represented as dictionaries"""
         count = 0
-        for unit in units:
-            self.add_dict(unit, source_lang, target_lang, commit=False)
-            count += 1
-        if commit:
-            self.connection.commit()
+        self._tm_db["lock"].acquire()
+        try:
+            for unit in units:
+                self.add_dict(unit, source_lang, target_lang, commit=False)
+                count += 1
+            if commit:
+                self.connection.commit()
+        finally:
+            self._tm_db["lock"].release()
         return count
     
+    def bulk_loader(self, batch_size=10000):
+        """returns a L{BulkLoader} to add many units at once"""
+        return BulkLoader(self, batch_size)
+
     def translate_unit(self, unit_source, source_langs, target_langs):
         """return TM suggestions for unit_source"""
         if isinstance(unit_source, str):
             unit_source = unicode(unit_source, "utf-8")
-        if isinstance(source_langs, list):
-            source_langs = [data.normalize_code(lang) for lang in source_langs]
-            source_langs = ','.join(source_langs)
-        else:
-            source_langs = data.normalize_code(source_langs)
-        if isinstance(target_langs, list):
-            target_langs = [data.normalize_code(lang) for lang in target_langs]
-            target_langs = ','.join(target_langs)
-        else:
-            target_langs = data.normalize_code(target_langs)
-        
+        if not isinstance(source_langs, list):
+            source_langs = [source_langs]
+        source_langs = [data.normalize_code(lang) for lang in source_langs]
+        if not isinstance(target_langs, list):
+            target_langs = [target_langs]
+        target_langs = [data.normalize_code(lang) for lang in target_langs]
+
         minlen = min_levenshtein_length(len(unit_source), self.min_similarity)
         maxlen = max_levenshtein_length(len(unit_source), self.min_similarity, self.max_length)
 
@@ -291,35 +622,77 @@ DROP TRIGGER IF EXISTS sources_delete_trig;
         unit_words = STRIP_REGEXP.sub(' ', unit_source).split()
         unit_words = filter(lambda word: len(word) > 2, unit_words)
 
+        connection = self._acquire_reader()
+        try:
+            cursor = connection.cursor()
+            results = self._translate_unit(cursor, unit_source, source_langs, target_langs,
+                                           minlen, maxlen, unit_words)
+        finally:
+            self._release_reader(connection)
+        logging.debug("results: %s", unicode(results))
+        return results
+
+    def _translate_unit(self, cursor, unit_source, source_langs, target_langs, minlen, maxlen, unit_words):
+        if self.max_candidates < 1:
+            return []
+        params = source_langs + target_langs + [minlen, maxlen]
         if self.fulltext and len(unit_words) > 3:
             logging.debug("fulltext matching")
             query = """SELECT s.text, t.text, s.context, s.lang, t.lang FROM sources s JOIN targets t ON s.sid = t.sid JOIN fulltext f ON s.sid = f.docid
-                       WHERE s.lang IN (?) AND t.lang IN (?) AND s.length BETWEEN ? AND ?
-                       AND fulltext MATCH ?"""
-            search_str = " OR ".join(unit_words)
-            self.cursor.execute(query, (source_langs, target_langs, minlen, maxlen, search_str))
+                       WHERE s.lang IN (%s) AND t.lang IN (%s) AND s.length BETWEEN ? AND ?
+                       AND fulltext MATCH ?
+                       ORDER BY ABS(s.length - ?)"""
+            params.append(" OR ".join(unit_words))
         else:
             logging.debug("nonfulltext matching")
             query = """SELECT s.text, t.text, s.context, s.lang, t.lang FROM sources s JOIN targets t ON s.sid = t.sid
-            WHERE s.lang IN (?) AND t.lang IN (?) 
-            AND s.length >= ? AND s.length <= ?"""
-            self.cursor.execute(query, (source_langs, target_langs, minlen, maxlen))
+            WHERE s.lang IN (%s) AND t.lang IN (%s)
+            AND s.length >= ? AND s.length <= ?
+            ORDER BY ABS(s.length - ?)"""
+        query = query % (placeholders(source_langs), placeholders(target_langs))
+        length = len(unit_source)
+        params.append(length)
+        cursor.execute(query, params)
+
+        # Rows come closest length first, since the difference in length
+        # limits the similarity. The best max_candidates results are kept in
+        # a heap with the worst one on top, earlier rows win ties.
+        heap = []
+        threshold = self.min_similarity
+        for rownum, row in enumerate(cursor):
+            if len(heap) == self.max_candidates and \
+                    100.0 * length / (length + abs(len(row[0]) - length)) < threshold:
+                # neither this row nor any of the following can do better
+                # than the worst result we have
+                break
+            quality = self.comparer.similarity(unit_source, row[0], threshold)
+            if quality < threshold:
+                continue
+            entry = (quality, -rownum, row)
+            if len(heap) < self.max_candidates:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            if len(heap) == self.max_candidates:
+                # anything worse than the worst result we keep can be
+                # abandoned early by the comparer
+                threshold = heap[0][0]
 
         results = []
-        for row in self.cursor:
-            result = {}
-            result['source'] = row[0]
-            result['target'] = row[1]
-            result['context'] = row[2]
-            result['quality'] = self.comparer.similarity(unit_source, result['source'], self.min_similarity)
-            if result['quality'] >= self.min_similarity:
-                results.append(result)
-        results.sort(key=lambda match: match['quality'], reverse=True)
-        results = results[:self.max_candidates]
-        logging.debug("results: %s", unicode(results))
+        for quality, rownum, row in sorted(heap, reverse=True):
+            results.append({'source': row[0],
+                            'target': row[1],
+                            'context': row[2],
+                            'quality': quality,
+                           })
         return results
 
 
+def placeholders(values):
+    """returns the SQL parameter placeholders for a list of values, for use
+    in an C{IN (...)} clause"""
+    return ", ".join(["?"] * len(values))
+
 def min_levenshtein_length(length, min_similarity):
     return math.ceil(max(length * (min_similarity/100.0), 2))
 
@@ -432,3 +432,11 @@ class tsfile(lisa.LISAfile):
         if not "<!DOCTYPE TS>" in output[:30]:
             output = "<!DOCTYPE TS>" + output
         return output
+
+    def serialize(self, fileobj):
+        """Writes the file's XML to fileobj like L{__str__}, without building
+        one big string."""
+        if not "<!DOCTYPE TS>" in (self.document.docinfo.doctype or "")[:30]:
+            fileobj.write("<!DOCTYPE TS>")
+        self.document.write(fileobj, pretty_print=True,
+                            xml_declaration=False, encoding='utf-8')
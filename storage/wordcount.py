@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009 Zuza Software Foundation
+#
+# This file is part of the Translate Toolkit.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""Counts the words in translatable strings.
+
+The same source strings occur over and over again in the files of a project
+(once for every language), so the counts are kept in a bounded cache keyed by
+the text. Use L{counter} to get the shared counter for a language.
+"""
+
+import re
+import threading
+
+from translate.lang.common import Common
+from translate.misc.lru import LRUCache
+from translate.misc.multistring import multistring
+
+kdepluralre = re.compile("^_n: ")
+brtagre = re.compile("<br\s*?/?>")
+xmltagre = re.compile("<[^>]+>")
+numberre = re.compile("\\D\\.\\D")
+
+# the number of distinct strings each counter remembers
+CACHE_SIZE = 100000
+
+
+def _plain(text):
+    # Plain unicode strings are much faster as dictionary keys than
+    # multistrings, which compare their plurals as well.
+    if isinstance(text, unicode) and type(text) is not unicode:
+        return unicode(text)
+    return text
+
+def _strings(text):
+    if isinstance(text, multistring):
+        return [_plain(string) for string in text.strings]
+    return [_plain(text) or u""]
+
+
+class WordCounter(object):
+    """Counts words with the rules of a language, remembering the counts of
+    the last L{CACHE_SIZE} distinct strings."""
+
+    def __init__(self, language=Common, markup=True, maxsize=CACHE_SIZE):
+        """
+        @param language: the language (class) whose words() is used
+        @param markup: ignore KDE plural prefixes and XML tags, and count
+        numbers like 1.5 as one word
+        """
+        self.language = language
+        self.markup = markup
+        self.cache = LRUCache(maxsize)
+
+    def _count(self, text):
+        if self.markup:
+            # TODO: po class should understand KDE style plurals
+            text = kdepluralre.sub("", text)
+            text = brtagre.sub("\n", text)
+            text = xmltagre.sub("", text)
+            text = numberre.sub(" ", text)
+        return len(self.language.words(text))
+
+    def count(self, text):
+        """Returns the number of words in text."""
+        text = _plain(text)
+        count = self.cache.get(text)
+        if count is None:
+            count = self.cache[text] = self._count(text)
+        return count
+
+    def countmany(self, texts):
+        """Returns a list with the number of words in each of texts. Every
+        distinct text is looked up in the cache once, and only the ones that
+        aren't there are counted."""
+        return self._countmany([_plain(text) for text in texts])
+
+    def _countmany(self, texts):
+        counts = {}
+        missing = []
+        for text in texts:
+            if text not in counts:
+                count = counts[text] = self.cache.get(text)
+                if count is None:
+                    missing.append(text)
+        for text in missing:
+            counts[text] = self.cache[text] = self._count(text)
+        return [counts[text] for text in texts]
+
+    def countunits(self, units):
+        """Returns a list with the (sourcewords, targetwords) of each unit,
+        taking plurals into account. The target words are only counted if
+        the unit is translated."""
+        texts = []
+        lengths = []
+        for unit in units:
+            sources = _strings(unit.source)
+            if unit.istranslated():
+                targets = _strings(unit.target)
+            else:
+                targets = []
+            texts.extend(sources)
+            texts.extend(targets)
+            lengths.append((len(sources), len(targets)))
+        counts = self._countmany(texts)
+        result = []
+        position = 0
+        for sourcecount, targetcount in lengths:
+            middle = position + sourcecount
+            end = middle + targetcount
+            result.append((sum(counts[position:middle]), sum(counts[middle:end])))
+            position = end
+        return result
+
+    def stats(self):
+        """Returns the statistics of the cache, see L{LRUCache.stats}."""
+        return self.cache.stats()
+
+
+_counters = {}
+_counterslock = threading.Lock()
+
+def counter(language=Common, markup=True):
+    """Returns the counter shared by everybody counting words with the rules
+    of the given language (class or instance)."""
+    if not isinstance(language, type):
+        language = language.__class__
+    key = (language, markup)
+    _counterslock.acquire()
+    try:
+        if key not in _counters:
+            _counters[key] = WordCounter(language, markup)
+        return _counters[key]
+    finally:
+        _counterslock.release()
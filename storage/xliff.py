@@ -666,6 +666,10 @@ class xlifffile(lisa.LISAfile):
         self.removedefaultfile()
         return super(xlifffile, self).__str__()
 
+    def serialize(self, fileobj):
+        self.removedefaultfile()
+        super(xlifffile, self).serialize(fileobj)
+
     def parsestring(cls, storestring):
         """Parses the string to return the correct file object"""
         xliff = super(xlifffile, cls).parsestring(storestring)
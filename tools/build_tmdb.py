@@ -28,10 +28,14 @@ from translate.storage import tmdb
 
 
 class Builder:
-    def __init__(self, tmdbfile, source_lang, target_lang, filenames):
+    def __init__(self, tmdbfile, source_lang, target_lang, filenames, bulk=False):
         self.tmdb = tmdb.TMDB(tmdbfile)
         self.source_lang = source_lang
         self.target_lang = target_lang
+        if bulk:
+            self.importer = self.tmdb.bulk_loader()
+        else:
+            self.importer = None
 
         for filename in filenames:
             if not os.path.exists(filename):
@@ -41,7 +45,10 @@ class Builder:
                 self.handledir(filename)
             else:
                 self.handlefile(filename)
-        self.tmdb.connection.commit()
+        if self.importer:
+            self.importer.commit()
+        else:
+            self.tmdb.connection.commit()
 
     def handlefile(self, filename):
         try:
@@ -51,7 +58,10 @@ class Builder:
             return
         # do something useful with the store and db
         try:
-            self.tmdb.add_store(store, self.source_lang, self.target_lang, commit=False)
+            if self.importer:
+                self.importer.add_store(store, self.source_lang, self.target_lang)
+            else:
+                self.tmdb.add_store(store, self.source_lang, self.target_lang, commit=False)
         except Exception, e:
             print e
         print "File added:", filename
@@ -91,6 +101,10 @@ def main():
         "-t", "--import-target-lang", dest="target_lang",
         help="target language of translation files"
     )
+    parser.add_option(
+        "--bulk", dest="bulk", action="store_true", default=False,
+        help="import all units at once at the end, much faster for large imports"
+    )
     (options, args) = parser.parse_args()
 
     if not options.target_lang:
@@ -99,7 +113,7 @@ def main():
     if len(args) < 1:
         parser.error('No input file(s) specified.')
 
-    Builder(options.tmdb_file, options.source_lang, options.target_lang, args)
+    Builder(options.tmdb_file, options.source_lang, options.target_lang, args, options.bulk)
 
 if __name__ == '__main__':
     main()
@@ -76,7 +76,7 @@ def convertphp2py(inputfile, outputfile, template=None):
     outputstore = convertor.convertstore(inputstore)
     if outputstore.isempty():
         return False
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return True
 
 def main(argv=None):
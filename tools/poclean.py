@@ -59,7 +59,7 @@ def runclean(inputfile, outputfile, templatefile):
     cleanfile(fromfile)
 #    if fromfile.isempty():
 #        return False
-    outputfile.write(str(fromfile))
+    fromfile.serialize(outputfile)
     return True
 
 def main():
@@ -52,7 +52,7 @@ def calcstats_old(filename):
     fuzzy = fuzzymessages(units)
     review = filter(lambda unit: unit.isreview(), units)
     untranslated = untranslatedmessages(units)
-    wordcounts = dict(map(lambda unit: (unit, statsdb.wordsinunit(unit)), units))
+    wordcounts = dict(zip(units, statsdb.wordsinunits(units)))
     sourcewords = lambda elementlist: sum(map(lambda unit: wordcounts[unit][0], elementlist))
     targetwords = lambda elementlist: sum(map(lambda unit: wordcounts[unit][1], elementlist))
     stats = {}
@@ -79,6 +79,32 @@ def calcstats(filename):
     statscache = statsdb.StatsCache()
     return statscache.filetotals(filename)
 
+def calcstats_stream(filename, batchsize=1000):
+    """Counts the file one unit at a time without using the statistics cache,
+    so that huge files (like compendia) don't have to be held in memory."""
+    def addbatch(totals, units):
+        for unit, (sourcewords, targetwords) in zip(units, statsdb.wordsinunits(units)):
+            totals = totals + statsdb.FileTotals.new_record(statsdb.statefordb(unit), sourcewords, targetwords)
+        return totals
+
+    totals = statsdb.FileTotals.new_record()
+    units = []
+    for unit in factory.iterunits(filename):
+        if unit.istranslatable():
+            units.append(unit)
+            if len(units) >= batchsize:
+                totals = addbatch(totals, units)
+                units = []
+    return addbatch(totals, units)
+
+def _filerows(filename):
+    """Worker process function for summarizer.precache()"""
+    try:
+        return statsdb.filerows(filename)
+    except Exception:
+        # broken files are reported when they are summarized
+        return None
+
 def summarize(title, stats, style=style_full, indent=8, incomplete_only=False):
     """
     Print summary for a .po file in specified format.
@@ -163,13 +189,14 @@ def untranslatedmessages(units):
     return filter(lambda unit: not (unit.istranslated() or unit.isfuzzy()) and unit.source, units)
 
 class summarizer:
-    def __init__(self, filenames, style=default_style, incomplete_only=False):
+    def __init__(self, filenames, style=default_style, incomplete_only=False, jobs=1, stream=False):
         self.totals = {}
         self.filecount = 0
         self.longestfilename = 0
         self.style = style
         self.incomplete_only = incomplete_only
         self.complete_count = 0
+        self.stream = stream
 
         if (self.style == style_csv):
             print "Filename, Translated Messages, Translated Source Words, Translated \
@@ -180,6 +207,8 @@ Review Messages, Review Source Words"
             for filename in filenames:  # find longest filename
                 if (len(filename) > self.longestfilename):
                     self.longestfilename = len(filename)
+        if jobs > 1 and not stream:
+            self.precache(filenames, jobs)
         for filename in filenames:
             if not os.path.exists(filename):
                 print >> sys.stderr, "cannot process %s: does not exist" % filename
@@ -197,6 +226,44 @@ Review Messages, Review Source Words"
             print "File count:   %5d" % (self.filecount)
             print
 
+    def precache(self, filenames, jobs):
+        """Parses and counts the files that are not in the statistics cache
+        yet in jobs worker processes. Only this process writes to the
+        cache."""
+        statscache = statsdb.StatsCache()
+        missing = []
+        for filename in self.listfiles(filenames):
+            try:
+                if statscache.needsupdate(filename):
+                    missing.append(filename)
+            except Exception:
+                pass
+        if not missing:
+            return
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for result in pool.imap_unordered(_filerows, missing):
+                if result is not None:
+                    statscache.cachefilerows(*result)
+        finally:
+            pool.close()
+            pool.join()
+
+    def listfiles(self, filenames):
+        """Returns the files that will be counted, like handledir() finds
+        them."""
+        files = []
+        for filename in filenames:
+            if os.path.isdir(filename):
+                path, name = os.path.split(filename)
+                if name in ["CVS", ".svn", "_darcs", ".git", ".hg", ".bzr"]:
+                    continue
+                files.extend(self.listfiles([os.path.join(filename, entry) for entry in os.listdir(filename)]))
+            elif os.path.exists(filename):
+                files.append(filename)
+        return files
+
     def updatetotals(self, stats):
         """Update self.totals with the statistics in stats."""
         for key in stats.keys():
@@ -206,7 +273,10 @@ Review Messages, Review Source Words"
 
     def handlefile(self, filename):
         try:
-            stats = calcstats(filename)
+            if self.stream:
+                stats = calcstats_stream(filename)
+            else:
+                stats = calcstats(filename)
             self.updatetotals(stats)
             self.complete_count += summarize(filename, stats, self.style, self.longestfilename, self.incomplete_only)
             self.filecount += 1
@@ -243,6 +313,12 @@ def main():
                       help="statistics of strings in short format - one line per file")
     parser.add_option("--short-words", action="store_const", const = style_csv, dest = "style_short_words",
                       help="statistics of words in short format - one line per file")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+                      help="the number of processes to use for counting files that are not cached yet")
+    parser.add_option("--stream", action="store_true", dest="stream", default=False,
+                      help="count one unit at a time without using the statistics cache (for huge files)")
+    parser.add_option("--storecache", action="store_true", dest="storecache", default=False,
+                      help="keep the parsed files in memory for reuse while they don't change")
 
     (options, args) = parser.parse_args()
 
@@ -274,7 +350,10 @@ def main():
     except Exception:
         pass
 
-    summarizer(args, style, options.incomplete_only)
+    if options.storecache:
+        factory.usecache()
+
+    summarizer(args, style, options.incomplete_only, options.jobs, options.stream)
 
 if __name__ == '__main__':
     main()
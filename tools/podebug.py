@@ -301,7 +301,7 @@ def convertpo(inputfile, outputfile, templatefile, format=None, rewritestyle=Non
         return 0
     convertor = podebug(format=format, rewritestyle=rewritestyle, ignoreoption=ignoreoption)
     outputstore = convertor.convertstore(inputstore)
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main():
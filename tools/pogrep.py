@@ -29,6 +29,7 @@ usage instructions
 """
 
 from translate.storage import factory
+from translate.storage import pypo
 from translate.storage.poheader import poheader
 from translate.misc import optrecurse
 from translate.misc.multistring import multistring
@@ -306,13 +307,40 @@ class GrepOptionParser(optrecurse.RecursiveOptionParser):
         self.usepsyco(options)
         self.recursiveprocess(options)
 
-def rungrep(inputfile, outputfile, templatefile, checkfilter):
+def rungrepstream(inputfile, outputfile, checkfilter):
+    """reads a PO file one unit at a time, writing the units that pass
+    checkfilter to outputfile as soon as they are found. The header is
+    built from the original one like L{GrepFilter.filterfile} does."""
+    storeclass = factory.getclass(inputfile)
+    header = None
+    found = False
+    for unit in factory.iterunits(inputfile):
+        if unit.isheader():
+            header = unit
+        elif checkfilter.filterunit(unit):
+            if found:
+                outputfile.write("\n")
+            else:
+                # a new store has a default header, but we want the same
+                # store that parsing the file would give
+                headerstore = storeclass()
+                headerstore.units = []
+                if header is not None:
+                    headerstore.addunit(header)
+                outputfile.write(str(checkfilter.filterfile(headerstore).header()) + "\n")
+            outputfile.write(str(unit))
+            found = True
+    return found
+
+def rungrep(inputfile, outputfile, templatefile, checkfilter, stream=False):
     """reads in inputfile, filters using checkfilter, writes to outputfile"""
+    if stream and issubclass(factory.getclass(inputfile), pypo.pofile):
+        return rungrepstream(inputfile, outputfile, checkfilter)
     fromfile = factory.getobject(inputfile)
     tofile = checkfilter.filterfile(fromfile)
     if tofile.isempty():
         return False
-    outputfile.write(str(tofile))
+    tofile.serialize(outputfile)
     return True
 
 def cmdlineparser():
@@ -334,8 +362,11 @@ def cmdlineparser():
     parser.add_option("", "--accelerator", dest="accelchar",
         action="store", type="choice", choices=["&", "_", "~"],
         metavar="ACCELERATOR", help="ignores the given accelerator when matching")
+    parser.add_option("", "--stream", dest="stream",
+        action="store_true", default=False, help="read and write PO files one unit at a time (for huge files)")
     parser.set_usage()
     parser.passthrough.append('checkfilter')
+    parser.passthrough.append('stream')
     parser.description = __doc__
     return parser
 
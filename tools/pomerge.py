@@ -113,7 +113,7 @@ def mergestore(inputfile, outputfile, templatefile, mergeblanks="no", mergecomme
     outputstore = mergestores(templatestore, inputstore, mergeblanks, mergecomments)
     if outputstore.isempty():
         return 0
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main():
@@ -73,7 +73,7 @@ def segmentfile(inputfile, outputfile, templatefile, sourcelanguage="en", target
     targetlang = lang_factory.getlanguage(targetlanguage)
     convertor = segment(sourcelang, targetlang, stripspaces=stripspaces)
     outputstore = convertor.convertstore(inputstore)
-    outputfile.write(str(outputstore))
+    outputstore.serialize(outputfile)
     return 1
 
 def main():
@@ -25,32 +25,54 @@ translation memory and existing translations.
 from translate.storage import factory
 from translate.storage import xliff
 from translate.search import match
+from translate.search import snapshot
 
 # We don't want to reinitialise the TM each time, so let's store it here.
 tmmatcher = None
 
-def memory(tmfiles, max_candidates=1, min_similarity=75, max_length=1000):
-    """Returns the TM store to use. Only initialises on first call."""
+def memory(tmfiles, max_candidates=1, min_similarity=75, max_length=1000, tmsnapshot=None, useindex=False):
+    """Returns the TM store to use. Only initialises on first call.
+
+    @param tmsnapshot: Optional file name of a snapshot of the TM (see
+    L{translate.search.snapshot}). It is used if it is up to date with
+    tmfiles, otherwise it is (re)built.
+    @param useindex: Use a q-gram index to skip TM candidates that can't
+    reach min_similarity (see L{match.matcher}).
+    """
     global tmmatcher
     # Only initialise first time
     if tmmatcher is None:
-        if isinstance(tmfiles, list):
-            tmstore = [factory.getobject(tmfile) for tmfile in tmfiles]
+        if not isinstance(tmfiles, list):
+            tmfiles = [tmfiles]
+        if [tmfile for tmfile in tmfiles if not isinstance(tmfile, basestring)]:
+            # we can only check if a snapshot is up to date for named files
+            tmsnapshot = None
+        tmmatcher = match.matcher([], max_candidates=max_candidates, min_similarity=min_similarity, max_length=max_length, useindex=useindex)
+        if tmsnapshot and not snapshot.CandidateList(tmsnapshot).isstale(tmfiles, tmmatcher.usefuzzy):
+            tmmatcher.loadsnapshot(tmsnapshot)
         else:
-            tmstore = factory.getobject(tmfiles)
-        tmmatcher = match.matcher(tmstore, max_candidates=max_candidates, min_similarity=min_similarity, max_length=max_length)
+            tmstore = [factory.getobject(tmfile, readonly=True) for tmfile in tmfiles]
+            tmmatcher.inittm(tmstore)
+            if tmsnapshot:
+                tmmatcher.savesnapshot(tmsnapshot, tmfiles)
     return tmmatcher
 
 
-def pretranslate_file(input_file, output_file, template_file, tm=None, min_similarity=75, fuzzymatching=True):
+def usecache_option(option, opt_str, value, parser):
+    """Turns on the store cache (see L{factory.usecache}), so that the
+    translation memory is only parsed again when its files change."""
+    factory.usecache()
+
+
+def pretranslate_file(input_file, output_file, template_file, tm=None, min_similarity=75, fuzzymatching=True, jobs=1, tmsnapshot=None, useindex=False):
     """Pretranslate any factory supported file with old translations and translation memory."""
     input_store = factory.getobject(input_file)
     template_store = None
     if template_file is not None:
         template_store = factory.getobject(template_file)
 
-    output = pretranslate_store(input_store, template_store, tm, min_similarity, fuzzymatching)
-    output_file.write(str(output))
+    output = pretranslate_store(input_store, template_store, tm, min_similarity, fuzzymatching, jobs, tmsnapshot, useindex)
+    output.serialize(output_file)
     return 1
 
 
@@ -76,15 +98,53 @@ def match_template_id(input_unit, template_store):
                 return matching_unit
 
 
-def match_fuzzy(input_unit, matchers):
-    """Return a fuzzy match from a queue of matchers."""
+def match_fuzzy(input_unit, matchers, fuzzymatches=None):
+    """Return a fuzzy match from a queue of matchers.
+
+    @param fuzzymatches: Optional dictionary of matches prepared by
+    match_fuzzy_batch()
+    """
+    if fuzzymatches is not None and input_unit.source in fuzzymatches:
+        return fuzzymatches[input_unit.source]
     for matcher in matchers:
         fuzzycandidates = matcher.matches(input_unit.source)
         if fuzzycandidates:
             return fuzzycandidates[0]
 
 
-def pretranslate_unit(input_unit, template_store, matchers=None, mark_reused=False) :
+def match_fuzzy_batch(input_units, template_store, matchers, jobs=1):
+    """Return a dictionary with the fuzzy match (or None) for the source text
+    of every unit in input_units that won't be translated from the template.
+
+    All texts are given to each matcher in one batch, so that the matching
+    can be done by jobs processes."""
+    texts = []
+    seen = set()
+    for input_unit in input_units:
+        if not input_unit.istranslatable() or input_unit.source in seen:
+            continue
+        if template_store:
+            matching_unit = match_template_id(input_unit, template_store)
+            if matching_unit and matching_unit.gettargetlen() > 0:
+                continue
+        seen.add(input_unit.source)
+        texts.append(input_unit.source)
+
+    fuzzymatches = {}
+    for matcher in matchers:
+        remaining = []
+        for text, fuzzycandidates in zip(texts, matcher.matches_batch(texts, workers=jobs)):
+            if fuzzycandidates:
+                fuzzymatches[text] = fuzzycandidates[0]
+            else:
+                remaining.append(text)
+        texts = remaining
+    for text in texts:
+        fuzzymatches[text] = None
+    return fuzzymatches
+
+
+def pretranslate_unit(input_unit, template_store, matchers=None, mark_reused=False, fuzzymatches=None) :
     """Pretranslate a unit or return unchanged if no translation was found."""
 
     matching_unit = None
@@ -96,7 +156,7 @@ def pretranslate_unit(input_unit, template_store, matchers=None, mark_reused=Fal
         input_unit.merge(matching_unit, authoritative=True)
     elif matchers:
         #do fuzzy matching
-        matching_unit = match_fuzzy(input_unit, matchers)
+        matching_unit = match_fuzzy(input_unit, matchers, fuzzymatches)
         if matching_unit and matching_unit.gettargetlen() > 0:
             #FIXME: should we dispatch here instead of this crude type check
             if isinstance(input_unit, xliff.xliffunit):
@@ -121,7 +181,7 @@ def prepare_template_pofile(template_store):
         if unit.isobsolete():
             unit.resurrect()
 
-def pretranslate_store(input_store, template_store, tm=None, min_similarity=75, fuzzymatching=True):
+def pretranslate_store(input_store, template_store, tm=None, min_similarity=75, fuzzymatching=True, jobs=1, tmsnapshot=None, useindex=False):
     """Do the actual pretranslation of a whole store."""
     #preperation
     matchers = []
@@ -136,7 +196,7 @@ def pretranslate_store(input_store, template_store, tm=None, min_similarity=75,
         if fuzzymatching:
             #create template matcher
             #FIXME: max_length hardcoded
-            matcher = match.matcher(template_store, max_candidates=1, min_similarity=min_similarity, max_length=3000, usefuzzy=True)
+            matcher = match.matcher(template_store, max_candidates=1, min_similarity=min_similarity, max_length=3000, usefuzzy=True, useindex=useindex)
             matcher.addpercentage = False
             matchers.append(matcher)
 
@@ -144,14 +204,18 @@ def pretranslate_store(input_store, template_store, tm=None, min_similarity=75,
     #create tm matcher
     if tm and fuzzymatching:
         #FIXME: max_length hardcoded
-        matcher = memory(tm, max_candidates=1, min_similarity=min_similarity, max_length=1000)
+        matcher = memory(tm, max_candidates=1, min_similarity=min_similarity, max_length=1000, tmsnapshot=tmsnapshot, useindex=useindex)
         matcher.addpercentage = False
         matchers.append(matcher)
 
+    fuzzymatches = None
+    if matchers and jobs > 1:
+        fuzzymatches = match_fuzzy_batch(input_store.units, template_store, matchers, jobs)
+
     #main loop
     for input_unit in input_store.units:
         if  input_unit.istranslatable():
-            input_unit = pretranslate_unit(input_unit, template_store, matchers)
+            input_unit = pretranslate_unit(input_unit, template_store, matchers, fuzzymatches=fuzzymatches)
 
     return input_store
 
@@ -167,6 +231,11 @@ def main(argv=None):
     parser.add_option("", "--tm", dest="tm", default=None,
         help="The file to use as translation memory when fuzzy matching")
     parser.passthrough.append("tm")
+    parser.add_option("", "--tmsnapshot", dest="tmsnapshot", default=None,
+        help="A file for keeping a snapshot of the translation memory, so that it loads faster next time")
+    parser.passthrough.append("tmsnapshot")
+    parser.add_option("", "--storecache", action="callback", callback=usecache_option,
+        help="Keep the parsed translation memory files in memory for reuse while they don't change")
     defaultsimilarity = 75
     parser.add_option("-s", "--similarity", dest="min_similarity", default=defaultsimilarity,
         type="float", help="The minimum similarity for inclusion (default: %d%%)" % defaultsimilarity)
@@ -174,6 +243,12 @@ def main(argv=None):
     parser.add_option("--nofuzzymatching", dest="fuzzymatching", action="store_false",
         default=True, help="Disable fuzzy matching")
     parser.passthrough.append("fuzzymatching")
+    parser.add_option("", "--qgramindex", dest="useindex", action="store_true",
+        default=False, help="Use an index to skip candidates that can't match when fuzzy matching (faster for big translation memories)")
+    parser.passthrough.append("useindex")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1,
+        type="int", help="The number of processes to use for fuzzy matching (default: 1)")
+    parser.passthrough.append("jobs")
     parser.run(argv)
 
 
@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import shutil
+
 from translate.storage import po
 from translate.storage import statsdb
+from translate.tools import pocount
 
 class TestPOCount:
     def count(self, source, expectedsource, target=None, expectedtarget=None):
@@ -80,3 +84,39 @@ class TestPOCount:
 
     # Need to test that we can differentiate between fuzzy, translated and untranslated
 
+
+
+class TestSummarizer:
+    def setup_method(self, method):
+        self.path = os.path.realpath("%s_%s" % (self.__class__.__name__, method.__name__))
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(os.path.join(self.path, "po", "af"))
+        for i in range(5):
+            open(os.path.join(self.path, "po", "af", "file%d.po" % i), "w").write(
+                'msgid "One two"\nmsgstr "Een twee"\n\n#, fuzzy\nmsgid "Three"\nmsgstr "Drie"\n\n' * (i + 1) +
+                'msgid "Four five six"\nmsgstr ""\n')
+        open(os.path.join(self.path, "po", "af", "broken.po"), "w").write('msgid "Unterminated\n')
+        self.defaultfile = statsdb.StatsCache.defaultfile
+
+    def teardown_method(self, method):
+        statsdb.StatsCache.defaultfile = self.defaultfile
+        shutil.rmtree(self.path)
+
+    def test_jobs(self):
+        """Test that counting in worker processes gives the same totals"""
+        totals = []
+        for jobs in (1, 3):
+            statsdb.StatsCache.defaultfile = os.path.join(self.path, "stats%d.db" % jobs)
+            totals.append(pocount.summarizer([os.path.join(self.path, "po")], pocount.style_csv, jobs=jobs).totals)
+        assert totals[0]["total"] == 2 * 15 + 5
+        assert totals[0] == totals[1]
+
+    def test_stream(self):
+        """Test that counting one unit at a time gives the same totals"""
+        statsdb.StatsCache.defaultfile = os.path.join(self.path, "stats.db")
+        cached = pocount.summarizer([os.path.join(self.path, "po")], pocount.style_csv).totals
+        streamed = pocount.summarizer([os.path.join(self.path, "po")], pocount.style_csv, stream=True).totals
+        assert streamed == cached
+        filename = os.path.join(self.path, "po", "af", "file2.po")
+        assert pocount.calcstats_stream(filename, batchsize=2) == pocount.calcstats(filename)
@@ -111,6 +111,47 @@ class TestPOGrep:
                     poresult = self.pogrep(source, search_letter)
                     assert poresult.index(source.encode('utf-8')) >= 0
 
+    def test_stream(self):
+        """check that grepping one unit at a time gives the same units"""
+        posource = '''msgid ""
+msgstr ""
+"Project-Id-Version: test\\n"
+"POT-Creation-Date: 2009-01-01 10:00+0200\\n"
+"PO-Revision-Date: 2009-01-02 10:00+0200\\n"
+"X-Custom: value\\n"
+"Content-Type: text/plain; charset=UTF-8\\n"
+
+#: test.c
+msgid "test"
+msgstr "rest"
+
+msgid "other"
+msgstr "ander"
+
+#: test.c
+msgid "tests"
+msgstr "toetse"
+'''
+        expected = self.pogrep(posource, "test", ["--search=msgid"])
+        results = []
+        for stream in (True, False):
+            inputfile = wStringIO.StringIO(posource)
+            inputfile.name = "test.po"
+            outputfile = wStringIO.StringIO()
+            grepfilter = pogrep.GrepFilter("test", ["msgid"])
+            assert pogrep.rungrep(inputfile, outputfile, None, grepfilter, stream=stream)
+            poresult = outputfile.getvalue()
+            results.append(poresult)
+            assert [unit.source for unit in self.poparse(poresult).units] == \
+                   [unit.source for unit in self.poparse(expected).units]
+            inputfile = wStringIO.StringIO(posource)
+            inputfile.name = "test.po"
+            assert not pogrep.rungrep(inputfile, wStringIO.StringIO(), None, pogrep.GrepFilter("nothing", ["msgid"]), stream=stream)
+        assert poresult.endswith('msgid "tests"\nmsgstr "toetse"\n')
+        # the header is built from the original one in the same way
+        assert results[0] == results[1]
+        assert "X-Custom: value" in results[0]
+
 class TestXLiffGrep:
     xliff_skeleton = '''<?xml version="1.0" ?>
 <xliff version="1.1" xmlns="urn:oasis:names:tc:xliff:document:1.1">
@@ -237,6 +237,27 @@ msgstr "36em"
         assert newpounit.isfuzzy()
         assert newpounit.hastypecomment("c-format")
 
+    def test_pretranslate_jobs(self):
+        """Test that fuzzy matching in several processes gives the same result"""
+        input_source = '''#: file.c:1\nmsgid "Open the file"\nmsgstr ""\n\n#: file.c:2\nmsgid "Close the files"\nmsgstr ""\n\n#: file.c:3\nmsgid "Something else"\nmsgstr ""\n'''
+        template_source = '''#: file.c:4\nmsgid "Open the files"\nmsgstr "Maak die leers oop"\n\n#: file.c:5\nmsgid "Close the file"\nmsgstr "Maak die leer toe"\n'''
+        serial = pretranslate.pretranslate_store(po.pofile(input_source), po.pofile(template_source))
+        parallel = pretranslate.pretranslate_store(po.pofile(input_source), po.pofile(template_source), jobs=2)
+        assert str(parallel) == str(serial)
+        assert parallel.units[0].target == "Maak die leers oop"
+        assert parallel.units[0].isfuzzy()
+        assert parallel.units[1].target == "Maak die leer toe"
+        assert not parallel.units[2].target
+
+    def test_pretranslate_useindex(self):
+        """Test that fuzzy matching with the q-gram index gives the same result"""
+        input_source = '''#: file.c:1\nmsgid "Open the file"\nmsgstr ""\n\n#: file.c:2\nmsgid "Close the files"\nmsgstr ""\n\n#: file.c:3\nmsgid "Something else"\nmsgstr ""\n'''
+        template_source = '''#: file.c:4\nmsgid "Open the files"\nmsgstr "Maak die leers oop"\n\n#: file.c:5\nmsgid "Close the file"\nmsgstr "Maak die leer toe"\n'''
+        plain = pretranslate.pretranslate_store(po.pofile(input_source), po.pofile(template_source))
+        indexed = pretranslate.pretranslate_store(po.pofile(input_source), po.pofile(template_source), useindex=True)
+        assert str(indexed) == str(plain)
+        assert indexed.units[0].target == "Maak die leers oop"
+
 class TestPretranslateCommand(test_convert.TestConvertCommand, TestPretranslate):
     """Tests running actual pretranslate commands on files"""
     convertmodule = pretranslate
@@ -245,7 +266,11 @@ class TestPretranslateCommand(test_convert.TestConvertCommand, TestPretranslate)
         """tests getting help"""
         options = test_convert.TestConvertCommand.test_help(self)
         options = self.help_check(options, "-t TEMPLATE, --template=TEMPLATE")
+        options = self.help_check(options, "--tmsnapshot=TMSNAPSHOT")
         options = self.help_check(options, "--tm")
+        options = self.help_check(options, "--storecache")
         options = self.help_check(options, "-s MIN_SIMILARITY, --similarity=MIN_SIMILARITY")
-        options = self.help_check(options, "--nofuzzymatching", last=True)
+        options = self.help_check(options, "--nofuzzymatching")
+        options = self.help_check(options, "--qgramindex")
+        options = self.help_check(options, "-j JOBS, --jobs=JOBS", last=True)
 